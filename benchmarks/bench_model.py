@@ -0,0 +1,294 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark zaza.model against a fake Juju API server.
+
+Each benchmark is run against synthetic models of increasing size served by
+benchmarks.fake_juju, and the results are written as JSON so runs from
+different commits can be compared:
+
+    python -m benchmarks.bench_model -o before.json
+    git checkout my-branch
+    python -m benchmarks.bench_model -o after.json
+    python -m benchmarks.bench_model --compare before.json after.json
+"""
+import argparse
+import collections
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import zaza
+import zaza.model
+
+from benchmarks import fake_juju
+
+SIZES = [10, 100, 1000]
+UNITS_PER_APPLICATION = 10
+REPEAT = 5
+# Seconds each response of the fake server is delayed by
+LATENCY = 0.001
+# Slow down in the median, as a fraction, reported as a regression
+THRESHOLD = 0.2
+
+BENCHMARKS = collections.OrderedDict()
+
+
+def benchmark(setup=None):
+    """Register a benchmark.
+
+    The benchmark is called with the model name and the names of all units
+    in the model.
+
+    :param setup: Function called with the same arguments before each run,
+                  and not timed
+    :type setup: Optional[Callable]
+    :returns: Decorator
+    :rtype: Callable
+    """
+    def _decorator(func):
+        BENCHMARKS[func.__name__] = (func, setup)
+        return func
+    return _decorator
+
+
+def _disconnect(model_name, unit_names):
+    zaza.model.disconnect_models()
+
+
+@benchmark(setup=_disconnect)
+def run_in_model_connect(model_name, unit_names):
+    """Connect to the model and sync its state."""
+    async def _connect():
+        async with zaza.model.run_in_model(model_name):
+            pass
+    zaza.run(_connect())
+
+
+@benchmark()
+def run_in_model(model_name, unit_names):
+    """Reuse the pooled connection to the model."""
+    async def _connect():
+        async with zaza.model.run_in_model(model_name):
+            pass
+    zaza.run(_connect())
+
+
+@benchmark()
+def sync_wrapper(model_name, unit_names):
+    """Run a coroutine that does nothing through sync_wrapper."""
+    async def _noop():
+        pass
+    zaza.sync_wrapper(_noop)()
+
+
+@benchmark()
+def get_status(model_name, unit_names):
+    """Fetch and parse the full status of the model."""
+    zaza.model.get_status(model_name=model_name)
+
+
+@benchmark()
+def get_unit_from_name(model_name, unit_names):
+    """Look up the last unit of the model."""
+    zaza.model.get_unit_from_name(unit_names[-1], model_name=model_name)
+
+
+@benchmark()
+def wait_for_application_states(model_name, unit_names):
+    """Wait for a model whose units are all ready."""
+    zaza.model.wait_for_application_states(model_name, timeout=60)
+
+
+@benchmark()
+def block_until_all_units_idle(model_name, unit_names):
+    """Wait for a model whose units are all idle."""
+    zaza.model.block_until_all_units_idle(model_name, timeout=60)
+
+
+@benchmark()
+def block_until_unit_wl_status(model_name, unit_names):
+    """Wait for the last unit of the model to be active."""
+    zaza.model.block_until_unit_wl_status(
+        unit_names[-1], 'active', model_name=model_name, timeout=60)
+
+
+def _git_commit():
+    """Return the commit being benchmarked.
+
+    :returns: Commit hash, None outside a git checkout
+    :rtype: Optional[str]
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=None, repeat=None, latency=None, names=None):
+    """Run the benchmarks against models of each size.
+
+    :param sizes: Numbers of units in the models
+    :type sizes: [int, int, ...]
+    :param repeat: Number of timed runs of each benchmark
+    :type repeat: int
+    :param latency: Seconds each response of the fake server is delayed by
+    :type latency: float
+    :param names: Names of benchmarks to run, all if unset
+    :type names: [str, str, ...]
+    :returns: Results with meta and results keys, results are keyed on
+              benchmark then size
+    :rtype: dict
+    """
+    sizes = sizes or SIZES
+    repeat = repeat or REPEAT
+    latency = LATENCY if latency is None else latency
+    names = names or list(BENCHMARKS.keys())
+    results = collections.OrderedDict((name, {}) for name in names)
+    for size in sizes:
+        applications = max(size // UNITS_PER_APPLICATION, 1)
+        model = fake_juju.synthetic_model(
+            applications, max(size // applications, 1))
+        unit_names = sorted(model['units'])
+        with fake_juju.FakeJujuServer(model, latency=latency) as server:
+            zaza.model.set_juju_model(server.model_name)
+            try:
+                for name in names:
+                    func, setup = BENCHMARKS[name]
+                    runs = []
+                    for _ in range(repeat):
+                        if setup:
+                            setup(server.model_name, unit_names)
+                        start = time.perf_counter()
+                        func(server.model_name, unit_names)
+                        runs.append(time.perf_counter() - start)
+                    results[name][str(size)] = {
+                        'min': min(runs),
+                        'median': statistics.median(runs),
+                        'mean': statistics.mean(runs),
+                        'runs': runs}
+                    logging.info('{} {} units: {:.4f}s'.format(
+                        name, size, statistics.median(runs)))
+            finally:
+                # The next model is served from another port
+                zaza.model.disconnect_models()
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'repeat': repeat,
+            'latency': latency,
+            'units_per_application': UNITS_PER_APPLICATION},
+        'results': results}
+
+
+def compare(old, new, threshold=None):
+    """Compare the median times of two sets of results.
+
+    :param old: Results to compare against
+    :type old: dict
+    :param new: Results to compare
+    :type new: dict
+    :param threshold: Slow down, as a fraction, reported as a regression
+    :type threshold: float
+    :returns: Report lines and the benchmarks that regressed
+    :rtype: ([str, ...], [str, ...])
+    """
+    threshold = THRESHOLD if threshold is None else threshold
+    lines = ['{:<30} {:>6} {:>10} {:>10} {:>8}'.format(
+        'benchmark', 'units', 'old', 'new', 'change')]
+    regressions = []
+    for name, sizes in new['results'].items():
+        for size, stats in sizes.items():
+            old_stats = old['results'].get(name, {}).get(size)
+            if not old_stats:
+                continue
+            change = stats['median'] / old_stats['median'] - 1
+            flag = ''
+            if change > threshold:
+                flag = ' REGRESSION'
+                regressions.append('{} {}'.format(name, size))
+            lines.append('{:<30} {:>6} {:>10.4f} {:>10.4f} {:>+7.0%}{}'.format(
+                name, size, old_stats['median'], stats['median'], change,
+                flag))
+    return lines, regressions
+
+
+def parse_args(args):
+    """Parse command line arguments.
+
+    :param args: List of command line arguments
+    :type args: [str1, str2,...]
+    :returns: Parsed arguments
+    :rtype: Namespace
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--sizes', nargs='+', type=int,
+                        help='Numbers of units in the models to benchmark')
+    parser.add_argument('-r', '--repeat', type=int,
+                        help='Number of timed runs of each benchmark')
+    parser.add_argument('-l', '--latency', type=float,
+                        help='Seconds each API response is delayed by')
+    parser.add_argument('-b', '--benchmark', dest='names', nargs='+',
+                        choices=list(BENCHMARKS.keys()),
+                        help='Benchmarks to run')
+    parser.add_argument('-o', '--output',
+                        help='File to write the results to as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='Compare two results files and exit non-zero '
+                             'on regressions')
+    parser.add_argument('--threshold', type=float,
+                        help='Slow down, as a fraction, reported as a '
+                             'regression')
+    parser.add_argument('--log', dest='loglevel',
+                        help='Loglevel [DEBUG|INFO|WARN|ERROR|CRITICAL]')
+    parser.set_defaults(loglevel='INFO')
+    return parser.parse_args(args)
+
+
+def main():
+    """Run the benchmarks or compare results."""
+    args = parse_args(sys.argv[1:])
+    logging.basicConfig(level=getattr(logging, args.loglevel.upper()))
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        lines, regressions = compare(old, new, threshold=args.threshold)
+        print('\n'.join(lines))
+        sys.exit(1 if regressions else 0)
+    results = run_benchmarks(
+        sizes=args.sizes,
+        repeat=args.repeat,
+        latency=args.latency,
+        names=args.names)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    for name, sizes in results['results'].items():
+        for size, stats in sizes.items():
+            print('{:<30} {:>6} {:>10.4f}'.format(
+                name, size, stats['median']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,442 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fake Juju API server replaying a synthetic model.
+
+The server speaks just enough of the Juju API websocket protocol for
+libjuju to log in, sync the model through the AllWatcher and fetch its
+status. Every response can be delayed to simulate the latency of a real
+controller.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import ssl
+import tempfile
+import threading
+import uuid
+
+import pkg_resources
+import websockets
+import yaml
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+import juju.client.connection
+
+CONTROLLER_NAME = 'fake'
+USER = 'admin'
+PASSWORD = 'fake-password'
+SERIES = 'bionic'
+
+
+def _juju_version():
+    """Return the Juju version matching the installed libjuju.
+
+    libjuju is released alongside the Juju version it supports, and refuses
+    to talk to controllers of other major versions.
+
+    :returns: Juju version
+    :rtype: str
+    """
+    version = pkg_resources.get_distribution('juju').version
+    return '.'.join(version.split('.')[:2] + ['0'])
+
+
+JUJU_VERSION = _juju_version()
+
+
+class UnknownRequest(Exception):
+    """The fake server does not implement a request."""
+
+    pass
+
+
+def _status(current, message=''):
+    return {
+        'current': current,
+        'message': message,
+        'since': '2019-01-01T00:00:00Z',
+        'version': ''}
+
+
+def synthetic_model(applications, units_per_application,
+                    workload_status='active',
+                    workload_status_message='Unit is ready',
+                    agent_status='idle'):
+    """Build a model with applications each having units on own machines.
+
+    :param applications: Number of applications
+    :type applications: int
+    :param units_per_application: Number of units of each application
+    :type units_per_application: int
+    :param workload_status: Workload status of every unit
+    :type workload_status: str
+    :param workload_status_message: Workload status message of every unit
+    :type workload_status_message: str
+    :param agent_status: Agent status of every unit
+    :type agent_status: str
+    :returns: Model with applications, units and machines, each keyed on
+              name
+    :rtype: dict
+    """
+    model = {'applications': {}, 'units': {}, 'machines': {}}
+    machine_id = 0
+    for i in range(applications):
+        app_name = 'app{}'.format(i)
+        model['applications'][app_name] = {
+            'name': app_name,
+            'charm-url': 'cs:{}-{}'.format(SERIES, app_name),
+            'life': 'alive',
+            'exposed': False,
+            'subordinate': False,
+            'status': _status(workload_status, workload_status_message)}
+        for j in range(units_per_application):
+            address = '10.{}.{}.{}'.format(
+                machine_id // 65536, machine_id // 256 % 256,
+                machine_id % 256)
+            model['machines'][str(machine_id)] = {
+                'id': str(machine_id),
+                'series': SERIES,
+                'life': 'alive',
+                'instance-id': 'i-{}'.format(machine_id),
+                'agent-status': _status('started'),
+                'instance-status': _status('running'),
+                'addresses': [{'value': address, 'type': 'ipv4',
+                               'scope': 'local-cloud'}]}
+            unit_name = '{}/{}'.format(app_name, j)
+            model['units'][unit_name] = {
+                'name': unit_name,
+                'application': app_name,
+                'series': SERIES,
+                'charm-url': 'cs:{}-{}'.format(SERIES, app_name),
+                'life': 'alive',
+                'machine-id': str(machine_id),
+                'public-address': address,
+                'private-address': address,
+                'subordinate': False,
+                'principal': '',
+                'workload-status': _status(
+                    workload_status, workload_status_message),
+                'agent-status': _status(agent_status)}
+            machine_id += 1
+    return model
+
+
+def _full_status(model, model_name, model_uuid):
+    """Return the Client.FullStatus response for model.
+
+    :param model: Model as returned by synthetic_model
+    :type model: dict
+    :param model_name: Name of model
+    :type model_name: str
+    :param model_uuid: UUID of model
+    :type model_uuid: str
+    :returns: FullStatus response
+    :rtype: dict
+    """
+    applications = {}
+    for app_name, app in model['applications'].items():
+        applications[app_name] = {
+            'charm': app['charm-url'],
+            'series': SERIES,
+            'exposed': False,
+            'life': '',
+            'status': {'status': app['status']['current'],
+                       'info': app['status']['message']},
+            'units': {}}
+    for unit_name, unit in model['units'].items():
+        applications[unit['application']]['units'][unit_name] = {
+            'machine': unit['machine-id'],
+            'public-address': unit['public-address'],
+            'workload-status': {
+                'status': unit['workload-status']['current'],
+                'info': unit['workload-status']['message']},
+            'agent-status': {'status': unit['agent-status']['current']}}
+    machines = {}
+    for machine_id, machine in model['machines'].items():
+        machines[machine_id] = {
+            'id': machine_id,
+            'series': machine['series'],
+            'instance-id': machine['instance-id'],
+            'dns-name': machine['addresses'][0]['value'],
+            'agent-status': {'status': 'started'},
+            'instance-status': {'status': 'running'}}
+    return {
+        'model': {'name': model_name, 'type': 'iaas',
+                  'cloud-tag': 'cloud-fake', 'version': JUJU_VERSION},
+        'applications': applications,
+        'machines': machines,
+        'relations': [],
+        'remote-applications': {},
+        'offers': {},
+        'controller-timestamp': '2019-01-01T00:00:00Z'}
+
+
+def _certificate():
+    """Create a self signed certificate for the server.
+
+    :returns: PEM encoded certificate and key
+    :rtype: (str, str)
+    """
+    key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'juju-fake')])
+    now = datetime.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None),
+                       critical=True)
+        .sign(key, hashes.SHA256(), default_backend()))
+    cert_pem = cert.public_bytes(serialization.Encoding.PEM).decode()
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption()).decode()
+    return cert_pem, key_pem
+
+
+class FakeJujuServer(object):
+    """Juju API server for a single model, running in a thread of its own.
+
+    Juju client data pointing at the server is written to a directory of
+    its own and JUJU_DATA is set to it while the server is running, so
+    libjuju and zaza connect to the fake model by name.
+    """
+
+    def __init__(self, model, model_name='bench', latency=0.0):
+        """Create a FakeJujuServer.
+
+        :param model: Model as returned by synthetic_model
+        :type model: dict
+        :param model_name: Name of the model
+        :type model_name: str
+        :param latency: Seconds to delay each response by
+        :type latency: float
+        """
+        self.model = model
+        self.model_name = model_name
+        self.model_uuid = str(uuid.uuid4())
+        self.controller_uuid = str(uuid.uuid4())
+        self.latency = latency
+        self.requests = 0
+        self.port = None
+        self._juju_data = None
+        self._previous_juju_data = None
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+
+    def start(self):
+        """Start the server and point JUJU_DATA at it."""
+        cert, key = _certificate()
+        self._juju_data = tempfile.TemporaryDirectory()
+        cert_file = os.path.join(self._juju_data.name, 'server.pem')
+        with open(cert_file, 'w') as f:
+            f.write(cert + key)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_file)
+        self._thread = threading.Thread(
+            target=self._run, args=(context,), daemon=True)
+        self._thread.start()
+        self._started.wait()
+        self._write_juju_data(cert)
+        self._previous_juju_data = os.environ.get('JUJU_DATA')
+        os.environ['JUJU_DATA'] = self._juju_data.name
+
+    def stop(self):
+        """Stop the server and restore JUJU_DATA."""
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._thread.join()
+        if self._previous_juju_data is None:
+            os.environ.pop('JUJU_DATA', None)
+        else:
+            os.environ['JUJU_DATA'] = self._previous_juju_data
+        self._juju_data.cleanup()
+
+    def __enter__(self):
+        """Start the server."""
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop the server."""
+        self.stop()
+        return False
+
+    def _write_juju_data(self, cert):
+        files = {
+            'controllers.yaml': {
+                'controllers': {
+                    CONTROLLER_NAME: {
+                        'uuid': self.controller_uuid,
+                        'api-endpoints': [
+                            '127.0.0.1:{}'.format(self.port)],
+                        'ca-cert': cert,
+                        'cloud': 'fake',
+                        'agent-version': JUJU_VERSION}},
+                'current-controller': CONTROLLER_NAME},
+            'models.yaml': {
+                'controllers': {
+                    CONTROLLER_NAME: {
+                        'models': {
+                            '{}/{}'.format(USER, self.model_name): {
+                                'uuid': self.model_uuid,
+                                'type': 'iaas'}},
+                        'current-model': '{}/{}'.format(
+                            USER, self.model_name)}}},
+            'accounts.yaml': {
+                'controllers': {
+                    CONTROLLER_NAME: {
+                        'user': USER,
+                        'password': PASSWORD}}}}
+        for filename, data in files.items():
+            with open(os.path.join(self._juju_data.name, filename), 'w') as f:
+                yaml.safe_dump(data, f)
+        os.makedirs(os.path.join(self._juju_data.name, 'cookies'))
+        with open(os.path.join(self._juju_data.name, 'cookies',
+                               '{}.json'.format(CONTROLLER_NAME)), 'w') as f:
+            f.write('[]')
+
+    def _run(self, context):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(websockets.serve(
+            self._handler, '127.0.0.1', 0, ssl=context, loop=self._loop,
+            max_size=None))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.close()
+
+    async def _handler(self, websocket, path):
+        watchers = {}
+        try:
+            async for message in websocket:
+                request = json.loads(message)
+                # Requests are answered concurrently, as a controller does,
+                # so a pending AllWatcher.Next does not block other calls
+                self._loop.create_task(
+                    self._respond(websocket, request, watchers))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for watcher in watchers.values():
+                watcher.set()
+
+    async def _respond(self, websocket, request, watchers):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        reply = {'request-id': request['request-id']}
+        try:
+            reply['response'] = await self._call(request, watchers)
+        except UnknownRequest as e:
+            logging.warning(str(e))
+            reply['error'] = str(e)
+            reply['error-code'] = 'not implemented'
+        try:
+            await websocket.send(json.dumps(reply))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _call(self, request, watchers):
+        call = (request['type'], request['request'])
+        if call == ('Admin', 'Login'):
+            return self._login()
+        if call == ('Pinger', 'Ping'):
+            return {}
+        if call == ('ModelConfig', 'ModelGet'):
+            return {'config': {}}
+        if call == ('Client', 'ModelInfo'):
+            return {
+                'name': self.model_name,
+                'uuid': self.model_uuid,
+                'type': 'iaas',
+                'controller-uuid': self.controller_uuid,
+                'owner-tag': 'user-{}'.format(USER),
+                'life': 'alive',
+                'default-series': SERIES,
+                'agent-version': JUJU_VERSION,
+                'provider-type': 'fake',
+                'cloud-tag': 'cloud-fake',
+                'status': {'status': 'available'},
+                'users': [],
+                'machines': []}
+        if call == ('Client', 'WatchAll'):
+            watcher_id = str(len(watchers) + 1)
+            watchers[watcher_id] = None
+            return {'watcher-id': watcher_id}
+        if call == ('AllWatcher', 'Next'):
+            return await self._next(request, watchers)
+        if call == ('AllWatcher', 'Stop'):
+            stopped = watchers.get(request.get('Id'))
+            if stopped:
+                stopped.set()
+            return {}
+        if call == ('Client', 'FullStatus'):
+            return _full_status(self.model, self.model_name, self.model_uuid)
+        raise UnknownRequest('Fake Juju does not implement {}.{}'.format(
+            *call))
+
+    async def _next(self, request, watchers):
+        """Send the whole model, then block until the watcher is stopped."""
+        watcher_id = request.get('Id')
+        if watchers.get(watcher_id) is None:
+            watchers[watcher_id] = asyncio.Event()
+            deltas = []
+            for kind, entities in (('machine', self.model['machines']),
+                                   ('application',
+                                    self.model['applications']),
+                                   ('unit', self.model['units'])):
+                for entity in entities.values():
+                    data = dict(entity)
+                    data['model-uuid'] = self.model_uuid
+                    deltas.append([kind, 'change', data])
+            return {'deltas': deltas}
+        await watchers[watcher_id].wait()
+        return {'deltas': []}
+
+    def _login(self):
+        facades = [
+            {'name': name, 'versions': info['versions']}
+            for name, info in juju.client.connection.client_facades.items()]
+        return {
+            'facades': facades,
+            'server-version': JUJU_VERSION,
+            'model-tag': 'model-{}'.format(self.model_uuid),
+            'controller-tag': 'controller-{}'.format(self.controller_uuid),
+            'user-info': {
+                'identity': 'user-{}'.format(USER),
+                'display-name': USER,
+                'model-access': 'admin',
+                'controller-access': 'superuser'},
+            'servers': [[{
+                'value': '127.0.0.1',
+                'port': self.port,
+                'type': 'ipv4',
+                'scope': 'local-machine'}]]}
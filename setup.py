@@ -100,13 +100,14 @@ setup(
             'functest-destroy = zaza.charm_lifecycle.destroy:main',
             'functest-prepare = zaza.charm_lifecycle.prepare:main',
             'functest-test = zaza.charm_lifecycle.test:main',
+            'functest-report = zaza.charm_lifecycle.report:main',
             'current-apps = zaza.model:main',
             'tempest-config = zaza.tempest_config:main',
             'remove-placement = zaza.utilities.bundle:main',
         ]
     },
     license='Apache-2.0: http://www.apache.org/licenses/LICENSE-2.0',
-    packages=find_packages(exclude=["unit_tests"]),
+    packages=find_packages(exclude=["unit_tests", "benchmarks"]),
     zip_safe=False,
     cmdclass={'test': Tox},
     install_requires=install_require,
@@ -0,0 +1,71 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import benchmarks.bench_model as bench_model
+import unit_tests.utils as ut_utils
+import zaza.model
+
+
+def _results(medians):
+    return {'results': {
+        name: {size: {'median': median} for size, median in sizes.items()}
+        for name, sizes in medians.items()}}
+
+
+class TestBenchModel(ut_utils.BaseTestCase):
+
+    def test_compare(self):
+        old = _results({
+            'get_status': {'10': 1.0, '100': 2.0},
+            'run_in_model': {'10': 1.0}})
+        new = _results({
+            'get_status': {'10': 1.1, '100': 3.0, '1000': 5.0},
+            'run_in_model': {'10': 0.5},
+            'sync_wrapper': {'10': 1.0}})
+        lines, regressions = bench_model.compare(old, new)
+        self.assertEqual(regressions, ['get_status 100'])
+        # Sizes and benchmarks missing from the old results are skipped
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[2].endswith('REGRESSION'))
+        self.assertFalse(lines[1].endswith('REGRESSION'))
+        self.assertIn('-50%', lines[3])
+
+    def test_compare_threshold(self):
+        old = _results({'get_status': {'10': 1.0}})
+        new = _results({'get_status': {'10': 1.1}})
+        self.assertEqual(
+            bench_model.compare(old, new, threshold=0.05)[1],
+            ['get_status 10'])
+        self.assertEqual(bench_model.compare(old, new)[1], [])
+
+    def test_run_benchmarks(self):
+        previous_model = os.environ.get('JUJU_MODEL')
+
+        def _restore_model():
+            zaza.model.CURRENT_MODEL = None
+            if previous_model is None:
+                os.environ.pop('JUJU_MODEL', None)
+            else:
+                os.environ['JUJU_MODEL'] = previous_model
+        self.addCleanup(_restore_model)
+        results = bench_model.run_benchmarks(
+            sizes=[2], repeat=2, latency=0, names=['get_status'])
+        self.assertEqual(list(results['results'].keys()), ['get_status'])
+        stats = results['results']['get_status']['2']
+        self.assertEqual(len(stats['runs']), 2)
+        self.assertEqual(stats['min'], min(stats['runs']))
+        self.assertEqual(results['meta']['repeat'], 2)
+        self.assertEqual(results['meta']['latency'], 0)
@@ -0,0 +1,43 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pkg_resources
+
+import benchmarks.fake_juju as fake_juju
+import unit_tests.utils as ut_utils
+
+
+class TestFakeJuju(ut_utils.BaseTestCase):
+
+    def test_synthetic_model(self):
+        model = fake_juju.synthetic_model(
+            2, 3, workload_status='blocked', agent_status='executing')
+        self.assertEqual(sorted(model['applications']), ['app0', 'app1'])
+        self.assertEqual(len(model['units']), 6)
+        self.assertEqual(len(model['machines']), 6)
+        unit = model['units']['app1/2']
+        self.assertEqual(unit['application'], 'app1')
+        self.assertEqual(unit['workload-status']['current'], 'blocked')
+        self.assertEqual(unit['agent-status']['current'], 'executing')
+        # Each unit is on a machine of its own
+        machine = model['machines'][unit['machine-id']]
+        self.assertEqual(machine['addresses'][0]['value'],
+                         unit['public-address'])
+        self.assertEqual(
+            len(set(u['machine-id'] for u in model['units'].values())), 6)
+
+    def test_juju_version(self):
+        version = pkg_resources.get_distribution('juju').version
+        self.assertEqual(
+            fake_juju.JUJU_VERSION.split('.')[:2], version.split('.')[:2])
@@ -0,0 +1,88 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import concurrent.futures
+import threading
+
+import zaza
+import unit_tests.utils as ut_utils
+
+
+async def _thread_name():
+    return threading.current_thread().name
+
+
+class TestZaza(ut_utils.BaseTestCase):
+
+    def test_run(self):
+        self.assertIsNone(zaza.run())
+        self.assertEqual(zaza.run(_thread_name()), 'zaza-event-loop')
+
+    def test_run_raises(self):
+        async def _fail():
+            raise ValueError('boom')
+        with self.assertRaises(ValueError):
+            zaza.run(_fail())
+
+    def test_sync_wrapper(self):
+        async def _add(a, b=0):
+            return a + b
+        self.assertEqual(zaza.sync_wrapper(_add)(1, b=2), 3)
+
+    def test_sync_wrapper_from_threads(self):
+        async def _loop():
+            return asyncio.get_event_loop()
+        get_loop = zaza.sync_wrapper(_loop)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+            loops = list(pool.map(lambda _: get_loop(), range(8)))
+        self.assertEqual(set(loops), {zaza.get_run_loop()})
+
+    def test_sync_wrapper_from_running_loop(self):
+        thread_name = zaza.sync_wrapper(_thread_name)
+
+        async def _caller():
+            return thread_name()
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(
+                loop.run_until_complete(_caller()),
+                'zaza-event-loop')
+        finally:
+            loop.close()
+
+    def test_sync_wrapper_from_zaza_loop(self):
+        thread_name = zaza.sync_wrapper(_thread_name)
+
+        async def _caller():
+            return thread_name()
+        with self.assertRaises(RuntimeError):
+            zaza.run(_caller())
+
+    def test_stop_run_loop(self):
+        loop = zaza.get_run_loop()
+        zaza.stop_run_loop()
+        self.assertTrue(loop.is_closed())
+        self.assertIsNone(zaza.RUN_LOOP)
+        self.assertEqual(zaza.run(_thread_name()), 'zaza-event-loop')
+        self.assertIsNot(zaza.get_run_loop(), loop)
+
+    def test_run_subprocess(self):
+        async def _exec():
+            proc = await asyncio.create_subprocess_exec(
+                'sh', '-c', 'echo hello; exit 3',
+                stdout=asyncio.subprocess.PIPE)
+            stdout, _ = await proc.communicate()
+            return stdout, proc.returncode
+        self.assertEqual(zaza.run(_exec()), (b'hello\n', 3))
@@ -14,6 +14,9 @@
 
 import jinja2
 import mock
+import os
+import tempfile
+import yaml
 
 import zaza.charm_lifecycle.deploy as lc_deploy
 import unit_tests.utils as ut_utils
@@ -249,6 +252,136 @@ class TestCharmLifecycleDeploy(ut_utils.BaseTestCase):
         self.deploy_bundle.assert_called_once_with('bun.yaml', 'newmodel')
         self.assertFalse(self.wait_for_application_states.called)
 
+    def test_get_rendered_bundle(self):
+        self.patch_object(lc_deploy, 'render_overlays')
+        overlay = {'applications': {'mycharm': {'charm': '../../../mycharm'}}}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bundle_file = os.path.join(tmpdir, 'bun.yaml')
+            overlay_file = os.path.join(tmpdir, 'overlay.yaml')
+            with open(bundle_file, 'w') as f:
+                yaml.safe_dump({'applications': {
+                    'mycharm': {'charm': 'cs:mycharm', 'num_units': 1},
+                    'mysql': {'charm': 'cs:mysql', 'num_units': 1}}}, f)
+            with open(overlay_file, 'w') as f:
+                yaml.safe_dump(overlay, f)
+            self.render_overlays.return_value = [overlay_file]
+            target = lc_deploy.get_rendered_bundle(bundle_file)
+        self.assertEqual(
+            target['applications']['mycharm'],
+            {'charm': os.path.normpath(
+                os.path.join(tmpdir, '../../../mycharm')),
+             'num_units': 1})
+        self.assertEqual(target['applications']['mysql']['charm'],
+                         'cs:mysql')
+
+    def test_deploy_bundle_incremental(self):
+        self.patch_object(lc_deploy.zaza.model, 'export_bundle')
+        self.patch_object(lc_deploy.zaza.model, 'remove_relation')
+        self.patch_object(lc_deploy.zaza.model, 'remove_application')
+        self.patch_object(lc_deploy.zaza.model, 'set_application_config')
+        self.patch_object(lc_deploy.zaza.model, 'get_application_config')
+        self.patch_object(lc_deploy.zaza.model, 'add_unit')
+        self.patch_object(lc_deploy.zaza.model, 'destroy_unit')
+        self.patch_object(lc_deploy.zaza.model, 'add_relation')
+        self.patch_object(lc_deploy.zaza.model, 'get_units')
+        self.patch_object(lc_deploy, 'get_rendered_bundle')
+        self.patch_object(lc_deploy, '_deploy_applications')
+        self.export_bundle.return_value = {
+            'applications': {
+                'app': {'num_units': 3},
+                'keep': {'num_units': 1},
+                'old': {'num_units': 1}},
+            'relations': [['app:db', 'old:db'], ['app:admin', 'keep:admin']]}
+        self.get_rendered_bundle.return_value = {
+            'applications': {
+                'app': {'num_units': 2, 'options': {'debug': True}},
+                'keep': {'num_units': 1,
+                         'options': {'vip': '10.0.0.1', 'debug': False,
+                                     'worker-multiplier': 1}},
+                'new': {'num_units': 1}},
+            'relations': [['app', 'new']]}
+        units = []
+        for unit_name in ['app/10', 'app/2', 'app/9']:
+            unit = mock.MagicMock()
+            unit.entity_id = unit_name
+            units.append(unit)
+        self.get_units.return_value = units
+        self.get_application_config.side_effect = lambda name, model_name: {
+            'app': {'debug': {'default': False, 'value': False}},
+            'keep': {'debug': {'default': False, 'value': False},
+                     'vip': {'value': '10.0.0.1'},
+                     'worker-multiplier': {'type': 'float',
+                                           'value': 1.0}}}[name]
+        self.assertEqual(
+            lc_deploy.deploy_bundle_incremental('bun.yaml', 'newmodel'),
+            ['app', 'keep', 'new'])
+        # Relations of removed applications go with the application
+        self.remove_relation.assert_called_once_with(
+            'app:admin', 'keep:admin', model_name='newmodel')
+        self.remove_application.assert_called_once_with(
+            'old', model_name='newmodel')
+        self._deploy_applications.assert_called_once_with(
+            self.get_rendered_bundle.return_value, ['new'], 'newmodel')
+        self.set_application_config.assert_called_once_with(
+            'app', {'debug': 'true'}, model_name='newmodel')
+        self.get_application_config.assert_has_calls([
+            mock.call('app', model_name='newmodel'),
+            mock.call('keep', model_name='newmodel')], any_order=True)
+        self.assertFalse(self.add_unit.called)
+        self.destroy_unit.assert_called_once_with(
+            'app', 'app/10', model_name='newmodel')
+        self.add_relation.assert_called_once_with(
+            'app', 'new', model_name='newmodel')
+
+    def test_deploy_bundle_incremental_empty_model(self):
+        self.patch_object(lc_deploy.zaza.model, 'export_bundle')
+        self.patch_object(lc_deploy, 'deploy_bundle')
+        self.export_bundle.return_value = {'applications': {}}
+        self.assertIsNone(
+            lc_deploy.deploy_bundle_incremental('bun.yaml', 'newmodel'))
+        self.deploy_bundle.assert_called_once_with('bun.yaml', 'newmodel')
+
+    def test_deploy_applications(self):
+        self.patch_object(lc_deploy.subprocess, 'check_call')
+        target = {
+            'series': 'bionic',
+            'machines': {'0': {}},
+            'applications': {
+                'app': {'charm': 'cs:app', 'num_units': 1, 'to': ['0']},
+                'other': {'charm': 'cs:other', 'num_units': 1}},
+            'relations': [['app', 'other']]}
+
+        def _check_call(cmd):
+            with open(cmd[-1]) as f:
+                self.assertEqual(yaml.safe_load(f), {
+                    'series': 'bionic',
+                    'applications': {
+                        'app': {'charm': 'cs:app', 'num_units': 1}}})
+        self.check_call.side_effect = _check_call
+        lc_deploy._deploy_applications(target, ['app'], 'newmodel')
+        self.assertEqual(
+            self.check_call.call_args[0][0][:4],
+            ['juju', 'deploy', '-m', 'newmodel'])
+
+    def test_deploy_incremental(self):
+        self.patch_object(lc_deploy.zaza.model, 'wait_for_application_states')
+        self.patch_object(lc_deploy.utils, 'get_charm_config')
+        self.get_charm_config.return_value = {}
+        self.patch_object(lc_deploy, 'deploy_bundle_incremental')
+        self.deploy_bundle_incremental.return_value = ['app']
+        lc_deploy.deploy('bun.yaml', 'newmodel', incremental=True)
+        self.deploy_bundle_incremental.assert_called_once_with(
+            'bun.yaml', 'newmodel')
+        self.wait_for_application_states.assert_called_once_with(
+            'newmodel', {}, applications=['app'])
+
+    def test_deploy_incremental_no_changes(self):
+        self.patch_object(lc_deploy.zaza.model, 'wait_for_application_states')
+        self.patch_object(lc_deploy, 'deploy_bundle_incremental')
+        self.deploy_bundle_incremental.return_value = []
+        lc_deploy.deploy('bun.yaml', 'newmodel', incremental=True)
+        self.assertFalse(self.wait_for_application_states.called)
+
     def test_parser(self):
         args = lc_deploy.parse_args([
             '-m', 'mymodel',
@@ -19,10 +19,21 @@ import unit_tests.utils as ut_utils
 class TestCharmLifecycleDestroy(ut_utils.BaseTestCase):
 
     def test_destroy(self):
+        self.patch_object(lc_destroy.zaza.model, 'disconnect_model')
         self.patch_object(lc_destroy.zaza.controller, 'destroy_model')
         lc_destroy.destroy('doomed')
+        self.disconnect_model.assert_called_once_with('doomed')
         self.destroy_model.assert_called_once_with('doomed')
 
+    def test_destroy_background(self):
+        self.patch_object(lc_destroy.zaza.model, 'disconnect_model')
+        self.patch_object(lc_destroy.zaza.controller, 'destroy_model')
+        self.patch_object(lc_destroy.reaper, 'reap')
+        lc_destroy.destroy('doomed', background=True)
+        self.disconnect_model.assert_called_once_with('doomed')
+        self.reap.assert_called_once_with('doomed')
+        self.assertFalse(self.destroy_model.called)
+
     def test_parser(self):
         args = lc_destroy.parse_args(['-m', 'doomed'])
         self.assertEqual(args.model_name, 'doomed')
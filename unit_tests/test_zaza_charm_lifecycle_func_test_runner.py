@@ -13,6 +13,9 @@
 # limitations under the License.
 
 import mock
+import os
+import subprocess
+import tempfile
 
 import zaza.charm_lifecycle.func_test_runner as lc_func_test_runner
 import unit_tests.utils as ut_utils
@@ -38,6 +41,28 @@ class TestCharmLifecycleFuncTestRunner(ut_utils.BaseTestCase):
         self.assertEqual(args.bundle, 'mybundle')
         args = lc_func_test_runner.parse_args(['--log', 'DEBUG'])
         self.assertEqual(args.loglevel, 'DEBUG')
+        self.assertEqual(args.parallel, 1)
+        self.assertEqual(args.log_dir, 'func-test-logs')
+        args = lc_func_test_runner.parse_args(
+            ['--parallel', '3', '--log-dir', '/tmp/logs'])
+        self.assertEqual(args.parallel, 3)
+        self.assertEqual(args.log_dir, '/tmp/logs')
+        args = lc_func_test_runner.parse_args(
+            ['--model-pool', '2', '--max-teardowns', '3'])
+        self.assertEqual(args.pool_size, 2)
+        self.assertEqual(args.max_teardowns, 3)
+        self.assertFalse(args.background_destroy)
+        args = lc_func_test_runner.parse_args(['--background-destroy'])
+        self.assertTrue(args.background_destroy)
+        self.assertIsNone(args.model_name)
+        args = lc_func_test_runner.parse_args(['-m', 'kept'])
+        self.assertEqual(args.model_name, 'kept')
+        self.assertIsNone(args.span_file)
+        args = lc_func_test_runner.parse_args(['--span-file', 'spans.json'])
+        self.assertEqual(args.span_file, 'spans.json')
+        self.assertIsNone(args.trace)
+        args = lc_func_test_runner.parse_args(['--trace', 'trace.json'])
+        self.assertEqual(args.trace, 'trace.json')
 
     def test_func_test_runner(self):
         self.patch_object(lc_func_test_runner.utils, 'get_charm_config')
@@ -76,10 +101,12 @@ class TestCharmLifecycleFuncTestRunner(ut_utils.BaseTestCase):
         test_calls = [
             mock.call('newmodel', [
                 'zaza.charm_tests.mycharm.tests.SmokeTest',
-                'zaza.charm_tests.mycharm.tests.ComplexTest']),
+                'zaza.charm_tests.mycharm.tests.ComplexTest'],
+                parallel_safe_tests=None),
             mock.call('newmodel', [
                 'zaza.charm_tests.mycharm.tests.SmokeTest',
-                'zaza.charm_tests.mycharm.tests.ComplexTest'])]
+                'zaza.charm_tests.mycharm.tests.ComplexTest'],
+                parallel_safe_tests=None)]
         destroy_calls = [
             mock.call('newmodel'),
             mock.call('newmodel')]
@@ -165,25 +192,277 @@ class TestCharmLifecycleFuncTestRunner(ut_utils.BaseTestCase):
             mock.call('./tests/bundles/maveric-filebeat.yaml', 'newmodel')]
         self.deploy.assert_has_calls(deploy_calls)
 
+    def test_func_test_runner_parallel(self):
+        self.patch_object(lc_func_test_runner.utils, 'get_charm_config')
+        self.patch_object(lc_func_test_runner, 'run_bundles_parallel')
+        self.patch_object(lc_func_test_runner, 'run_bundle')
+        self.patch_object(lc_func_test_runner.reaper, 'wait')
+        test_config = {
+            'gate_bundles': ['bundle1', 'bundle2'],
+            'tests': ['zaza.charm_tests.mycharm.tests.SmokeTest']}
+        self.get_charm_config.return_value = test_config
+        lc_func_test_runner.func_test_runner(
+            keep_model=True, parallel=2, log_dir='logs')
+        self.run_bundles_parallel.assert_called_once_with(
+            ['bundle1', 'bundle2'], test_config, keep_model=True,
+            parallel=2, log_dir='logs', background_destroy=False)
+        self.assertFalse(self.run_bundle.called)
+        self.wait.assert_called_once_with()
+
+    def test_func_test_runner_background_destroy(self):
+        self.patch_object(lc_func_test_runner.utils, 'get_charm_config')
+        self.patch_object(lc_func_test_runner.utils, 'generate_model_name')
+        self.patch_object(lc_func_test_runner.prepare, 'prepare')
+        self.patch_object(lc_func_test_runner.deploy, 'deploy')
+        self.patch_object(lc_func_test_runner.test, 'test')
+        self.patch_object(lc_func_test_runner.destroy, 'destroy')
+        self.patch_object(lc_func_test_runner.reaper, 'wait')
+        self.generate_model_name.return_value = 'newmodel'
+        self.get_charm_config.return_value = {
+            'gate_bundles': ['bundle1', 'bundle2'],
+            'tests': ['zaza.charm_tests.mycharm.tests.SmokeTest']}
+        lc_func_test_runner.func_test_runner(background_destroy=True)
+        self.destroy.assert_has_calls([
+            mock.call('newmodel', background=True),
+            mock.call('newmodel', background=True)])
+        self.wait.assert_called_once_with()
+
+    def test_func_test_runner_model_name(self):
+        self.patch_object(lc_func_test_runner.utils, 'get_charm_config')
+        self.patch_object(lc_func_test_runner.prepare, 'prepare')
+        self.patch_object(lc_func_test_runner.deploy, 'deploy')
+        self.patch_object(lc_func_test_runner.test, 'test')
+        self.patch_object(lc_func_test_runner.destroy, 'destroy')
+        self.get_charm_config.return_value = {
+            'gate_bundles': ['bundle1', 'bundle2'],
+            'dev_bundles': ['bundle3'],
+            'tests': ['zaza.charm_tests.mycharm.tests.SmokeTest']}
+        lc_func_test_runner.func_test_runner(dev=True, model_name='kept')
+        self.deploy.assert_called_once_with(
+            './tests/bundles/bundle3.yaml', 'kept', incremental=True)
+        self.test.assert_called_once_with(
+            'kept', ['zaza.charm_tests.mycharm.tests.SmokeTest'],
+            parallel_safe_tests=None)
+        self.assertFalse(self.prepare.called)
+        self.assertFalse(self.destroy.called)
+        with self.assertRaises(ValueError):
+            lc_func_test_runner.func_test_runner(model_name='kept')
+
+    def test_func_test_runner_model_pool_parallel(self):
+        self.patch_object(lc_func_test_runner.utils, 'get_charm_config')
+        self.get_charm_config.return_value = {
+            'gate_bundles': ['bundle1', 'bundle2']}
+        with self.assertRaises(ValueError):
+            lc_func_test_runner.func_test_runner(pool_size=1, parallel=2)
+
+    def test_func_test_runner_model_pool(self):
+        self.patch_object(lc_func_test_runner.utils, 'get_charm_config')
+        pool = mock.MagicMock()
+        self.patch_object(lc_func_test_runner.model_pool, 'ModelPool',
+                          return_value=pool)
+        self.patch_object(lc_func_test_runner.prepare, 'prepare')
+        self.patch_object(lc_func_test_runner.deploy, 'deploy')
+        self.patch_object(lc_func_test_runner.test, 'test')
+        self.patch_object(lc_func_test_runner.destroy, 'destroy')
+        pool.lease.side_effect = ['model1', 'model2']
+        self.get_charm_config.return_value = {
+            'gate_bundles': ['bundle1', 'bundle2'],
+            'tests': ['zaza.charm_tests.mycharm.tests.SmokeTest']}
+        lc_func_test_runner.func_test_runner(keep_model=True, pool_size=1)
+        self.ModelPool.assert_called_once_with(
+            size=1, max_teardowns=2, limit=2)
+        self.deploy.assert_has_calls([
+            mock.call('./tests/bundles/bundle1.yaml', 'model1'),
+            mock.call('./tests/bundles/bundle2.yaml', 'model2')])
+        # The model of the last run is kept
+        pool.release.assert_called_once_with('model1')
+        pool.close.assert_called_once_with()
+        self.assertFalse(self.prepare.called)
+        self.assertFalse(self.destroy.called)
+
+    def test_run_bundles_parallel(self):
+        self.patch_object(lc_func_test_runner, 'multiprocessing')
+        self.patch_object(lc_func_test_runner, 'write_summary')
+        pool = mock.MagicMock()
+        context = self.multiprocessing.get_context.return_value
+        context.Pool.return_value.__enter__.return_value = pool
+
+        def _apply_async(func, args, callback):
+            result = mock.MagicMock()
+            result.get.return_value = {
+                'bundle': args[0], 'status': 'PASS', 'duration': 1,
+                'log_file': args[3]}
+            return result
+        pool.apply_async.side_effect = _apply_async
+        with tempfile.TemporaryDirectory() as tmpdir:
+            summaries = lc_func_test_runner.run_bundles_parallel(
+                ['bundle1', 'bundle2'], {'tests': []}, keep_model=True,
+                parallel=2, log_dir=tmpdir)
+            summary_file = os.path.join(tmpdir, 'summary.log')
+        self.multiprocessing.get_context.assert_called_once_with('spawn')
+        context.Pool.assert_called_once_with(processes=2, maxtasksperchild=1)
+        self.assertEqual(
+            [s['bundle'] for s in summaries], ['bundle1', 'bundle2'])
+        # Only the model of the last bundle is kept
+        self.assertEqual(
+            [c[0][1][2] for c in pool.apply_async.call_args_list],
+            [False, True])
+        self.assertEqual(
+            [c[0][1][3] for c in pool.apply_async.call_args_list],
+            [os.path.join(tmpdir, '0-bundle1.log'),
+             os.path.join(tmpdir, '1-bundle2.log')])
+        # Models left behind are destroyed from this process
+        self.assertEqual(
+            [c[1]['callback'] for c in pool.apply_async.call_args_list],
+            [lc_func_test_runner._reap_bundle_model] * 2)
+        self.write_summary.assert_called_once_with(summaries, summary_file)
+
+    def test_run_bundles_parallel_fail(self):
+        self.patch_object(lc_func_test_runner, 'multiprocessing')
+        self.patch_object(lc_func_test_runner, 'write_summary')
+        pool = mock.MagicMock()
+        context = self.multiprocessing.get_context.return_value
+        context.Pool.return_value.__enter__.return_value = pool
+
+        def _apply_async(func, args, callback):
+            result = mock.MagicMock()
+            result.get.return_value = {
+                'bundle': args[0],
+                'status': 'FAIL' if args[0] == 'bundle2' else 'PASS',
+                'duration': 1,
+                'log_file': args[3]}
+            return result
+        pool.apply_async.side_effect = _apply_async
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.assertRaises(
+                    lc_func_test_runner.BundleRunFailed) as context:
+                lc_func_test_runner.run_bundles_parallel(
+                    ['bundle1', 'bundle2'], {'tests': []}, log_dir=tmpdir)
+        self.assertEqual(context.exception.bundles, ['bundle2'])
+
+    def test_run_bundle_process(self):
+        self.patch_object(lc_func_test_runner, 'run_bundle')
+        self.patch_object(lc_func_test_runner.zaza.model, 'disconnect_models')
+        self.patch_object(lc_func_test_runner.reaper, 'wait')
+        self.patch_object(lc_func_test_runner.logging, 'basicConfig')
+
+        def _run_bundle(*args, **kwargs):
+            # Output of subprocesses goes to the log as well
+            subprocess.check_call(['echo', 'juju says hello'])
+            return 'newmodel'
+        self.run_bundle.side_effect = _run_bundle
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log_file = os.path.join(tmpdir, 'bundle1.log')
+            summary = lc_func_test_runner._run_bundle_process(
+                'bundle1', {'tests': []}, False, log_file, 20,
+                background_destroy=True)
+            self.assertEqual(summary['status'], 'PASS')
+            # The model is left for the parent to destroy
+            self.assertEqual(summary['reap'], 'newmodel')
+            self.run_bundle.assert_called_once_with(
+                'bundle1', {'tests': []}, keep_model=True)
+            self.run_bundle.side_effect = Exception('deploy failed')
+            summary = lc_func_test_runner._run_bundle_process(
+                'bundle1', {'tests': []}, False, log_file, 20)
+            self.assertEqual(summary['status'], 'FAIL')
+            with open(log_file) as f:
+                self.assertIn('deploy failed', f.read())
+            self.run_bundle.side_effect = _run_bundle
+            summary = lc_func_test_runner._run_bundle_process(
+                'bundle1', {'tests': []}, False, log_file, 20)
+            with open(log_file) as f:
+                self.assertIn('juju says hello', f.read())
+        self.run_bundle.assert_called_with(
+            'bundle1', {'tests': []}, keep_model=False)
+        self.assertNotIn('reap', summary)
+        self.assertEqual(self.disconnect_models.call_count, 3)
+        self.assertFalse(self.wait.called)
+
+    def test_reap_bundle_model(self):
+        self.patch_object(lc_func_test_runner.reaper, 'reap')
+        lc_func_test_runner._reap_bundle_model(
+            {'bundle': 'bundle1', 'status': 'PASS'})
+        self.assertFalse(self.reap.called)
+        lc_func_test_runner._reap_bundle_model(
+            {'bundle': 'bundle1', 'status': 'PASS', 'reap': 'newmodel'})
+        self.reap.assert_called_once_with('newmodel')
+
+    def test_write_summary(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            summary_file = os.path.join(tmpdir, 'summary.log')
+            lc_func_test_runner.write_summary(
+                [{'bundle': 'bundle1', 'status': 'PASS', 'duration': 60,
+                  'log_file': 'bundle1.log'}],
+                summary_file)
+            with open(summary_file) as f:
+                self.assertEqual(
+                    f.read(), 'PASS         60s bundle1 (bundle1.log)\n')
+
     def test_main_loglevel(self):
         self.patch_object(lc_func_test_runner, 'parse_args')
         self.patch_object(lc_func_test_runner, 'logging')
         self.patch_object(lc_func_test_runner, 'func_test_runner')
-        self.patch_object(lc_func_test_runner, 'asyncio')
+        self.patch_object(lc_func_test_runner.zaza, 'stop_run_loop')
         _args = mock.Mock()
         _args.loglevel = 'DeBuG'
         _args.dev = False
         _args.smoke = False
+        _args.span_file = None
+        _args.trace = None
         self.parse_args.return_value = _args
         self.logging.DEBUG = 10
         lc_func_test_runner.main()
         self.logging.basicConfig.assert_called_with(level=10)
+        self.stop_run_loop.assert_called_once_with()
+
+    def test_main_span_file(self):
+        self.patch_object(lc_func_test_runner, 'parse_args')
+        self.patch_object(lc_func_test_runner, 'logging')
+        self.patch_object(lc_func_test_runner, 'func_test_runner')
+        self.patch_object(lc_func_test_runner.zaza, 'stop_run_loop')
+        self.patch_object(lc_func_test_runner, 'timing')
+        _args = mock.Mock()
+        _args.loglevel = 'DEBUG'
+        _args.dev = False
+        _args.smoke = False
+        _args.span_file = 'spans.json'
+        _args.trace = None
+        self.parse_args.return_value = _args
+        self.logging.DEBUG = 10
+        lc_func_test_runner.main()
+        self.timing.set_span_file.assert_called_once_with('spans.json')
+
+    def test_main_trace(self):
+        self.patch_object(lc_func_test_runner, 'parse_args')
+        self.patch_object(lc_func_test_runner, 'logging')
+        self.patch_object(lc_func_test_runner, 'func_test_runner')
+        self.patch_object(lc_func_test_runner.zaza, 'stop_run_loop')
+        self.patch_object(lc_func_test_runner, 'timing')
+        self.patch_object(lc_func_test_runner, 'report')
+        self.patch_object(lc_func_test_runner.os.path, 'exists',
+                          return_value=True)
+        self.patch_object(lc_func_test_runner.os, 'remove')
+        _args = mock.Mock()
+        _args.loglevel = 'DEBUG'
+        _args.dev = False
+        _args.smoke = False
+        _args.span_file = None
+        _args.trace = 'trace.json'
+        self.parse_args.return_value = _args
+        self.logging.DEBUG = 10
+        self.func_test_runner.side_effect = ValueError()
+        with self.assertRaises(ValueError):
+            lc_func_test_runner.main()
+        self.remove.assert_called_once_with('trace.json.spans')
+        self.timing.set_span_file.assert_called_once_with('trace.json.spans')
+        self.report.write_trace.assert_called_once_with(
+            'trace.json.spans', 'trace.json')
 
     def test_main_loglevel_invalid(self):
         self.patch_object(lc_func_test_runner, 'parse_args')
         self.patch_object(lc_func_test_runner, 'logging')
         self.patch_object(lc_func_test_runner, 'func_test_runner')
-        self.patch_object(lc_func_test_runner, 'asyncio')
+        self.patch_object(lc_func_test_runner.zaza, 'stop_run_loop')
         _args = mock.Mock()
         _args.loglevel = 'invalid'
         self.parse_args.return_value = _args
@@ -198,7 +477,7 @@ class TestCharmLifecycleFuncTestRunner(ut_utils.BaseTestCase):
         self.patch_object(lc_func_test_runner, 'parse_args')
         self.patch_object(lc_func_test_runner, 'logging')
         self.patch_object(lc_func_test_runner, 'func_test_runner')
-        self.patch_object(lc_func_test_runner, 'asyncio')
+        self.patch_object(lc_func_test_runner.zaza, 'stop_run_loop')
         _args = mock.Mock()
         _args.loglevel = 'DEBUG'
         _args.dev = True
@@ -215,7 +494,7 @@ class TestCharmLifecycleFuncTestRunner(ut_utils.BaseTestCase):
         self.patch_object(lc_func_test_runner, 'parse_args')
         self.patch_object(lc_func_test_runner, 'logging')
         self.patch_object(lc_func_test_runner, 'func_test_runner')
-        self.patch_object(lc_func_test_runner, 'asyncio')
+        self.patch_object(lc_func_test_runner.zaza, 'stop_run_loop')
         _args = mock.Mock()
         _args.loglevel = 'DEBUG'
         _args.dev = True
@@ -234,7 +513,7 @@ class TestCharmLifecycleFuncTestRunner(ut_utils.BaseTestCase):
         self.patch_object(lc_func_test_runner, 'parse_args')
         self.patch_object(lc_func_test_runner, 'logging')
         self.patch_object(lc_func_test_runner, 'func_test_runner')
-        self.patch_object(lc_func_test_runner, 'asyncio')
+        self.patch_object(lc_func_test_runner.zaza, 'stop_run_loop')
         _args = mock.Mock()
         _args.loglevel = 'DEBUG'
         _args.dev = False
@@ -0,0 +1,71 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+
+import zaza.charm_lifecycle.model_pool as lc_model_pool
+import unit_tests.utils as ut_utils
+
+
+class TestCharmLifecycleModelPool(ut_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestCharmLifecycleModelPool, self).setUp()
+        self.patch_object(lc_model_pool.utils, 'generate_model_name')
+        self.patch_object(lc_model_pool.prepare, 'prepare')
+        self.patch_object(lc_model_pool.zaza.model, 'disconnect_model')
+        self.reaper = mock.MagicMock()
+        self.patch_object(lc_model_pool.reaper, 'get_reaper',
+                          return_value=self.reaper)
+        self.patch_object(lc_model_pool.reaper, 'wait')
+        self.generate_model_name.side_effect = [
+            'model1', 'model2', 'model3']
+
+    def test_create_model(self):
+        self.assertEqual(lc_model_pool.create_model(), 'model1')
+        self.prepare.assert_called_once_with('model1')
+
+    def test_lease(self):
+        pool = lc_model_pool.ModelPool(size=1, limit=2)
+        self.assertEqual(pool.lease(), 'model1')
+        self.assertEqual(pool.lease(), 'model2')
+        pool.close()
+        self.prepare.assert_has_calls([
+            mock.call('model1'),
+            mock.call('model2')])
+        # Nothing left over to clean up
+        self.assertFalse(self.reaper.reap.called)
+        self.wait.assert_called_once_with()
+
+    def test_release(self):
+        pool = lc_model_pool.ModelPool(size=1, max_teardowns=1)
+        model_name = pool.lease()
+        pool.release(model_name)
+        pool.close()
+        self.disconnect_model.assert_has_calls([
+            mock.call('model1'),
+            mock.call('model2')])
+        # The unused model prepared ahead of time is destroyed too
+        self.get_reaper.assert_called_with(max_destroys=1)
+        self.reaper.reap.assert_has_calls([
+            mock.call('model1'),
+            mock.call('model2')])
+        self.wait.assert_called_once_with()
+
+    def test_close_create_failure(self):
+        self.prepare.side_effect = [None, Exception('create failed')]
+        pool = lc_model_pool.ModelPool(size=1, limit=2)
+        pool.release(pool.lease())
+        pool.close()
+        self.reaper.reap.assert_called_once_with('model1')
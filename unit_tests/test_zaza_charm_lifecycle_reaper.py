@@ -0,0 +1,159 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import mock
+import os
+import tempfile
+
+import zaza.charm_lifecycle.reaper as lc_reaper
+import unit_tests.utils as ut_utils
+
+
+class TestCharmLifecycleReaper(ut_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestCharmLifecycleReaper, self).setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.patch_object(lc_reaper.zaza.controller, 'list_models')
+        self.patch_object(lc_reaper.zaza.controller, 'destroy_model')
+        self.patch_object(lc_reaper.time, 'time', return_value=100)
+        self.list_models.return_value = ['doomed']
+
+    def tearDown(self):
+        super(TestCharmLifecycleReaper, self).tearDown()
+        self.tmpdir.cleanup()
+        lc_reaper.REAPER = None
+
+    def _state(self, model_name):
+        with open(os.path.join(self.tmpdir.name,
+                               '{}.json'.format(model_name))) as f:
+            return json.load(f)
+
+    def _reaper(self):
+        reaper = lc_reaper.Reaper(state_dir=self.tmpdir.name, force_after=60)
+        reaper._start = mock.MagicMock()
+        return reaper
+
+    def test_reap(self):
+        reaper = self._reaper()
+        reaper.reap('doomed')
+        self.assertEqual(reaper.pending(), ['doomed'])
+        self.assertEqual(self._state('doomed')['pid'], os.getpid())
+        reaper._start.assert_called_once_with()
+        self.assertFalse(self.destroy_model.called)
+
+    def test_reap_once(self):
+        reaper = self._reaper()
+        reaper.reap('doomed')
+        reaper.reap_once()
+        self.destroy_model.assert_called_once_with('doomed')
+        self.assertEqual(self._state('doomed')['requested'], 100)
+        # Model still being destroyed
+        reaper.reap_once()
+        self.assertEqual(reaper.pending(), ['doomed'])
+        # Model gone
+        self.list_models.return_value = []
+        reaper.reap_once()
+        self.assertEqual(reaper.pending(), [])
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    def test_reap_once_force(self):
+        reaper = self._reaper()
+        reaper.reap('doomed')
+        reaper.reap_once()
+        self.time.return_value = 200
+        reaper.reap_once()
+        self.destroy_model.assert_called_with('doomed', force=True)
+        self.assertTrue(self._state('doomed')['forced'])
+        reaper.reap_once()
+        self.assertEqual(self.destroy_model.call_count, 2)
+
+    def test_reap_once_max_destroys(self):
+        self.list_models.return_value = ['doomed', 'doomed2']
+        reaper = self._reaper()
+        reaper.max_destroys = 1
+        reaper.reap('doomed')
+        reaper.reap('doomed2')
+        reaper.reap_once()
+        self.destroy_model.assert_called_once_with('doomed')
+        # Held back until the first model has gone
+        reaper.reap_once()
+        self.destroy_model.assert_called_once_with('doomed')
+        self.list_models.return_value = ['doomed2']
+        reaper.reap_once()
+        self.destroy_model.assert_called_with('doomed2')
+        self.assertEqual(reaper.pending(), ['doomed2'])
+
+    def test_reap_once_failure(self):
+        reaper = self._reaper()
+        reaper.reap('doomed')
+        self.destroy_model.side_effect = Exception('API error')
+        reaper.reap_once()
+        self.assertIsNone(self._state('doomed')['requested'])
+        self.destroy_model.side_effect = None
+        reaper.reap_once()
+        self.assertEqual(self._state('doomed')['requested'], 100)
+
+    def test_adopt(self):
+        self.patch_object(lc_reaper, '_pid_alive')
+        self._pid_alive.side_effect = lambda pid: pid == 2
+        for model_name, pid in [('orphan', 1), ('owned', 2)]:
+            with open(os.path.join(self.tmpdir.name,
+                                   '{}.json'.format(model_name)), 'w') as f:
+                json.dump({'model': model_name, 'pid': pid,
+                           'requested': 50, 'forced': False}, f)
+        self.patch_object(lc_reaper.threading, 'Thread',
+                          return_value=mock.MagicMock())
+        reaper = self._reaper()
+        self.assertEqual(reaper.pending(), ['orphan'])
+        self.assertEqual(self._state('orphan')['pid'], os.getpid())
+        # The adopted model is destroyed without waiting for a reap
+        self.Thread.assert_called_once_with(target=reaper._run, daemon=True)
+        self.Thread.return_value.start.assert_called_once_with()
+
+    def test_wait(self):
+        reaper = lc_reaper.Reaper(state_dir=self.tmpdir.name,
+                                  poll_interval=0.01)
+        self.list_models.side_effect = [['doomed'], []]
+        reaper.reap('doomed')
+        self.assertEqual(reaper.wait(timeout=5), [])
+        self.destroy_model.assert_called_once_with('doomed')
+
+    def test_reap_after_run_exits(self):
+        reaper = lc_reaper.Reaper(state_dir=self.tmpdir.name)
+        reaper._thread = mock.MagicMock()
+        # Nothing pending, the thread gives up its place under the lock
+        reaper._run()
+        self.assertIsNone(reaper._thread)
+        self.patch_object(lc_reaper.threading, 'Thread',
+                          return_value=mock.MagicMock())
+        reaper.reap('doomed')
+        self.Thread.assert_called_once_with(target=reaper._run, daemon=True)
+        self.Thread.return_value.start.assert_called_once_with()
+
+    def test_wait_no_reaper(self):
+        self.assertEqual(lc_reaper.wait(), [])
+
+    def test_reap_module(self):
+        self.patch_object(lc_reaper, 'Reaper')
+        reaper = mock.MagicMock()
+        self.Reaper.return_value = reaper
+        lc_reaper.reap('doomed')
+        lc_reaper.wait(timeout=1)
+        self.Reaper.assert_called_once_with()
+        reaper.reap.assert_called_once_with('doomed')
+        reaper.wait.assert_called_once_with(timeout=1)
+        self.assertEqual(lc_reaper.get_reaper(max_destroys=2), reaper)
+        self.assertEqual(reaper.max_destroys, 2)
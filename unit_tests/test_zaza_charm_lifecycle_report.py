@@ -0,0 +1,116 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+
+import zaza.charm_lifecycle.report as lc_report
+import unit_tests.utils as ut_utils
+
+
+class TestCharmLifecycleReport(ut_utils.BaseTestCase):
+
+    SPANS = [
+        {'kind': 'phase', 'name': 'deploy', 'duration': 600.0,
+         'outcome': 'ok'},
+        {'kind': 'phase', 'name': 'configure', 'duration': 30.0,
+         'outcome': 'error'},
+        {'kind': 'model', 'name': 'async_run_on_unit', 'duration': 1.0,
+         'outcome': 'ok'},
+        {'kind': 'model', 'name': 'async_run_on_unit', 'duration': 3.0,
+         'outcome': 'ok'},
+        {'kind': 'model', 'name': 'async_run_on_unit', 'duration': 2.0,
+         'outcome': 'ok'}]
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(lc_report.percentile(values, 50), 50)
+        self.assertEqual(lc_report.percentile(values, 95), 95)
+        self.assertEqual(lc_report.percentile([7], 95), 7)
+        self.assertIsNone(lc_report.percentile([], 50))
+
+    def test_summarise(self):
+        summary = lc_report.summarise(self.SPANS)
+        self.assertEqual(
+            summary['model']['async_run_on_unit'],
+            {'count': 3, 'errors': 0, 'total': 6.0, 'p50': 2.0, 'p95': 3.0,
+             'max': 3.0})
+        self.assertEqual(summary['phase']['configure']['errors'], 1)
+
+    def test_format_report(self):
+        report = lc_report.format_report(
+            lc_report.summarise(self.SPANS)).split('\n')
+        self.assertTrue(report[0].startswith('phase '))
+        self.assertTrue(report[1].startswith('deploy '))
+        self.assertTrue(report[2].startswith('configure '))
+        self.assertEqual(report[3], '')
+        self.assertTrue(report[4].startswith('model '))
+        self.assertEqual(
+            report[5].split(),
+            ['async_run_on_unit', '3', '0', '6.0', '2.0', '3.0', '3.0'])
+
+    def _span(self, span_id, parent, start, end, pid=10):
+        return {'id': span_id, 'parent': parent, 'name': span_id,
+                'kind': 'model', 'start': start, 'end': end,
+                'duration': end - start, 'pid': pid, 'attributes': {},
+                'outcome': 'ok'}
+
+    def test_trace_events(self):
+        spans = [
+            self._span('bundle', None, 0, 10),
+            self._span('deploy', 'bundle', 0, 4),
+            self._span('scp1', 'deploy', 1, 3),
+            self._span('scp2', 'deploy', 1, 2),
+            self._span('scp3', 'deploy', 2.5, 3.5),
+            self._span('test', 'bundle', 5, 9),
+            self._span('bundle2', None, 0, 8, pid=11)]
+        events = lc_report.trace_events(spans)['traceEvents']
+        tracks = {(e['pid'], e['name']): e['tid'] for e in events}
+        self.assertEqual(
+            tracks,
+            {(10, 'bundle'): 0,
+             (10, 'deploy'): 0,
+             (10, 'scp1'): 0,
+             (10, 'scp2'): 1,
+             (10, 'scp3'): 1,
+             (10, 'test'): 0,
+             (11, 'bundle2'): 0})
+        deploy = [e for e in events if e['name'] == 'deploy'][0]
+        self.assertEqual(deploy['ph'], 'X')
+        self.assertEqual(deploy['cat'], 'model')
+        self.assertEqual(deploy['ts'], 0)
+        self.assertEqual(deploy['dur'], 4000000)
+        self.assertEqual(deploy['args'], {'outcome': 'ok'})
+
+    def test_write_trace(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            span_file = os.path.join(tmpdir, 'spans.json')
+            trace_file = os.path.join(tmpdir, 'trace.json')
+            with open(span_file, 'w') as f:
+                f.write(json.dumps(self._span('bundle', None, 0, 10)) + '\n')
+            lc_report.write_trace(span_file, trace_file)
+            with open(trace_file) as f:
+                trace = json.load(f)
+        self.assertEqual(len(trace['traceEvents']), 1)
+
+    def test_parse_args(self):
+        args = lc_report.parse_args(['spans.json'])
+        self.assertEqual(args.span_file, 'spans.json')
+        self.assertIsNone(args.kinds)
+        args = lc_report.parse_args(['spans.json', '-k', 'phase', 'test'])
+        self.assertEqual(args.kinds, ['phase', 'test'])
+        self.assertIsNone(args.trace)
+        args = lc_report.parse_args(['spans.json', '--trace', 'trace.json'])
+        self.assertEqual(args.trace, 'trace.json')
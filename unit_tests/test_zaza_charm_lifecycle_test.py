@@ -12,7 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
+import logging
 import mock
+import unittest
 
 import zaza.charm_lifecycle.test as lc_test
 import unit_tests.utils as ut_utils
@@ -37,11 +40,119 @@ class TestCharmLifecycleTest(ut_utils.BaseTestCase):
             mock.call(test_class2_mock)]
         loader_mock.loadTestsFromTestCase.assert_has_calls(loader_calls)
 
+    def test_timed_test_result(self):
+        span_mock = mock.MagicMock()
+        self.patch_object(lc_test.timing, 'span',
+                          return_value=mock.MagicMock())
+        self.span.return_value.open.return_value = span_mock
+
+        class _Test(unittest.TestCase):
+
+            def test_pass(self):
+                pass
+
+            def test_fail(self):
+                self.fail()
+
+        suite = unittest.TestLoader().loadTestsFromTestCase(_Test)
+        unittest.TextTestRunner(
+            stream=io.StringIO(),
+            resultclass=lc_test.TimedTestResult).run(suite)
+        self.assertEqual(
+            [c[1][1] for c in self.span.mock_calls if c[0] == ''],
+            ['test_method', 'test_method'])
+        span_mock.close.assert_has_calls([
+            mock.call('TestFailure'),
+            mock.call(None)])
+
+    def test_is_parallel_safe(self):
+        class _Test(unittest.TestCase):
+            pass
+
+        self.assertFalse(lc_test.is_parallel_safe('my.Test', _Test))
+        self.assertTrue(
+            lc_test.is_parallel_safe('my.Test', _Test, ['my.Test']))
+        _Test.parallel_safe = True
+        self.assertTrue(lc_test.is_parallel_safe('my.Test', _Test))
+
+        # Being parallel safe is not inherited
+        class _SubTest(_Test):
+            pass
+        self.assertFalse(lc_test.is_parallel_safe('my.SubTest', _SubTest))
+
+    def test_run_test_list_parallel(self):
+        self.patch_object(lc_test, 'run_test_class')
+        self.run_test_class.return_value = mock.MagicMock()
+        self.patch_object(lc_test, 'run_parallel_test_classes')
+        self.patch_object(lc_test.utils, 'get_class')
+        self.get_class.side_effect = lambda x: x
+        lc_test.run_test_list(
+            ['safe1', 'safe2', 'serial', 'safe3', 'safe4', 'safe5'],
+            parallel_safe_tests=['safe1', 'safe2', 'safe3', 'safe4',
+                                 'safe5'],
+            workers=2)
+        self.run_parallel_test_classes.assert_has_calls([
+            mock.call([('safe1', 'safe1'), ('safe2', 'safe2')], workers=2),
+            mock.call([('safe3', 'safe3'), ('safe4', 'safe4'),
+                       ('safe5', 'safe5')], workers=2)])
+        self.run_test_class.assert_called_once_with('serial', 'serial')
+
+    def test_run_test_list_single_parallel_safe(self):
+        self.patch_object(lc_test, 'run_test_class')
+        self.run_test_class.return_value = mock.MagicMock()
+        self.run_test_class.return_value.wasSuccessful.return_value = False
+        self.patch_object(lc_test, 'run_parallel_test_classes')
+        self.patch_object(lc_test.utils, 'get_class')
+        self.get_class.side_effect = lambda x: x
+        with self.assertRaises(AssertionError):
+            lc_test.run_test_list(['safe1'], parallel_safe_tests=['safe1'])
+        self.run_test_class.assert_called_once_with('safe1', 'safe1')
+        self.assertFalse(self.run_parallel_test_classes.called)
+
+    def test_run_parallel_test_classes(self):
+        self.patch_object(lc_test.timing, 'span',
+                          return_value=mock.MagicMock())
+        self.patch_object(lc_test.sys, 'stderr', new=io.StringIO())
+
+        class _Test1(unittest.TestCase):
+
+            def test_pass(self):
+                logging.warning('Logged by {}'.format(self.id()))
+
+        class _Test2(unittest.TestCase):
+
+            def test_fail(self):
+                self.fail()
+
+        root_handlers = list(logging.getLogger().handlers)
+        results = lc_test.run_parallel_test_classes(
+            [('my.Test1', _Test1), ('my.Test1', _Test1)])
+        self.assertEqual([r.testsRun for r in results], [1, 1])
+        self.assertTrue(all(r.wasSuccessful() for r in results))
+        self.assertEqual(logging.getLogger().handlers, root_handlers)
+        output = self.stderr.getvalue()
+        self.assertTrue(output.startswith('## Output of my.Test1 ##'))
+        # Logs of each class are written with its output
+        self.assertEqual(output.count('Logged by'), 2)
+        self.assertLess(output.index('Logged by'),
+                        output.rindex('## Output of my.Test1 ##'))
+        with self.assertRaises(AssertionError) as ctx:
+            lc_test.run_parallel_test_classes(
+                [('my.Test1', _Test1), ('my.Test2', _Test2)], workers=1)
+        self.assertEqual(str(ctx.exception), 'Test run failed: my.Test2')
+        output = self.stderr.getvalue()
+        self.assertLess(output.rindex('my.Test1'), output.rindex('my.Test2'))
+
     def test_test(self):
         self.patch_object(lc_test, 'run_test_list')
-        lc_test.run_test_list(['test_class1', 'test_class2'])
+        self.patch_object(lc_test.zaza.model, 'set_juju_model')
+        lc_test.test('mymodel', ['test_class1', 'test_class2'],
+                     parallel_safe_tests=['test_class2'])
+        self.set_juju_model.assert_called_once_with('mymodel')
         self.run_test_list.assert_called_once_with(
-            ['test_class1', 'test_class2'])
+            ['test_class1', 'test_class2'],
+            parallel_safe_tests=['test_class2'],
+            workers=None)
 
     def test_parser(self):
         args = lc_test.parse_args(
@@ -50,6 +161,9 @@ class TestCharmLifecycleTest(ut_utils.BaseTestCase):
             args.tests,
             ['my.test_class1', 'my.test_class2'])
         self.assertEqual(args.model_name, 'modelname')
+        self.assertIsNone(args.workers)
+        args = lc_test.parse_args(['-m', 'modelname', '-w', '8'])
+        self.assertEqual(args.workers, 8)
 
     def test_parser_logging(self):
         # Using defaults
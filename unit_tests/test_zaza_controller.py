@@ -36,7 +36,7 @@ class TestController(ut_utils.BaseTestCase):
         async def _add_model(model_name, config=None):
             return self.model1
 
-        async def _destroy_model(model_name):
+        async def _destroy_model(model_name, force=False):
             return
 
         async def _get_cloud():
@@ -90,6 +90,11 @@ class TestController(ut_utils.BaseTestCase):
         self.Controller_mock.destroy_model.assert_called_once_with(
             self.model1.info.name)
 
+    def test_destroy_model_force(self):
+        controller.destroy_model(self.model1.info.name, force=True)
+        self.Controller_mock.destroy_model.assert_called_once_with(
+            self.model1.info.name, force=True)
+
     def test_get_cloud(self):
         self.assertEqual(
             controller.get_cloud(),
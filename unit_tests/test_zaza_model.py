@@ -14,12 +14,17 @@
 
 import aiounittest
 import asyncio.futures
+import hashlib
 import concurrent
+import concurrent.futures
 import mock
+import threading
+import websockets
 
 import unit_tests.utils as ut_utils
 from juju import loop
 
+import zaza
 import zaza.model as model
 
 
@@ -29,9 +34,14 @@ class TestModel(ut_utils.BaseTestCase):
         super(TestModel, self).tearDown()
         # Clear cached model name
         model.CURRENT_MODEL = None
+        # Clear pooled model connections
+        model.MODEL_CONNECTIONS.clear()
+        model.MODEL_CONNECTION_LOCKS.clear()
 
     def setUp(self):
         super(TestModel, self).setUp()
+        self.patch_object(model.ssh, 'multiplex_options',
+                          return_value=['-o', 'ControlMaster=auto'])
 
         async def _scp_to(source, destination, user=None, proxy=None,
                           scp_opts=None):
@@ -206,6 +216,38 @@ class TestModel(ut_utils.BaseTestCase):
         self.assertEqual(model.get_juju_model(), 'modelsmodel')
         self.async_get_current_model.assert_called_once()
 
+    def test_use_model(self):
+        model.CURRENT_MODEL = 'setmodel'
+        self.assertIsNone(model.get_context_model())
+        with model.use_model('outer'):
+            self.assertEqual(model.get_juju_model(), 'outer')
+            with model.use_model('inner'):
+                self.assertEqual(model.get_context_model(), 'inner')
+            self.assertEqual(model.get_juju_model(), 'outer')
+        self.assertIsNone(model.get_context_model())
+        self.assertEqual(model.get_juju_model(), 'setmodel')
+
+    def test_use_model_concurrent(self):
+        barrier = threading.Barrier(2)
+
+        def _get_model(model_name):
+            with model.use_model(model_name):
+                barrier.wait()
+                return model.get_juju_model()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            self.assertEqual(
+                list(pool.map(_get_model, ['model1', 'model2'])),
+                ['model1', 'model2'])
+
+    def test_in_model_context(self):
+        model.CURRENT_MODEL = 'setmodel'
+        with model.use_model('ctxmodel'):
+            bound = model.in_model_context(model.get_juju_model)
+        unbound = model.in_model_context(model.get_juju_model)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            self.assertEqual(pool.submit(bound).result(), 'ctxmodel')
+            self.assertEqual(pool.submit(unbound).result(), 'setmodel')
+
     def test_run_in_model(self):
         self.patch_object(model, 'Model')
         self.Model.return_value = self.Model_mock
@@ -215,7 +257,121 @@ class TestModel(ut_utils.BaseTestCase):
                 return mymodel
         self.assertEqual(loop.run(_wrapper()), self.Model_mock)
         self.Model_mock.connect_model.assert_called_once_with('modelname')
+        self.assertFalse(self.Model_mock.disconnect.called)
+
+    def test_run_in_model_reuses_connection(self):
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self.Model_mock.is_connected.return_value = True
+
+        async def _wrapper():
+            async with model.run_in_model('modelname') as mymodel:
+                pass
+            async with model.run_in_model('modelname') as mymodel:
+                return mymodel
+        self.assertEqual(loop.run(_wrapper()), self.Model_mock)
+        self.Model.assert_called_once_with()
+        self.Model_mock.connect_model.assert_called_once_with('modelname')
+
+    def test_run_in_model_reconnects(self):
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self.Model_mock.is_connected.return_value = False
+
+        async def _wrapper():
+            async with model.run_in_model('modelname') as mymodel:
+                pass
+            async with model.run_in_model('modelname') as mymodel:
+                return mymodel
+        self.assertEqual(loop.run(_wrapper()), self.Model_mock)
+        self.Model_mock.connect_model.assert_has_calls([
+            mock.call('modelname'),
+            mock.call('modelname')])
+        self.Model_mock.disconnect.assert_called_once_with()
+
+    def test_run_in_model_concurrent_connect(self):
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+
+        async def _connect_model(model_name):
+            # Let the other callers run while connecting
+            await asyncio.sleep(0)
+        self.Model_mock.connect_model.side_effect = _connect_model
+
+        async def _get_model():
+            async with model.run_in_model('modelname') as mymodel:
+                return mymodel
+
+        async def _wrapper():
+            return await asyncio.gather(*[_get_model() for _ in range(3)])
+        self.assertEqual(loop.run(_wrapper()), [self.Model_mock] * 3)
+        self.Model.assert_called_once_with()
+        self.Model_mock.connect_model.assert_called_once_with('modelname')
+
+    def test_disconnect_model(self):
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+
+        async def _wrapper():
+            async with model.run_in_model('modelname'):
+                pass
+            await model.async_disconnect_model('modelname')
+            await model.async_disconnect_model('othermodel')
+        loop.run(_wrapper())
         self.Model_mock.disconnect.assert_called_once_with()
+        self.assertEqual(model.MODEL_CONNECTIONS, {})
+
+    def test_disconnect_model_other_loop(self):
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        loops = []
+
+        async def _disconnect():
+            loops.append(asyncio.get_event_loop())
+        self.Model_mock.disconnect.side_effect = _disconnect
+
+        async def _connect():
+            async with model.run_in_model('modelname'):
+                pass
+        # Connected from the zaza event loop, running in its own thread
+        zaza.run(_connect())
+        loop.run(model.async_disconnect_model('modelname'))
+        self.assertEqual(loops, [zaza.get_run_loop()])
+        self.assertEqual(model.MODEL_CONNECTIONS, {})
+
+    def test_run_in_model_reconnects_other_loop(self):
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        loops = []
+
+        async def _disconnect():
+            loops.append(asyncio.get_event_loop())
+        self.Model_mock.disconnect.side_effect = _disconnect
+
+        async def _connect():
+            async with model.run_in_model('modelname') as mymodel:
+                return mymodel
+        zaza.run(_connect())
+        # The connection of the zaza event loop can not be used from another
+        # loop, it is disconnected on its own loop
+        loop.run(_connect())
+        self.assertEqual(loops, [zaza.get_run_loop()])
+        self.assertEqual(self.Model_mock.connect_model.call_count, 2)
+        loop.run(model.async_disconnect_models())
+
+    def test_disconnect_models(self):
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+
+        async def _wrapper():
+            async with model.run_in_model('modelname'):
+                pass
+            async with model.run_in_model('othermodel'):
+                pass
+            await model.async_disconnect_models()
+        loop.run(_wrapper())
+        self.assertEqual(self.Model_mock.disconnect.call_count, 2)
+        self.assertEqual(model.MODEL_CONNECTIONS, {})
 
     def test_scp_to_unit(self):
         self.patch_object(model, 'get_juju_model', return_value='mname')
@@ -225,7 +381,8 @@ class TestModel(ut_utils.BaseTestCase):
         self.Model.return_value = self.Model_mock
         model.scp_to_unit('app/1', '/tmp/src', '/tmp/dest')
         self.unit1.scp_to.assert_called_once_with(
-            '/tmp/src', '/tmp/dest', proxy=False, scp_opts='', user='ubuntu')
+            '/tmp/src', '/tmp/dest', proxy=False,
+            scp_opts=['-o', 'ControlMaster=auto'], user='ubuntu')
 
     def test_scp_to_all_units(self):
         self.patch_object(model, 'get_juju_model', return_value='mname')
@@ -233,9 +390,27 @@ class TestModel(ut_utils.BaseTestCase):
         self.Model.return_value = self.Model_mock
         model.scp_to_all_units('app', '/tmp/src', '/tmp/dest')
         self.unit1.scp_to.assert_called_once_with(
-            '/tmp/src', '/tmp/dest', proxy=False, scp_opts='', user='ubuntu')
+            '/tmp/src', '/tmp/dest', proxy=False,
+            scp_opts=['-o', 'ControlMaster=auto'], user='ubuntu')
         self.unit2.scp_to.assert_called_once_with(
-            '/tmp/src', '/tmp/dest', proxy=False, scp_opts='', user='ubuntu')
+            '/tmp/src', '/tmp/dest', proxy=False,
+            scp_opts=['-o', 'ControlMaster=auto'], user='ubuntu')
+
+    def test_scp_to_all_units_fail(self):
+        async def _scp_to(source, destination, user=None, proxy=None,
+                          scp_opts=None):
+            raise model.JujuError('scp failed')
+
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self.unit2.scp_to.side_effect = _scp_to
+        with self.assertRaises(model.FanOutError) as error:
+            model.scp_to_all_units('app', '/tmp/src', '/tmp/dest')
+        self.assertEqual(list(error.exception.errors.keys()), ['app/4'])
+        self.unit1.scp_to.assert_called_once_with(
+            '/tmp/src', '/tmp/dest', proxy=False,
+            scp_opts=['-o', 'ControlMaster=auto'], user='ubuntu')
 
     def test_scp_from_unit(self):
         self.patch_object(model, 'get_juju_model', return_value='mname')
@@ -245,7 +420,8 @@ class TestModel(ut_utils.BaseTestCase):
         self.Model.return_value = self.Model_mock
         model.scp_from_unit('app/1', '/tmp/src', '/tmp/dest')
         self.unit1.scp_from.assert_called_once_with(
-            '/tmp/src', '/tmp/dest', proxy=False, scp_opts='', user='ubuntu')
+            '/tmp/src', '/tmp/dest', proxy=False,
+            scp_opts=['-o', 'ControlMaster=auto'], user='ubuntu')
 
     def test_get_units(self):
         self.patch_object(model, 'get_juju_model', return_value='mname')
@@ -336,6 +512,74 @@ class TestModel(ut_utils.BaseTestCase):
                          expected)
         self.unit2.run.assert_called_once_with(cmd, timeout=None)
 
+    def _patch_action_facade(self, errors=None):
+        errors = errors or {}
+        self.facade = mock.MagicMock()
+
+        async def _facade_run(applications, commands, machines, timeout,
+                              units):
+            results = []
+            for unit_name in units:
+                result = mock.MagicMock()
+                result.error = None
+                if unit_name in errors:
+                    result.error = mock.MagicMock()
+                    result.error.message = errors[unit_name]
+                result.action.tag = 'action-{}'.format(unit_name)
+                results.append(result)
+            return mock.MagicMock(results=results)
+
+        async def _wait_for_action(tag):
+            return self.action
+
+        self.facade.Run.side_effect = _facade_run
+        self.Model_mock.wait_for_action.side_effect = _wait_for_action
+        self.patch_object(model.client.ActionFacade, 'from_connection',
+                          return_value=self.facade)
+
+    def test_run_on_units(self):
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        expected = {'Code': '0', 'Stderr': '', 'Stdout': 'RESULT'}
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self._patch_action_facade()
+        self.assertEqual(
+            model.run_on_units(['app/2', 'app/4'], 'cmd', timeout=2),
+            {'app/2': expected, 'app/4': expected})
+        self.facade.Run.assert_called_once_with(
+            applications=[],
+            commands='cmd',
+            machines=[],
+            timeout=2000000000,
+            units=['app/2', 'app/4'])
+        self.unit1.run.assert_not_called()
+        self.unit2.run.assert_not_called()
+
+    def test_run_on_units_fail(self):
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self._patch_action_facade(errors={'app/4': 'no such unit'})
+        with self.assertRaises(model.JujuError):
+            model.run_on_units(['app/2', 'app/4'], 'cmd')
+        self.Model_mock.wait_for_action.assert_not_called()
+
+    def test_run_on_application(self):
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        expected = {'Code': '0', 'Stderr': '', 'Stdout': 'RESULT'}
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self._patch_action_facade()
+        self.assertEqual(
+            model.run_on_application('app', 'cmd'),
+            {'app/2': expected, 'app/4': expected})
+        self.facade.Run.assert_called_once_with(
+            applications=[],
+            commands='cmd',
+            machines=[],
+            timeout=None,
+            units=['app/2', 'app/4'])
+
     def test_get_relation_id(self):
         self.patch_object(model, 'get_juju_model', return_value='mname')
         self.patch_object(model, 'Model')
@@ -351,6 +595,26 @@ class TestModel(ut_utils.BaseTestCase):
                                   remote_interface_name='interface'),
             51)
 
+    def test_get_application_fingerprint(self):
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        app = self.Model_mock.applications['app']
+        app.safe_data = {'charm-url': 'cs:app-1', 'config': {'opt': 'a'}}
+        self.relation1.key = 'app:rel other:rel'
+        self.relation2.key = 'app:rel2 other:rel2'
+        self.unit1.safe_data = {'public-address': 'ip1'}
+        self.unit2.safe_data = {'public-address': 'ip2'}
+        fingerprint = model.get_application_fingerprint('app')
+        self.assertEqual(model.get_application_fingerprint('app'),
+                         fingerprint)
+        app.safe_data['config'] = {'opt': 'b'}
+        changed = model.get_application_fingerprint('app')
+        self.assertNotEqual(changed, fingerprint)
+        self.relations.pop()
+        self.assertNotEqual(model.get_application_fingerprint('app'),
+                            changed)
+
     def test_run_action(self):
         self.patch_object(model, 'get_juju_model', return_value='mname')
         self.patch_object(model, 'Model')
@@ -365,6 +629,19 @@ class TestModel(ut_utils.BaseTestCase):
             'backup',
             backup_dir='/dev/null')
 
+    def test_run_action_openstack_upgrade(self):
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        self.patch_object(model, 'Model')
+        self.patch_object(model, 'get_unit_from_name')
+        self.get_unit_from_name.return_value = self.unit1
+        self.Model.return_value = self.Model_mock
+        from zaza.utilities import openstack as openstack_utils
+        self.patch_object(openstack_utils, 'clear_os_versions_cache')
+        model.run_action('app/2', 'backup', model_name='mname')
+        self.assertFalse(self.clear_os_versions_cache.called)
+        model.run_action('app/2', 'openstack-upgrade', model_name='mname')
+        self.clear_os_versions_cache.assert_called_once_with('mname')
+
     def test_get_actions(self):
         self.patch_object(model, 'get_juju_model', return_value='mname')
         self.patch_object(model.subprocess, 'check_output')
@@ -392,7 +669,7 @@ class TestModel(ut_utils.BaseTestCase):
         self.system_ready = True
         self._block_until_calls = 0
 
-        async def _block_until(f, timeout=0):
+        async def _block_until(model, f, timeout=0):
             # Mimic timeouts
             timeout = timeout + self._block_until_calls
             self._block_until_calls += 1
@@ -405,7 +682,8 @@ class TestModel(ut_utils.BaseTestCase):
 
         async def _all_units_idle():
             return units_idle
-        self.Model_mock.block_until.side_effect = _block_until
+        self.patch_object(model, 'async_block_until_model_state')
+        self.async_block_until_model_state.side_effect = _block_until
         self.patch_object(model, 'Model')
         self.Model.return_value = self.Model_mock
         self.Model_mock.all_units_idle.return_value = _all_units_idle
@@ -523,6 +801,29 @@ class TestModel(ut_utils.BaseTestCase):
         model.wait_for_application_states('modelname', timeout=1)
         self.assertTrue(self.system_ready)
 
+    def test_units_idle(self):
+        self.Model_mock.all_units_idle.return_value = True
+        self.unit1.agent_status = 'idle'
+        self.unit2.agent_status = 'executing'
+        self.assertTrue(model.units_idle(self.Model_mock))
+        self.assertFalse(model.units_idle(self.Model_mock, ['app']))
+        self.unit2.agent_status = 'idle'
+        self.assertTrue(model.units_idle(self.Model_mock, ['app']))
+        self.assertFalse(model.units_idle(self.Model_mock, ['missing']))
+
+    def test_wait_for_application_states_applications(self):
+        self._application_states_setup({
+            'workload-status': 'blocked',
+            'workload-status-message': 'Unit is ready'})
+        self.unit1.agent_status = 'executing'
+        # Units of other applications are not waited on
+        model.wait_for_application_states(
+            'modelname', applications=[], timeout=1)
+        self.assertTrue(self.system_ready)
+        model.wait_for_application_states(
+            'modelname', applications=['app'], timeout=1)
+        self.assertFalse(self.system_ready)
+
     def test_wait_for_application_states_not_ready_ws(self):
         self._application_states_setup({
             'workload-status': 'blocked',
@@ -538,6 +839,17 @@ class TestModel(ut_utils.BaseTestCase):
             model.wait_for_application_states('modelname', timeout=1)
             self.assertFalse(self.system_ready)
 
+    def test_wait_for_application_states_errored_other_application(self):
+        self._application_states_setup({
+            'workload-status': 'error',
+            'workload-status-message': 'Unit is ready'})
+        # Units in error outside of the applications waited on are ignored
+        model.wait_for_application_states(
+            'modelname', applications=['other'], timeout=1)
+        with self.assertRaises(model.UnitError):
+            model.wait_for_application_states(
+                'modelname', applications=['app'], timeout=1)
+
     def test_wait_for_application_states_not_ready_wsmsg(self):
         self._application_states_setup({
             'workload-status': 'active',
@@ -600,55 +912,196 @@ class TestModel(ut_utils.BaseTestCase):
         self.assertEqual(
             timeout.exception.args[0],
             "Zaza has timed out waiting on the model to reach expected "
-            "workload statuses.")
+            "workload statuses. Pending units: app/2, app/4")
+
+    def test_pending_units(self):
+        self.patch_object(model, '_units_in_error', return_value=[])
+        type(self.unit1).workload_status = mock.PropertyMock(
+            return_value='active')
+        type(self.unit1).workload_status_message = mock.PropertyMock(
+            return_value='Unit is ready')
+        type(self.unit2).workload_status = mock.PropertyMock(
+            return_value='blocked')
+        type(self.unit2).workload_status_message = mock.PropertyMock(
+            return_value='Vault needs to be initialized')
+        self.assertEqual(model.pending_units(self.Model_mock), ['app/4'])
+        self._units_in_error.assert_called_once_with(self.Model_mock, None)
+        self.assertEqual(
+            model.pending_units(
+                self.Model_mock,
+                states={
+                    'app': {
+                        'workload-status': 'blocked',
+                        'workload-status-message': 'Vault needs'}}),
+            [])
+        self.assertEqual(
+            model.pending_units(self.Model_mock, applications=['other']),
+            [])
+        self._units_in_error.assert_called_with(self.Model_mock, ['other'])
 
     def test_get_current_model(self):
         self.patch_object(model, 'Model')
         self.Model.return_value = self.Model_mock
         self.assertEqual(model.get_current_model(), self.model_name)
 
+    def _remote_file(self, contents, code=0):
+        """Make ssh to the units return contents as a remote file."""
+        async def _ssh_unit(unit, command, user='ubuntu'):
+            if code:
+                raise model.CommandRunFailed(command, {'Code': str(code)})
+            return contents.encode()
+        if '_async_ssh_unit' not in self._patches:
+            self.patch_object(model, '_async_ssh_unit')
+        self._async_ssh_unit.side_effect = _ssh_unit
+
+    def _ssh_commands(self, unit):
+        """Return the commands run over ssh on unit."""
+        return [c[0][1] for c in self._async_ssh_unit.call_args_list
+                if c[0][0] is unit]
+
+    def test_ssh_unit(self):
+        self.patch_object(model.asyncio, 'create_subprocess_exec')
+        unit = mock.MagicMock()
+        unit.machine.dns_name = '10.0.0.10'
+        process = mock.MagicMock()
+        process.returncode = 0
+
+        async def _communicate():
+            return b'out', b'err'
+        process.communicate.side_effect = _communicate
+
+        async def _create_subprocess_exec(*args, **kwargs):
+            return process
+        self.create_subprocess_exec.side_effect = _create_subprocess_exec
+        self.assertEqual(
+            zaza.run(model._async_ssh_unit(unit, 'cat /etc/my.conf')),
+            b'out')
+        args = self.create_subprocess_exec.call_args[0]
+        self.assertEqual(args[0], 'ssh')
+        self.assertIn('ControlMaster=auto', args)
+        self.assertEqual(args[-2:], ('ubuntu@10.0.0.10', 'cat /etc/my.conf'))
+        process.returncode = 1
+        with self.assertRaises(model.CommandRunFailed):
+            zaza.run(model._async_ssh_unit(unit, 'cat /etc/my.conf'))
+
+    def test_read_remote_file(self):
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        self.patch_object(model, 'get_unit_from_name',
+                          return_value=self.unit1)
+        self._remote_file('some\ncontents')
+        self.assertEqual(
+            model.read_remote_file('app/2', '/etc/my file.conf'),
+            b'some\ncontents')
+        self._async_ssh_unit.assert_called_once_with(
+            self.unit1, "cat '/etc/my file.conf'")
+        self._remote_file('', code=1)
+        with self.assertRaises(model.CommandRunFailed):
+            model.read_remote_file('app/2', '/etc/missing.conf')
+
+    def _remote_files(self, files):
+        """Make ssh to the units serve files, a dict of path: contents."""
+        def _digest(path):
+            return hashlib.sha256(files[path].encode()).hexdigest()
+
+        async def _ssh_unit(unit, command, user='ubuntu'):
+            path = command.split()[-1]
+            stdout = files[path].encode()
+            if command.startswith('sum='):
+                if _digest(path) in command:
+                    stdout = b''
+                stdout = _digest(path).encode() + b'\n' + stdout
+            return stdout
+        self.patch_object(model, '_async_ssh_unit')
+        self._async_ssh_unit.side_effect = _ssh_unit
+
+    def test_read_unit_file_unchanged(self):
+        files = {'/etc/my.conf': 'first'}
+        self._remote_files(files)
+        cache = {}
+
+        def _read():
+            return zaza.run(model._async_read_unit_file(
+                self.unit1, '/etc/my.conf', cache=cache))[1]
+        self.assertEqual(_read(), b'first')
+        self.assertEqual(_read(), b'first')
+        self.assertIn(
+            hashlib.sha256(b'first').hexdigest(),
+            self._async_ssh_unit.call_args[0][1])
+        files['/etc/my.conf'] = 'second'
+        self.assertEqual(_read(), b'second')
+        self.assertEqual(_read(), b'second')
+        self.assertEqual(list(cache), [(self.unit1.entity_id, '/etc/my.conf')])
+        # Without a cache the whole file is read every time
+        zaza.run(model._async_read_unit_file(self.unit1, '/etc/my.conf'))
+        self._async_ssh_unit.assert_called_with(
+            self.unit1, 'cat /etc/my.conf')
+
+    def test_block_until_file_ready_unchanged(self):
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        self._remote_files({'/etc/my.conf': 'contents'})
+        check = mock.MagicMock(return_value=False)
+        with self.assertRaises(asyncio.futures.TimeoutError):
+            zaza.run(model.async_block_until_file_ready(
+                'app', '/etc/my.conf', check, timeout=0.7))
+        self.assertEqual(len(self._ssh_commands(self.unit1)), 2)
+        check.assert_has_calls([mock.call('contents'),
+                                mock.call('contents')])
+        self.assertEqual(check.call_count, 2)
+
+    def test_parse_oslo_config(self):
+        self.assertEqual(
+            model.parse_oslo_config(
+                '[DEFAULT]\ndebug = False\n\n[db]\nurl = a\nurl = b\n'),
+            {'DEFAULT': {'debug': ['False']}, 'db': {'url': ['a', 'b']}})
+
     def test_block_until_file_has_contents(self):
         self.patch_object(model, 'Model')
         self.Model.return_value = self.Model_mock
         self.patch_object(model, 'get_juju_model', return_value='mname')
-        self.patch("builtins.open",
-                   new_callable=mock.mock_open(),
-                   name="_open")
-        _fileobj = mock.MagicMock()
-        _fileobj.__enter__().read.return_value = "somestring"
-        self._open.return_value = _fileobj
+        self._remote_file('somestring')
         model.block_until_file_has_contents(
             'app',
             '/tmp/src/myfile.txt',
             'somestring',
             timeout=0.1)
-        self.unit1.scp_from.assert_called_once_with(
-            '/tmp/src/myfile.txt', mock.ANY)
-        self.unit2.scp_from.assert_called_once_with(
-            '/tmp/src/myfile.txt', mock.ANY)
+        self.assertEqual(
+            self._ssh_commands(self.unit1), ['cat /tmp/src/myfile.txt'])
+        self.assertEqual(
+            self._ssh_commands(self.unit2), ['cat /tmp/src/myfile.txt'])
 
     def test_block_until_file_has_contents_missing(self):
         self.patch_object(model, 'Model')
         self.Model.return_value = self.Model_mock
         self.patch_object(model, 'get_juju_model', return_value='mname')
-        self.patch("builtins.open",
-                   new_callable=mock.mock_open(),
-                   name="_open")
-        _fileobj = mock.MagicMock()
-        _fileobj.__enter__().read.return_value = "anything else"
-        self._open.return_value = _fileobj
+        self._remote_file('anything else')
         with self.assertRaises(asyncio.futures.TimeoutError):
             model.block_until_file_has_contents(
                 'app',
                 '/tmp/src/myfile.txt',
                 'somestring',
                 timeout=0.1)
-        self.unit1.scp_from.assert_called_once_with(
-            '/tmp/src/myfile.txt', mock.ANY)
+        self.assertEqual(
+            self._ssh_commands(self.unit1), ['cat /tmp/src/myfile.txt'])
+
+    def test_block_until_file_has_contents_no_file(self):
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        self._remote_file('', code=1)
+        with self.assertRaises(asyncio.futures.TimeoutError):
+            model.block_until_file_has_contents(
+                'app',
+                '/tmp/src/myfile.txt',
+                '',
+                timeout=0.1)
 
     def test_async_block_until_all_units_idle(self):
 
-        async def _block_until(f, timeout=None):
+        async def _block_until(model, f, timeout=None):
             if not f():
                 raise asyncio.futures.TimeoutError
 
@@ -657,13 +1110,14 @@ class TestModel(ut_utils.BaseTestCase):
         self.patch_object(model, 'Model')
         self.Model.return_value = self.Model_mock
         self.Model_mock.all_units_idle.side_effect = _all_units_idle
-        self.Model_mock.block_until.side_effect = _block_until
+        self.patch_object(model, 'async_block_until_model_state')
+        self.async_block_until_model_state.side_effect = _block_until
         # Check exception is not raised:
         model.block_until_all_units_idle('modelname')
 
     def test_async_block_until_all_units_idle_false(self):
 
-        async def _block_until(f, timeout=None):
+        async def _block_until(model, f, timeout=None):
             if not f():
                 raise asyncio.futures.TimeoutError
 
@@ -672,14 +1126,15 @@ class TestModel(ut_utils.BaseTestCase):
         self.Model_mock.all_units_idle.side_effect = _all_units_idle
         self.patch_object(model, 'Model')
         self.Model.return_value = self.Model_mock
-        self.Model_mock.block_until.side_effect = _block_until
+        self.patch_object(model, 'async_block_until_model_state')
+        self.async_block_until_model_state.side_effect = _block_until
         # Confirm exception is raised:
         with self.assertRaises(asyncio.futures.TimeoutError):
             model.block_until_all_units_idle('modelname')
 
     def test_async_block_until_all_units_idle_errored_unit(self):
 
-        async def _block_until(f, timeout=None):
+        async def _block_until(model, f, timeout=None):
             if not f():
                 raise asyncio.futures.TimeoutError
 
@@ -692,10 +1147,88 @@ class TestModel(ut_utils.BaseTestCase):
         unit = mock.MagicMock()
         unit.entity_id = 'aerroredunit/0'
         self.units_with_wl_status_state.return_value = [unit]
-        self.Model_mock.block_until.side_effect = _block_until
+        self.patch_object(model, 'async_block_until_model_state')
+        self.async_block_until_model_state.side_effect = _block_until
         with self.assertRaises(model.UnitError):
             model.block_until_all_units_idle('modelname')
 
+    def _subordinate_setup(self):
+        sub_unit = mock.MagicMock()
+        sub_unit.entity_id = 'sub/0'
+        sub_unit.data = {'principal': 'app/2'}
+        sub_unit.agent_status = 'idle'
+        other_unit = mock.MagicMock()
+        other_unit.entity_id = 'other/0'
+        other_unit.data = {'principal': ''}
+        other_unit.agent_status = 'executing'
+        sub_app = mock.MagicMock()
+        sub_app.units = [sub_unit]
+        other_app = mock.MagicMock()
+        other_app.units = [other_unit]
+        self.Model_mock.applications = dict(self.mymodel.applications)
+        self.Model_mock.applications['sub'] = sub_app
+        self.Model_mock.applications['other'] = other_app
+        self.unit1.agent_status = 'idle'
+        self.unit2.agent_status = 'idle'
+        self.sub_unit = sub_unit
+
+    def test_subordinate_applications(self):
+        self._subordinate_setup()
+        self.assertEqual(
+            model.subordinate_applications(self.Model_mock, 'app'),
+            ['sub'])
+        self.assertEqual(
+            model.subordinate_applications(self.Model_mock, 'other'),
+            [])
+
+    def test_get_subordinate_applications(self):
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self._subordinate_setup()
+        self.assertEqual(model.get_subordinate_applications('app'), ['sub'])
+
+    def _block_until_idle_setup(self):
+        async def _block_until(model, f, timeout=None):
+            if not f():
+                raise concurrent.futures._base.TimeoutError
+
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self.patch_object(model, 'units_with_wl_status_state',
+                          return_value=[])
+        self.patch_object(model, 'async_block_until_model_state')
+        self.async_block_until_model_state.side_effect = _block_until
+        self._subordinate_setup()
+
+    def test_block_until_all_units_idle_applications(self):
+        self._block_until_idle_setup()
+        model.block_until_all_units_idle('modelname', applications=['app'])
+        with self.assertRaises(concurrent.futures._base.TimeoutError):
+            model.block_until_all_units_idle(
+                'modelname', applications=['app', 'other'])
+
+    def test_block_until_application_idle(self):
+        self._block_until_idle_setup()
+        # Units of other applications are not waited on
+        model.block_until_application_idle('app')
+        self.sub_unit.agent_status = 'executing'
+        with self.assertRaises(concurrent.futures._base.TimeoutError):
+            model.block_until_application_idle('app')
+        model.block_until_application_idle('app',
+                                           include_subordinates=False)
+
+    def test_block_until_application_idle_errored_unit(self):
+        self._block_until_idle_setup()
+        self.units_with_wl_status_state.return_value = [self.unit1]
+        with self.assertRaises(model.UnitError):
+            model.block_until_application_idle('app')
+        # Errors in other applications are ignored
+        self.units_with_wl_status_state.return_value = [
+            self.Model_mock.applications['other'].units[0]]
+        model.block_until_application_idle('app')
+
     def block_until_service_status_base(self, rou_return):
 
         async def _block_until(f, timeout=None):
@@ -801,14 +1334,10 @@ class TestModel(ut_utils.BaseTestCase):
 
     def block_until_oslo_config_entries_match_base(self, file_contents,
                                                    expected_contents):
-        async def _scp_from(remote_file, tmpdir):
-            with open('{}/myfile.txt'.format(tmpdir), 'w') as f:
-                f.write(file_contents)
         self.patch_object(model, 'Model')
         self.patch_object(model, 'get_juju_model', return_value='mname')
         self.Model.return_value = self.Model_mock
-        self.unit1.scp_from.side_effect = _scp_from
-        self.unit2.scp_from.side_effect = _scp_from
+        self._remote_file(file_contents)
         model.block_until_oslo_config_entries_match(
             'app',
             '/tmp/src/myfile.txt',
@@ -841,10 +1370,10 @@ disk_formats = ami,ari,aki,vhd,vmdk,raw,qcow2,vdi,iso,root-tar
         self.block_until_oslo_config_entries_match_base(
             file_contents,
             expected_contents)
-        self.unit1.scp_from.assert_called_once_with(
-            '/tmp/src/myfile.txt', mock.ANY)
-        self.unit2.scp_from.assert_called_once_with(
-            '/tmp/src/myfile.txt', mock.ANY)
+        self.assertEqual(
+            self._ssh_commands(self.unit1), ['cat /tmp/src/myfile.txt'])
+        self.assertEqual(
+            self._ssh_commands(self.unit2), ['cat /tmp/src/myfile.txt'])
 
     def test_block_until_oslo_config_entries_match_fail(self):
         file_contents = """
@@ -873,8 +1402,8 @@ disk_formats = ami,ari,aki,vhd,vmdk,raw,qcow2,vdi,iso,root-tar
             self.block_until_oslo_config_entries_match_base(
                 file_contents,
                 expected_contents)
-        self.unit1.scp_from.assert_called_once_with(
-            '/tmp/src/myfile.txt', mock.ANY)
+        self.assertEqual(
+            self._ssh_commands(self.unit1), ['cat /tmp/src/myfile.txt'])
 
     def test_block_until_oslo_config_entries_match_missing_entry(self):
         file_contents = """
@@ -902,8 +1431,8 @@ disk_formats = ami,ari,aki,vhd,vmdk,raw,qcow2,vdi,iso,root-tar
             self.block_until_oslo_config_entries_match_base(
                 file_contents,
                 expected_contents)
-        self.unit1.scp_from.assert_called_once_with(
-            '/tmp/src/myfile.txt', mock.ANY)
+        self.assertEqual(
+            self._ssh_commands(self.unit1), ['cat /tmp/src/myfile.txt'])
 
     def test_block_until_oslo_config_entries_match_missing_section(self):
         file_contents = """
@@ -926,8 +1455,8 @@ disk_formats = ami,ari,aki,vhd,vmdk,raw,qcow2,vdi,iso,root-tar
             self.block_until_oslo_config_entries_match_base(
                 file_contents,
                 expected_contents)
-        self.unit1.scp_from.assert_called_once_with(
-            '/tmp/src/myfile.txt', mock.ANY)
+        self.assertEqual(
+            self._ssh_commands(self.unit1), ['cat /tmp/src/myfile.txt'])
 
     def block_until_services_restarted_base(self, gu_return=None,
                                             gu_raise_exception=False):
@@ -1022,7 +1551,7 @@ disk_formats = ami,ari,aki,vhd,vmdk,raw,qcow2,vdi,iso,root-tar
                 timeout=0.1)
 
     def test_wait_for_agent_status(self):
-        async def _block_until(f, timeout=None):
+        async def _block_until(model, f, timeout=None):
             if not f():
                 raise asyncio.futures.TimeoutError
         self.patch_object(model, 'get_juju_model', return_value='mname')
@@ -1030,17 +1559,19 @@ disk_formats = ami,ari,aki,vhd,vmdk,raw,qcow2,vdi,iso,root-tar
         self.unit1.data = {'agent-status': {'current': 'idle'}}
         self.unit2.data = {'agent-status': {'current': 'executing'}}
         self.Model.return_value = self.Model_mock
-        self.Model_mock.block_until.side_effect = _block_until
+        self.patch_object(model, 'async_block_until_model_state')
+        self.async_block_until_model_state.side_effect = _block_until
         model.wait_for_agent_status(timeout=0.1)
 
     def test_wait_for_agent_status_timeout(self):
-        async def _block_until(f, timeout=None):
+        async def _block_until(model, f, timeout=None):
             if not f():
                 raise asyncio.futures.TimeoutError
         self.patch_object(model, 'get_juju_model', return_value='mname')
         self.patch_object(model, 'Model')
         self.Model.return_value = self.Model_mock
-        self.Model_mock.block_until.side_effect = _block_until
+        self.patch_object(model, 'async_block_until_model_state')
+        self.async_block_until_model_state.side_effect = _block_until
         with self.assertRaises(asyncio.futures.TimeoutError):
             model.wait_for_agent_status(timeout=0.1)
 
@@ -1081,6 +1612,78 @@ disk_formats = ami,ari,aki,vhd,vmdk,raw,qcow2,vdi,iso,root-tar
             ["juju", "upgrade-series", "-m", self.model_name,
              _machine_num, "prepare", _to_series, "--yes"])
 
+    def test_export_bundle(self):
+        async def _export_bundle():
+            return 'applications:\n  app:\n    num_units: 2\n'
+
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self.Model_mock.export_bundle.side_effect = _export_bundle
+        self.assertEqual(
+            model.export_bundle(),
+            {'applications': {'app': {'num_units': 2}}})
+
+    def _application_change_setup(self):
+        async def _change(*args, **kwargs):
+            return
+
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self.app = self.Model_mock.applications['app']
+        self.app.add_unit.side_effect = _change
+        self.app.destroy_unit.side_effect = _change
+        self.app.destroy_relation.side_effect = _change
+        self.Model_mock.add_relation.side_effect = _change
+
+    def test_add_unit(self):
+        self._application_change_setup()
+        model.add_unit('app', count=2)
+        self.app.add_unit.assert_called_once_with(count=2, to=None)
+
+    def test_destroy_unit(self):
+        self._application_change_setup()
+        model.destroy_unit('app', 'app/2', 'app/4')
+        self.app.destroy_unit.assert_called_once_with('app/2', 'app/4')
+
+    def test_add_relation(self):
+        self._application_change_setup()
+        model.add_relation('app:db', 'mysql')
+        self.Model_mock.add_relation.assert_called_once_with(
+            'app:db', 'mysql')
+
+    def test_remove_relation(self):
+        self._application_change_setup()
+        model.remove_relation('app:db', 'mysql:shared-db')
+        self.app.destroy_relation.assert_called_once_with(
+            'db', 'mysql:shared-db')
+
+    def test_prepare_series_upgrade_invalidates_status(self):
+        self.patch_object(model, 'subprocess')
+        self.patch_object(model, 'get_juju_model',
+                          return_value=self.model_name)
+        self.patch('zaza.utilities.juju.invalidate_status_snapshot',
+                   name='invalidate_status_snapshot')
+        model.prepare_series_upgrade("1", to_series="bionic")
+        self.invalidate_status_snapshot.assert_called_once_with(
+            self.model_name)
+
+    def test_set_application_config_invalidates_status(self):
+        async def _set_config(configuration):
+            return
+
+        self.patch_object(model, 'get_juju_model', return_value='mname')
+        self.patch_object(model, 'Model')
+        self.Model.return_value = self.Model_mock
+        self.Model_mock.applications['app'].set_config.side_effect = (
+            _set_config)
+        self.patch('zaza.utilities.juju.invalidate_status_snapshot',
+                   name='invalidate_status_snapshot')
+        model.set_application_config('app', {'key': 'value'},
+                                     model_name='mname')
+        self.invalidate_status_snapshot.assert_called_once_with('mname')
+
     def test_complete_series_upgrade(self):
         self.patch_object(model, 'get_juju_model',
                           return_value=self.model_name)
@@ -1137,3 +1740,105 @@ class AsyncModelTests(aiounittest.AsyncTestCase):
             return True
 
         await model.async_block_until(_f, _g, timeout=0.1)
+
+    async def test_async_block_until_backoff(self):
+        self.calls = 0
+
+        async def _f():
+            self.calls += 1
+            return False
+
+        with self.assertRaises(asyncio.futures.TimeoutError):
+            await model.async_block_until(_f, timeout=0.35, wait_period=0.05,
+                                          max_wait_period=1, backoff=2)
+        # Evaluated at 0, 0.05, 0.15 and 0.35 rather than every 0.05
+        self.assertLess(self.calls, 5)
+
+    async def test_async_block_until_model_state(self):
+        model_mock = mock.MagicMock()
+        model_mock._observers = {}
+        self.state = False
+        self.observers = []
+
+        def _add_observer(callable_, entity_type=None):
+            self.observers.append(callable_)
+            model_mock._observers[entity_type] = callable_
+        model_mock.add_observer.side_effect = _add_observer
+
+        async def _change_state():
+            await asyncio.sleep(0.01)
+            self.state = True
+            await self.observers[0](None, None, None, model_mock)
+
+        asyncio.ensure_future(_change_state())
+        await model.async_block_until_model_state(
+            model_mock,
+            lambda: self.state,
+            timeout=1,
+            max_wait_period=10)
+        model_mock.add_observer.assert_has_calls([
+            mock.call(mock.ANY, entity_type='unit'),
+            mock.call(mock.ANY, entity_type='application')])
+        # The observers are removed once done
+        self.assertEqual(model_mock._observers, {})
+
+    async def test_async_block_until_model_state_disconnected(self):
+        model_mock = mock.MagicMock()
+        model_mock._observers = {'other': 'observer'}
+        model_mock.add_observer.side_effect = (
+            lambda callable_, entity_type=None:
+                model_mock._observers.update({entity_type: callable_}))
+        model_mock.is_connected.return_value = False
+        with self.assertRaises(websockets.ConnectionClosed):
+            await model.async_block_until_model_state(
+                model_mock,
+                lambda: False)
+        self.assertEqual(model_mock._observers, {'other': 'observer'})
+
+    async def test_async_block_until_model_state_timeout(self):
+        model_mock = mock.MagicMock()
+        with self.assertRaises(asyncio.futures.TimeoutError):
+            await model.async_block_until_model_state(
+                model_mock,
+                lambda: False,
+                timeout=0.1)
+
+    async def test_async_fan_out(self):
+        async def _double(x):
+            return x * 2
+
+        self.assertEqual(
+            await model.async_fan_out(_double, {'a': 1, 'b': 2}),
+            {'a': 2, 'b': 4})
+
+    async def test_async_fan_out_concurrency(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        async def _f(x):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            return x
+
+        targets = {str(i): i for i in range(10)}
+        self.assertEqual(
+            await model.async_fan_out(_f, targets, concurrency=3),
+            targets)
+        self.assertEqual(self.max_in_flight, 3)
+
+    async def test_async_fan_out_errors(self):
+        async def _f(x):
+            if x > 1:
+                raise ValueError(x)
+            return x
+
+        targets = {'a': 1, 'b': 2, 'c': 3}
+        with self.assertRaises(model.FanOutError) as error:
+            await model.async_fan_out(_f, targets)
+        self.assertEqual(sorted(error.exception.errors.keys()), ['b', 'c'])
+        results = await model.async_fan_out(_f, targets,
+                                            return_exceptions=True)
+        self.assertEqual(results['a'], 1)
+        self.assertIsInstance(results['b'], ValueError)
@@ -119,3 +119,146 @@ class TestUtilitiesBundle(ut_utils.BaseTestCase):
             '-o', 'bundle_out.yaml'])
         self.assertEqual(args.input, 'bundle.yaml')
         self.assertEqual(args.output, 'bundle_out.yaml')
+
+    def test_get_applications(self):
+        self.assertEqual(
+            bundle.get_applications({'applications': {'app': {}}}),
+            {'app': {}})
+        self.assertEqual(
+            bundle.get_applications({'services': {'app': {}}}),
+            {'app': {}})
+        self.assertEqual(bundle.get_applications({}), {})
+
+    def test_merge_overlays(self):
+        base = yaml.safe_load(TEST_BUNDLE_WITHOUT_PLACEMENT)
+        overlays = [
+            {'applications': {
+                'ceph-mon': {'options': {'source': 'distro'}},
+                'ceph-radosgw': {'charm': 'cs:ceph-radosgw', 'num_units': 1}},
+             'relations': [['ceph-radosgw:mon', 'ceph-mon:radosgw']]},
+            {'applications': {'ceph-osd': None}}]
+        merged = bundle.merge_overlays(base, overlays)
+        self.assertNotIn('services', merged)
+        self.assertEqual(
+            sorted(merged['applications'].keys()),
+            ['ceph-mon', 'ceph-radosgw'])
+        self.assertEqual(
+            merged['applications']['ceph-mon']['options'],
+            {'expected-osd-count': 3, 'source': 'distro'})
+        # Relations of removed applications are dropped
+        self.assertEqual(
+            merged['relations'],
+            [['ceph-radosgw:mon', 'ceph-mon:radosgw']])
+        # The input bundle is left untouched
+        self.assertEqual(base, yaml.safe_load(TEST_BUNDLE_WITHOUT_PLACEMENT))
+
+    def test_relations_match(self):
+        self.assertTrue(bundle.relations_match(
+            ['ceph-osd:mon', 'ceph-mon:osd'],
+            ['ceph-mon:osd', 'ceph-osd:mon']))
+        self.assertTrue(bundle.relations_match(
+            ['ceph-osd', 'ceph-mon'],
+            ['ceph-mon:osd', 'ceph-osd:mon']))
+        self.assertFalse(bundle.relations_match(
+            ['ceph-osd:mon', 'ceph-mon:osd'],
+            ['ceph-osd:mon', 'ceph-mon:admin']))
+
+    def test_diff_bundle(self):
+        target = {
+            'applications': {
+                'ceph-mon': {'num_units': 3,
+                             'options': {'source': 'distro',
+                                         'expected-osd-count': 3}},
+                'ceph-osd': {'num_units': 2},
+                'ceph-radosgw': {'num_units': 1},
+                'telegraf': {'options': {'debug': True}}},
+            'relations': [
+                ['ceph-osd:mon', 'ceph-mon:osd'],
+                ['ceph-radosgw', 'ceph-mon'],
+                ['telegraf', 'ceph-mon']]}
+        live = {
+            'applications': {
+                'ceph-mon': {'num_units': 1,
+                             'options': {'source': 'cloud:bionic-rocky',
+                                         'expected-osd-count': '3'}},
+                'ceph-osd': {'num_units': 3},
+                'telegraf': {'options': {'debug': 'true'}},
+                'ceph-fs': {'num_units': 1}},
+            'relations': [
+                ['ceph-mon:osd', 'ceph-osd:mon'],
+                ['ceph-mon:juju-info', 'telegraf:juju-info'],
+                ['ceph-mon:admin', 'ceph-osd:admin'],
+                ['ceph-fs:ceph-mds', 'ceph-mon:mds']]}
+        delta = bundle.diff_bundle(target, live)
+        self.assertEqual(delta, {
+            'add_applications': ['ceph-radosgw'],
+            'remove_applications': ['ceph-fs'],
+            'config': {'ceph-mon': {'source': 'distro'}},
+            'add_units': {'ceph-mon': 2},
+            'remove_units': {'ceph-osd': 1},
+            'add_relations': [['ceph-radosgw', 'ceph-mon']],
+            'remove_relations': [['ceph-mon:admin', 'ceph-osd:admin']]})
+        self.assertEqual(
+            bundle.get_changed_applications(delta),
+            ['ceph-mon', 'ceph-osd', 'ceph-radosgw'])
+
+    def test_diff_bundle_defaults(self):
+        target = {
+            'applications': {
+                'keystone': {'num_units': 1,
+                             'options': {'debug': False,
+                                         'worker-multiplier': 0.25,
+                                         'admin-role': 'Admin'}}}}
+        live = {
+            'applications': {
+                'keystone': {'num_units': 1,
+                             'options': {'worker-multiplier': 0.25}}}}
+        config = {
+            'debug': {'default': False, 'value': False, 'source': 'default'},
+            'worker-multiplier': {'value': 0.25, 'source': 'user'},
+            'admin-role': {'default': 'Admin', 'source': 'default'}}
+        # Without the charm defaults, options at their default look changed
+        self.assertEqual(
+            bundle.diff_bundle(target, live)['config'],
+            {'keystone': {'debug': 'false', 'admin-role': 'Admin'}})
+        delta = bundle.diff_bundle(
+            target, live,
+            live_options={'keystone': bundle.get_effective_options(config)})
+        self.assertEqual(delta['config'], {})
+        self.assertEqual(bundle.get_changed_applications(delta), [])
+
+    def test_diff_bundle_option_types(self):
+        target = {
+            'applications': {
+                'keystone': {'num_units': 1,
+                             'options': {'debug': 'True',
+                                         'worker-multiplier': 1,
+                                         'workers': '4',
+                                         'admin-role': 1}}}}
+        live = {
+            'applications': {
+                'keystone': {'num_units': 1,
+                             'options': {'debug': True,
+                                         'worker-multiplier': 1.0,
+                                         'workers': 4,
+                                         'admin-role': 1.0}}}}
+        config = {
+            'debug': {'type': 'boolean', 'value': True},
+            'worker-multiplier': {'type': 'float', 'value': 1.0},
+            'workers': {'type': 'int', 'value': 4},
+            'admin-role': {'type': 'string', 'value': '1.0'}}
+        option_types = bundle.get_option_types(config)
+        self.assertEqual(option_types['workers'], 'int')
+        # Without the types the values are compared as strings
+        self.assertEqual(
+            bundle.diff_bundle(target, live)['config'],
+            {'keystone': {'debug': 'True', 'worker-multiplier': '1',
+                          'admin-role': '1'}})
+        delta = bundle.diff_bundle(
+            target, live, option_types={'keystone': option_types})
+        self.assertEqual(delta['config'], {'keystone': {'admin-role': '1'}})
+
+    def test_diff_bundle_no_changes(self):
+        base = yaml.safe_load(TEST_BUNDLE_WITHOUT_PLACEMENT)
+        delta = bundle.diff_bundle(base, base)
+        self.assertEqual(bundle.get_changed_applications(delta), [])
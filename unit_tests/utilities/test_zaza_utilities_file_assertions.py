@@ -20,35 +20,50 @@ import zaza.utilities.file_assertions as file_assertions
 class TestFileAssertionUtils(ut_utils.BaseTestCase):
     def setUp(self):
         super(TestFileAssertionUtils, self).setUp()
-        # Patch all run_on_unit calls
+        # Patch all run_on_units calls
         self.patch(
-            'zaza.utilities.file_assertions.model.run_on_unit',
+            'zaza.utilities.file_assertions.model.run_on_units',
             new_callable=mock.MagicMock(),
-            name='run_on_unit'
+            name='run_on_units'
         )
         self._assert = mock.MagicMock()
         self._assert.assertEqual = mock.MagicMock()
 
     def test_path_glob(self):
-        self.run_on_unit.return_value = {
-            'Stdout': 'file-name root root 600'
+        self.run_on_units.return_value = {
+            'test/0': {'Stdout': 'file-name root root 600'}
         }
         file_details = {'path': '*'}
         file_assertions.assert_path_glob(
             self._assert, 'test/0', file_details)
-        self.run_on_unit.assert_called_once_with(
-            'test/0', 'bash -c "shopt -s -q globstar;'
+        self.run_on_units.assert_called_once_with(
+            ['test/0'], 'bash -c "shopt -s -q globstar;'
             ' stat -c "%n %U %G %a" *"')
 
+    def test_path_glob_units(self):
+        self.run_on_units.return_value = {
+            'test/0': {'Stdout': 'file-name root root 600'},
+            'test/1': {'Stdout': 'file-name root root 644'}
+        }
+        file_details = {'path': '*'}
+        file_assertions.assert_path_glob(
+            self._assert, ['test/0', 'test/1'], file_details)
+        self.run_on_units.assert_called_once_with(
+            ['test/0', 'test/1'], 'bash -c "shopt -s -q globstar;'
+            ' stat -c "%n %U %G %a" *"')
+        self._assert.assertEqual.assert_any_call(
+            '600', '644',
+            'Mode is incorrect for file-name on test/1: 644')
+
     def test_single_path(self):
-        self.run_on_unit.return_value = {
-            'Stdout': 'root root 600'
+        self.run_on_units.return_value = {
+            'test/0': {'Stdout': 'root root 600'}
         }
         file_details = {'path': 'test'}
         file_assertions.assert_single_file(
             self._assert, 'test/0', file_details)
-        self.run_on_unit.assert_called_once_with(
-            'test/0', 'stat -c "%U %G %a" test')
+        self.run_on_units.assert_called_once_with(
+            ['test/0'], 'stat -c "%U %G %a" test')
 
     def test_error_message_glob(self):
         message = file_assertions._error_message(
@@ -12,10 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import mock
 import unit_tests.utils as ut_utils
+import zaza.model as zaza_model
 from zaza.utilities import generic as generic_utils
 import zaza.utilities.exceptions as zaza_exceptions
+from zaza.utilities import openstack as openstack_utils
+from zaza.utilities import upgrade_state
 
 FAKE_STATUS = {
     'can-upgrade-to': '',
@@ -53,6 +57,7 @@ class TestGenericUtils(ut_utils.BaseTestCase):
         self.juju_status.applications.__getitem__.return_value = FAKE_STATUS
         self.patch_object(generic_utils, "model")
         self.model.get_status.return_value = self.juju_status
+        self.model.in_model_context.side_effect = lambda func: func
 
     def test_dict_to_yaml(self):
         _dict_data = {"key": "value"}
@@ -93,31 +98,37 @@ class TestGenericUtils(ut_utils.BaseTestCase):
         self.get_undercloud_env_vars.assert_called_once_with()
 
     def test_get_pkg_version(self):
-        self.patch_object(generic_utils.model, "get_units")
-        self.patch_object(generic_utils.juju_utils, "remote_run")
+        self.patch_object(generic_utils.model, "run_on_application")
         _pkg = "os-thingy"
         _version = "2:27.0.0-0ubuntu1~cloud0"
         _dpkg_output = ("ii {} {} all OpenStack thingy\n"
                         .format(_pkg, _version))
-        self.remote_run.return_value = _dpkg_output
-        _unit1 = mock.MagicMock()
-        _unit1.entity_id = "os-thingy/7"
-        _unit2 = mock.MagicMock()
-        _unit2.entity_id = "os-thingy/12"
-        _units = [_unit1, _unit2]
-        self.get_units.return_value = _units
+        self.run_on_application.return_value = {
+            "os-thingy/7": {"Code": "0", "Stdout": _dpkg_output},
+            "os-thingy/12": {"Code": "0", "Stdout": _dpkg_output}}
 
         # Matching
         self.assertEqual(generic_utils.get_pkg_version(_pkg, _pkg),
                          _version)
+        self.run_on_application.assert_called_once_with(
+            _pkg, "dpkg -l | grep {}".format(_pkg))
 
         # Mismatched
         _different_dpkg_output = ("ii {} {} all OpenStack thingy\n"
                                   .format(_pkg, "DIFFERENT"))
-        self.remote_run.side_effect = [_dpkg_output, _different_dpkg_output]
+        self.run_on_application.return_value = {
+            "os-thingy/7": {"Code": "0", "Stdout": _dpkg_output},
+            "os-thingy/12": {"Code": "0", "Stdout": _different_dpkg_output}}
         with self.assertRaises(Exception):
             generic_utils.get_pkg_version(_pkg, _pkg)
 
+        # Failed
+        self.model.CommandRunFailed = zaza_model.CommandRunFailed
+        self.run_on_application.return_value = {
+            "os-thingy/7": {"Code": "1", "Stdout": "", "Stderr": "no"}}
+        with self.assertRaises(zaza_model.CommandRunFailed):
+            generic_utils.get_pkg_version(_pkg, _pkg)
+
     def test_get_undercloud_env_vars(self):
         self.patch_object(generic_utils.os.environ, "get")
 
@@ -167,10 +178,13 @@ class TestGenericUtils(ut_utils.BaseTestCase):
         self._open.assert_called_once_with(_filename, "r")
 
     def test_do_release_upgrade(self):
+        self.patch_object(generic_utils.model, "get_juju_model",
+                          return_value="mname")
         _unit = "app/2"
         generic_utils.do_release_upgrade(_unit)
         self.subprocess.check_call.assert_called_once_with(
-            ['juju', 'ssh', _unit, 'sudo', 'DEBIAN_FRONTEND=noninteractive',
+            ['juju', 'ssh', '-m', 'mname', _unit, 'sudo',
+             'DEBIAN_FRONTEND=noninteractive',
              'do-release-upgrade', '-f', 'DistUpgradeViewNonInteractive'])
 
     def test_wrap_do_release_upgrade(self):
@@ -195,19 +209,46 @@ class TestGenericUtils(ut_utils.BaseTestCase):
         self.do_release_upgrade.assert_called_once_with(_unit)
 
     def test_reboot(self):
+        self.patch_object(generic_utils.model, "get_juju_model",
+                          return_value="mname")
+        self.patch_object(generic_utils, "close_ssh_connection")
         _unit = "app/2"
         generic_utils.reboot(_unit)
+        self.close_ssh_connection.assert_called_once_with(
+            _unit, model_name=None)
         self.subprocess.check_call.assert_called_once_with(
-            ['juju', 'ssh', _unit,
+            ['juju', 'ssh', '-m', 'mname', _unit,
              'sudo', 'reboot', '&&', 'exit'])
 
+    def test_close_ssh_connection(self):
+        self.patch_object(generic_utils.model, "get_juju_model",
+                          return_value="mname")
+        self.patch_object(generic_utils.ssh, "multiplex_options",
+                          return_value=['-o', 'ControlMaster=auto'])
+        _unit = "app/2"
+        generic_utils.close_ssh_connection(_unit)
+        self.subprocess.call.assert_called_once_with(
+            ['juju', 'ssh', '-m', 'mname', _unit,
+             '-o', 'ControlMaster=auto', '-O', 'exit'],
+            stdout=self.subprocess.DEVNULL,
+            stderr=self.subprocess.DEVNULL)
+
     def test_run_via_ssh(self):
+        self.patch_object(generic_utils.model, "get_juju_model",
+                          return_value="mname")
+        self.patch_object(generic_utils.ssh, "multiplex_options",
+                          return_value=['-o', 'ControlMaster=auto'])
         _unit = "app/2"
         _cmd = "hostname"
         generic_utils.run_via_ssh(_unit, _cmd)
         self.subprocess.check_call.assert_called_once_with(
-            ['juju', 'ssh', _unit,
-             'sudo ' + _cmd])
+            ['juju', 'ssh', '-m', 'mname', _unit,
+             '-o', 'ControlMaster=auto', 'sudo ' + _cmd])
+        self.subprocess.check_call.reset_mock()
+        generic_utils.run_via_ssh(_unit, _cmd, model_name='other')
+        self.subprocess.check_call.assert_called_once_with(
+            ['juju', 'ssh', '-m', 'other', _unit,
+             '-o', 'ControlMaster=auto', 'sudo ' + _cmd])
 
     def test_set_origin(self):
         "application, origin='openstack-origin', pocket='distro'):"
@@ -215,9 +256,15 @@ class TestGenericUtils(ut_utils.BaseTestCase):
         _application = "application"
         _origin = "source"
         _pocket = "cloud:fake-cloud"
+        openstack_utils.OS_VERSIONS['mname'] = {'application': 'queens'}
+        self.addCleanup(openstack_utils.clear_os_versions_cache)
+        self.patch_object(generic_utils.model, "get_juju_model",
+                          return_value="mname")
         generic_utils.set_origin(_application, origin=_origin, pocket=_pocket)
         self.set_application_config.assert_called_once_with(
             _application, {_origin: _pocket})
+        # The OpenStack versions found before the upgrade are dropped
+        self.assertEqual(openstack_utils.OS_VERSIONS, {})
 
     def test_series_upgrade(self):
         self.patch_object(generic_utils.model, "block_until_all_units_idle")
@@ -251,6 +298,97 @@ class TestGenericUtils(ut_utils.BaseTestCase):
         self.set_origin.assert_called_once_with(_application, _origin)
         self.reboot.assert_called_once_with(_unit)
 
+    def test_series_upgrade_batch(self):
+        self.patch_object(generic_utils, "set_origin")
+        self.patch_object(generic_utils, "wrap_do_release_upgrade")
+        self.patch_object(generic_utils, "reboot")
+        self.patch_object(generic_utils, "set_dpkg_non_interactive_on_unit")
+        _state = upgrade_state.SeriesUpgradeState()
+        generic_utils.series_upgrade(
+            "app/2", "4", origin="source", to_series="bionic",
+            from_series="xenial", state=_state, batch=True)
+        # Only the application is waited on, the origin, series and wait
+        # on the model are left to the caller
+        self.assertFalse(self.model.block_until_all_units_idle.called)
+        self.model.block_until_application_idle.assert_has_calls(
+            [mock.call("app")] * 3)
+        self.assertFalse(self.set_origin.called)
+        self.assertFalse(self.model.set_series.called)
+        self.model.complete_series_upgrade.assert_called_once_with("4")
+        self.assertEqual(_state.steps_done("4"),
+                         list(upgrade_state.STEPS[:-1]))
+
+    def test_series_upgrade_resume(self):
+        self.patch_object(generic_utils, "set_origin")
+        self.patch_object(generic_utils, "wrap_do_release_upgrade")
+        self.patch_object(generic_utils, "reboot")
+        self.patch_object(generic_utils, "set_dpkg_non_interactive_on_unit")
+        _state = upgrade_state.SeriesUpgradeState()
+        _state.mark_done("4", upgrade_state.PREPARE)
+        _state.mark_done("4", upgrade_state.RELEASE_UPGRADE)
+        generic_utils.series_upgrade(
+            "app/2", "4", origin="source",
+            to_series="bionic", from_series="xenial", state=_state)
+        self.assertFalse(self.set_dpkg_non_interactive_on_unit.called)
+        self.assertFalse(self.model.prepare_series_upgrade.called)
+        self.assertFalse(self.wrap_do_release_upgrade.called)
+        self.reboot.assert_called_once_with("app/2")
+        self.set_origin.assert_called_once_with("app", "source")
+        self.model.complete_series_upgrade.assert_called_once_with("4")
+        self.model.set_series.assert_called_once_with("app", "bionic")
+        self.assertEqual(_state.steps_done("4"), list(upgrade_state.STEPS))
+        self.assertTrue(_state.is_complete("4"))
+
+    def test_series_upgrade_resume_after_prepare(self):
+        self.patch_object(generic_utils, "set_origin")
+        self.patch_object(generic_utils, "wrap_do_release_upgrade")
+        self.patch_object(generic_utils, "reboot")
+        self.patch_object(generic_utils, "set_dpkg_non_interactive_on_unit")
+        self.model.block_until_unit_wl_status.side_effect = (
+            zaza_model.ModelTimeout("timed out"))
+        _state = upgrade_state.SeriesUpgradeState()
+        with self.assertRaises(zaza_model.ModelTimeout):
+            generic_utils.series_upgrade(
+                "app/2", "4", origin="source",
+                to_series="bionic", from_series="xenial", state=_state)
+        # The prepare ran, waiting on the unit afterwards did not finish
+        self.model.prepare_series_upgrade.assert_called_once_with(
+            "4", to_series="bionic")
+        self.assertEqual(_state.steps_done("4"), [upgrade_state.PREPARE])
+        self.model.block_until_unit_wl_status.side_effect = None
+        generic_utils.series_upgrade(
+            "app/2", "4", origin="source",
+            to_series="bionic", from_series="xenial", state=_state)
+        # The prepare is not issued again but the unit is waited on again
+        self.assertEqual(self.model.prepare_series_upgrade.call_count, 1)
+        self.model.block_until_unit_wl_status.assert_has_calls([
+            mock.call("app/2", "blocked"),
+            mock.call("app/2", "blocked"),
+            mock.call("app/2", "blocked"),
+            mock.call("app/2", "active")])
+        self.wrap_do_release_upgrade.assert_called_once_with(
+            "app/2", from_series="xenial", to_series="bionic", files=None,
+            workaround_script=None)
+        self.assertTrue(_state.is_complete("4"))
+
+    def test_series_upgrade_application_state(self):
+        self.patch_object(generic_utils, "series_upgrade")
+        self.patch_object(generic_utils, "set_origin")
+        _state = upgrade_state.SeriesUpgradeState()
+        for step in upgrade_state.STEPS:
+            _state.mark_done("0", step)
+        generic_utils.series_upgrade_application(
+            "app", origin="source", pause_non_leader_primary=False,
+            pause_non_leader_subordinate=False,
+            to_series="bionic", from_series="xenial", state=_state)
+        # The leader has been upgraded already, the origin is set again
+        # after each batch of non-leaders
+        self.assertEqual(self.set_origin.call_args_list,
+                         [mock.call("app", "source")] * 3)
+        self.assertEqual(
+            [c[0] for c in self.series_upgrade.call_args_list],
+            [("app/1", "1"), ("app/2", "2")])
+
     def test_series_upgrade_application_pause_peers_and_subordinates(self):
         self.patch_object(generic_utils.model, "run_action")
         self.patch_object(generic_utils, "series_upgrade")
@@ -271,12 +409,18 @@ class TestGenericUtils(ut_utils.BaseTestCase):
             mock.call("{}/2".format(_application), "pause", action_params={}),
         ]
         _series_upgrade_calls = []
-        for machine_num in ("0", "1", "2"):
+        _series_upgrade_calls.append(
+            mock.call("{}/0".format(_application), "0", origin=_origin,
+                      from_series=_from_series, to_series=_to_series,
+                      workaround_script=_workaround_script, files=_files,
+                      state=None))
+        for machine_num in ("1", "2"):
             _series_upgrade_calls.append(
                 mock.call("{}/{}".format(_application, machine_num),
                           machine_num, origin=_origin,
                           from_series=_from_series, to_series=_to_series,
-                          workaround_script=_workaround_script, files=_files),
+                          workaround_script=_workaround_script, files=_files,
+                          state=None, batch=True),
             )
 
         # Pause primary peers and subordinates
@@ -290,6 +434,26 @@ class TestGenericUtils(ut_utils.BaseTestCase):
         self.run_action.assert_has_calls(_run_action_calls)
         self.series_upgrade.assert_has_calls(_series_upgrade_calls)
 
+    def test_series_upgrade_application_pause_resume(self):
+        self.patch_object(generic_utils.model, "run_action")
+        self.patch_object(generic_utils, "series_upgrade")
+        _state = upgrade_state.SeriesUpgradeState()
+        for step in upgrade_state.STEPS:
+            _state.mark_done("1", step)
+        generic_utils.series_upgrade_application(
+            "app", origin="source",
+            to_series="bionic", from_series="xenial",
+            pause_non_leader_primary=True,
+            pause_non_leader_subordinate=True,
+            state=_state)
+        # app/1 has been upgraded already so it is not paused again
+        self.assertEqual(self.run_action.call_args_list, [
+            mock.call("app-hacluster/2", "pause", action_params={}),
+            mock.call("app/2", "pause", action_params={})])
+        self.assertEqual(
+            [c[0] for c in self.series_upgrade.call_args_list],
+            [("app/0", "0"), ("app/2", "2")])
+
     def test_series_upgrade_application_pause_subordinates(self):
         self.patch_object(generic_utils.model, "run_action")
         self.patch_object(generic_utils, "series_upgrade")
@@ -309,12 +473,18 @@ class TestGenericUtils(ut_utils.BaseTestCase):
         ]
         _series_upgrade_calls = []
 
-        for machine_num in ("0", "1", "2"):
+        _series_upgrade_calls.append(
+            mock.call("{}/0".format(_application), "0", origin=_origin,
+                      from_series=_from_series, to_series=_to_series,
+                      workaround_script=_workaround_script, files=_files,
+                      state=None))
+        for machine_num in ("1", "2"):
             _series_upgrade_calls.append(
                 mock.call("{}/{}".format(_application, machine_num),
                           machine_num, origin=_origin,
                           from_series=_from_series, to_series=_to_series,
-                          workaround_script=_workaround_script, files=_files),
+                          workaround_script=_workaround_script, files=_files,
+                          state=None, batch=True),
             )
 
         # Pause subordinates
@@ -340,12 +510,18 @@ class TestGenericUtils(ut_utils.BaseTestCase):
         _workaround_script = "scriptname"
         _completed_machines = []
 
-        for machine_num in ("0", "1", "2"):
+        _series_upgrade_calls.append(
+            mock.call("{}/0".format(_application), "0", origin=_origin,
+                      from_series=_from_series, to_series=_to_series,
+                      workaround_script=_workaround_script, files=_files,
+                      state=None))
+        for machine_num in ("1", "2"):
             _series_upgrade_calls.append(
                 mock.call("{}/{}".format(_application, machine_num),
                           machine_num, origin=_origin,
                           from_series=_from_series, to_series=_to_series,
-                          workaround_script=_workaround_script, files=_files),
+                          workaround_script=_workaround_script, files=_files,
+                          state=None, batch=True),
             )
 
         # No Pausiing
@@ -359,6 +535,109 @@ class TestGenericUtils(ut_utils.BaseTestCase):
         self.run_action.assert_not_called()
         self.series_upgrade.assert_has_calls(_series_upgrade_calls)
 
+    def test_series_upgrade_application_batches(self):
+        self.patch_object(generic_utils, "series_upgrade")
+        _completed_machines = []
+        generic_utils.series_upgrade_application(
+            "app", origin="source",
+            to_series="bionic", from_series="xenial",
+            completed_machines=_completed_machines,
+            batch_size=2)
+        self.assertEqual(self.series_upgrade.call_count, 3)
+        self.assertEqual(self.series_upgrade.call_args_list[0],
+                         mock.call("app/0", "0", origin="source",
+                                   from_series="xenial", to_series="bionic",
+                                   workaround_script=None, files=None,
+                                   state=None))
+        self.assertEqual(
+            sorted(c[0] for c in self.series_upgrade.call_args_list[1:]),
+            [("app/1", "1"), ("app/2", "2")])
+        self.assertTrue(self.series_upgrade.call_args_list[1][1]["batch"])
+        self.assertEqual(_completed_machines, ["0", "1", "2"])
+        # The series of the application is set once for the batch
+        self.model.set_series.assert_called_once_with("app", "bionic")
+
+    def test_series_upgrade_non_leaders_state(self):
+        self.patch_object(generic_utils, "series_upgrade")
+        self.patch_object(generic_utils, "set_origin")
+        _state = upgrade_state.SeriesUpgradeState()
+        generic_utils.series_upgrade_non_leaders(
+            ["app/1", "app/2"], FAKE_STATUS, [], batch_size=2,
+            origin="source", to_series="bionic", state=_state)
+        self.set_origin.assert_called_once_with("app", "source")
+        self.model.block_until_all_units_idle.assert_called_once_with()
+        self.model.set_series.assert_called_once_with("app", "bionic")
+        self.assertEqual(_state.steps_done("1"), [upgrade_state.SET_SERIES])
+        self.assertEqual(_state.steps_done("2"), [upgrade_state.SET_SERIES])
+
+    def test_series_upgrade_non_leaders_resume(self):
+        self.patch_object(generic_utils, "series_upgrade")
+        self.patch_object(generic_utils, "set_origin")
+
+        def _series_upgrade(unit, machine, **kwargs):
+            if unit == "app/2":
+                raise Exception("do-release-upgrade failed")
+        self.series_upgrade.side_effect = _series_upgrade
+        _completed_machines = []
+        with self.assertRaises(zaza_exceptions.SeriesUpgradeFailed) as ctxt:
+            generic_utils.series_upgrade_non_leaders(
+                ["app/1", "app/2"], FAKE_STATUS, _completed_machines,
+                batch_size=2, origin="source", to_series="bionic")
+        self.assertEqual(str(ctxt.exception.__cause__),
+                         "do-release-upgrade failed")
+        # The unit which finished is recorded
+        self.assertEqual(_completed_machines, ["1"])
+        self.set_origin.assert_called_once_with("app", "source")
+
+        # Running again only upgrades the unit that failed
+        self.series_upgrade.reset_mock()
+        self.series_upgrade.side_effect = None
+        self.set_origin.reset_mock()
+        generic_utils.series_upgrade_non_leaders(
+            ["app/1", "app/2"], FAKE_STATUS, _completed_machines,
+            batch_size=2, origin="source", to_series="bionic")
+        self.series_upgrade.assert_called_once_with(
+            "app/2", "2", origin="source", to_series="bionic", state=None,
+            batch=True)
+        # Once for the unit skipped and once for the batch
+        self.assertEqual(self.set_origin.call_count, 2)
+        self.assertEqual(_completed_machines, ["1", "2"])
+
+    def test_get_charm_name(self):
+        for url in ("percona-cluster", "cs:percona-cluster-276",
+                    "cs:~openstack-charmers/xenial/percona-cluster-290",
+                    "local:trusty/percona-cluster-0"):
+            self.assertEqual(generic_utils.get_charm_name(url),
+                             "percona-cluster")
+        self.assertEqual(generic_utils.get_charm_name("cs:vault-kv-3"),
+                         "vault-kv")
+
+    def test_get_series_upgrade_batch_size(self):
+        self.assertEqual(
+            generic_utils.get_series_upgrade_batch_size(FAKE_STATUS), 1)
+        self.assertEqual(
+            generic_utils.get_series_upgrade_batch_size(FAKE_STATUS, 3), 3)
+        _status = copy.deepcopy(FAKE_STATUS)
+        _status["charm"] = "cs:percona-cluster-276"
+        # One of three units may be down at a time
+        self.assertEqual(
+            generic_utils.get_series_upgrade_batch_size(_status, 3), 1)
+        for unit in ("app/3", "app/4"):
+            _status["units"][unit] = {"machine": unit[-1]}
+        # Two of five
+        self.assertEqual(
+            generic_utils.get_series_upgrade_batch_size(_status, 3), 2)
+        _status["units"] = {"app/0": {"machine": "0"}}
+        self.assertEqual(
+            generic_utils.get_series_upgrade_batch_size(_status, 3), 1)
+        # Charms whose name only contains that of a quorum charm are not
+        # capped
+        _status = copy.deepcopy(FAKE_STATUS)
+        for charm in ("cs:vault-kv-3", "cs:mongodb-exporter-1"):
+            _status["charm"] = charm
+            self.assertEqual(
+                generic_utils.get_series_upgrade_batch_size(_status, 3), 3)
+
     def test_set_dpkg_non_interactive_on_unit(self):
         self.patch_object(generic_utils, "model")
         _unit_name = "app/1"
@@ -409,14 +688,13 @@ class TestGenericUtils(ut_utils.BaseTestCase):
                                               command=cmd)
 
     def test_get_unit_process_ids(self):
-        self.patch(
-            "zaza.utilities.generic.get_process_id_list",
-            new_callable=mock.MagicMock(),
-            name="_get_pids"
-        )
+        self.patch_object(generic_utils.model, "run_on_units")
 
-        pids = ["1", "2"]
-        self._get_pids.return_value = pids
+        def _run_on_units(unit_names, cmd):
+            return {
+                unit_name: {"Code": 0, "Stdout": "1 2", "Stderr": ""}
+                for unit_name in unit_names}
+        self.run_on_units.side_effect = _run_on_units
         unit_processes = {
             "ceph-osd/0": {
                 "ceph-osd": 2
@@ -424,6 +702,10 @@ class TestGenericUtils(ut_utils.BaseTestCase):
             "unit/0": {
                 "pr1": 2,
                 "pr2": 2
+            },
+            "unit/1": {
+                "pr2": 2,
+                "pr1": 2
             }
         }
         expected = {
@@ -433,10 +715,26 @@ class TestGenericUtils(ut_utils.BaseTestCase):
             "unit/0": {
                 "pr1": ["1", "2"],
                 "pr2": ["1", "2"]
+            },
+            "unit/1": {
+                "pr2": ["1", "2"],
+                "pr1": ["1", "2"]
             }
         }
         result = generic_utils.get_unit_process_ids(unit_processes)
         self.assertEqual(result, expected)
+        self.assertEqual(list(result["unit/1"].keys()), ["pr2", "pr1"])
+        self.run_on_units.assert_has_calls([
+            mock.call(["ceph-osd/0"], 'pidof -x "ceph-osd"'),
+            mock.call(["unit/0", "unit/1"], 'pidof -x "pr1"'),
+            mock.call(["unit/0", "unit/1"], 'pidof -x "pr2"')])
+
+    def test_get_unit_process_ids_fail(self):
+        self.patch_object(generic_utils.model, "run_on_units")
+        self.run_on_units.return_value = {
+            "unit/0": {"Code": 1, "Stdout": "", "Stderr": "Failed"}}
+        with self.assertRaises(zaza_exceptions.ProcessIdsFailed):
+            generic_utils.get_unit_process_ids({"unit/0": {"pr1": 1}})
 
     def test_validate_unit_process_ids(self):
         expected = {
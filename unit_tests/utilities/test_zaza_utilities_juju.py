@@ -36,8 +36,10 @@ class TestJujuUtils(ut_utils.BaseTestCase):
             "subordinate-to": [self.application]}
         self.juju_status = mock.MagicMock()
         self.juju_status.name = "juju_status_object"
-        self.juju_status.applications.get.return_value = self.application_data
-        self.juju_status.machines.get.return_value = self.machine_data
+        self.juju_status.applications = {
+            self.application: self.application_data,
+            self.subordinate_application: self.subordinate_application_data}
+        self.juju_status.machines = {self.machine: self.machine_data}
 
         # Model
         self.patch_object(juju_utils, "model")
@@ -48,6 +50,8 @@ class TestJujuUtils(ut_utils.BaseTestCase):
         self.error_run_output = {"Code": "1", "Stderr": "ERROR", "Stdout": ""}
         self.model.run_on_unit.return_value = self.run_output
 
+        juju_utils.STATUS_SNAPSHOTS.clear()
+
         # Clouds
         self.cloud_name = "FakeCloudName"
         self.cloud_type = "FakeCloudType"
@@ -61,13 +65,9 @@ class TestJujuUtils(ut_utils.BaseTestCase):
         self.controller.get_cloud.return_value = self.cloud_name
 
     def test_get_application_status(self):
-        self.patch_object(juju_utils, "get_full_juju_status")
-        self.get_full_juju_status.return_value = self.juju_status
-
         # Full status juju object return
         self.assertEqual(
             juju_utils.get_application_status(), self.juju_status)
-        self.get_full_juju_status.assert_called_once()
 
         # Application only dictionary return
         self.assertEqual(
@@ -79,6 +79,40 @@ class TestJujuUtils(ut_utils.BaseTestCase):
             juju_utils.get_application_status(unit=self.unit),
             self.unit_data)
 
+        # All lookups are served from a single status
+        self.model.get_status.assert_called_once_with(
+            model_name=self.model_name)
+
+    def test_get_status_snapshot(self):
+        snapshot = juju_utils.get_status_snapshot()
+        self.assertEqual(snapshot.status, self.juju_status)
+        self.assertEqual(snapshot.applications[self.application],
+                         self.application_data)
+        self.assertEqual(snapshot.units, {self.unit: self.unit_data})
+        self.assertEqual(snapshot.machines[self.machine], self.machine_data)
+        self.assertEqual(juju_utils.get_status_snapshot(), snapshot)
+        self.model.get_status.assert_called_once_with(
+            model_name=self.model_name)
+
+    def test_get_status_snapshot_expired(self):
+        self.patch_object(juju_utils.time, "time")
+        self.time.return_value = 100
+        snapshot = juju_utils.get_status_snapshot()
+        self.time.return_value = 105
+        self.assertEqual(juju_utils.get_status_snapshot(ttl=10), snapshot)
+        self.time.return_value = 111
+        self.assertNotEqual(juju_utils.get_status_snapshot(ttl=10), snapshot)
+        self.assertEqual(self.model.get_status.call_count, 2)
+
+    def test_invalidate_status_snapshot(self):
+        juju_utils.get_status_snapshot()
+        juju_utils.get_status_snapshot(model_name='other-model')
+        juju_utils.invalidate_status_snapshot(self.model_name)
+        self.assertEqual(list(juju_utils.STATUS_SNAPSHOTS.keys()),
+                         ['other-model'])
+        juju_utils.invalidate_status_snapshot()
+        self.assertEqual(juju_utils.STATUS_SNAPSHOTS, {})
+
     def test_get_cloud_configs(self):
         self.patch_object(juju_utils.Path, "home")
         self.patch_object(juju_utils.generic_utils, "get_yaml_config")
@@ -96,28 +130,18 @@ class TestJujuUtils(ut_utils.BaseTestCase):
         self.model.get_status.assert_called_once_with()
 
     def test_get_machines_for_application(self):
-        self.patch_object(juju_utils, "get_application_status")
-        self.get_application_status.return_value = self.application_data
-
         # Machine data
         self.assertEqual(
             juju_utils.get_machines_for_application(self.application),
             [self.machine])
-        self.get_application_status.assert_called_once()
 
         # Subordinate application has no units
-        def _get_application_status(application):
-            _apps = {
-                self.application: self.application_data,
-                self.subordinate_application:
-                    self.subordinate_application_data}
-            return _apps[application]
-        self.get_application_status.side_effect = _get_application_status
-
         self.assertEqual(
             juju_utils.get_machines_for_application(
                 self.subordinate_application),
             [self.machine])
+        self.model.get_status.assert_called_once_with(
+            model_name=self.model_name)
 
     def test_get_unit_name_from_host_name(self):
         unit_mock1 = mock.MagicMock()
@@ -132,19 +156,17 @@ class TestJujuUtils(ut_utils.BaseTestCase):
             'myapp/2')
 
     def test_get_machine_status(self):
-        self.patch_object(juju_utils, "get_full_juju_status")
-        self.get_full_juju_status.return_value = self.juju_status
-
         # All machine data
         self.assertEqual(
             juju_utils.get_machine_status(self.machine),
             self.machine_data)
-        self.get_full_juju_status.assert_called_once()
 
         # Request a specific key
         self.assertEqual(
             juju_utils.get_machine_status(self.machine, self.key),
             self.key_data)
+        self.model.get_status.assert_called_once_with(
+            model_name=self.model_name)
 
     def test_get_machine_uuids_for_application(self):
         self.patch_object(juju_utils, "get_machines_for_application")
@@ -154,7 +176,7 @@ class TestJujuUtils(ut_utils.BaseTestCase):
             juju_utils.get_machine_uuids_for_application(self.application),
             [self.machine_data.get("instance-id")])
         self.get_machines_for_application.assert_called_once_with(
-            self.application)
+            self.application, model_name=None)
 
     def test_get_provider_type(self):
         self.patch_object(juju_utils, "get_cloud_configs")
@@ -266,6 +288,7 @@ class TestJujuUtils(ut_utils.BaseTestCase):
         actual = juju_utils.get_machine_series('6')
         self._get_machine_status.assert_called_with(
             machine='6',
-            key='series'
+            key='series',
+            model_name=None
         )
         self.assertEqual(expected, actual)
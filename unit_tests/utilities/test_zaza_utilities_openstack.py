@@ -16,6 +16,9 @@ import copy
 import datetime
 import io
 import mock
+import os
+import shutil
+import tempfile
 import tenacity
 
 import unit_tests.utils as ut_utils
@@ -27,6 +30,7 @@ class TestOpenStackUtils(ut_utils.BaseTestCase):
 
     def setUp(self):
         super(TestOpenStackUtils, self).setUp()
+        openstack_utils.clear_session_cache()
         self.port_name = "port_name"
         self.net_uuid = "net_uuid"
         self.project_id = "project_uuid"
@@ -245,7 +249,7 @@ class TestOpenStackUtils(ut_utils.BaseTestCase):
             }
         if tls_relation:
             expect['OS_CACERT'] = openstack_utils.KEYSTONE_LOCAL_CACERT
-        self.assertEqual(openstack_utils.get_overcloud_auth(),
+        self.assertEqual(openstack_utils.get_overcloud_auth(cached=False),
                          expect)
 
     def test_get_overcloud_auth(self):
@@ -266,8 +270,66 @@ class TestOpenStackUtils(ut_utils.BaseTestCase):
     def test_get_overcloud_auth_ssl_cert_v2(self):
         self._test_get_overcloud_auth(v2_api=True, ssl_cert=True)
 
+    def test_get_overcloud_auth_cached(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.patch_object(openstack_utils, 'OVERCLOUD_AUTH_CACHE',
+                          new=os.path.join(tmpdir, 'auth-{}.json'))
+        self.patch_object(openstack_utils.model, 'get_juju_model',
+                          return_value='mymodel')
+        self.patch_object(openstack_utils.model,
+                          'get_application_fingerprint',
+                          return_value='fp1')
+        self.patch_object(openstack_utils, '_get_overcloud_auth',
+                          return_value={'OS_PASSWORD': 'pass'})
+        self.assertEqual(openstack_utils.get_overcloud_auth(),
+                         {'OS_PASSWORD': 'pass'})
+        self.assertEqual(openstack_utils.get_overcloud_auth(),
+                         {'OS_PASSWORD': 'pass'})
+        self._get_overcloud_auth.assert_called_once_with()
+        self.get_application_fingerprint.assert_called_with(
+            'keystone', model_name='mymodel')
+        self.assertTrue(os.path.exists(os.path.join(tmpdir,
+                                                    'auth-mymodel.json')))
+        # Keystone changed
+        self.get_application_fingerprint.return_value = 'fp2'
+        openstack_utils.get_overcloud_auth()
+        self.assertEqual(self._get_overcloud_auth.call_count, 2)
+        openstack_utils.get_overcloud_auth()
+        self.assertEqual(self._get_overcloud_auth.call_count, 2)
+        openstack_utils.clear_overcloud_auth_cache()
+        openstack_utils.get_overcloud_auth()
+        self.assertEqual(self._get_overcloud_auth.call_count, 3)
+        # Settings for a given address are not cached
+        openstack_utils.get_overcloud_auth(address='10.0.0.10')
+        self._get_overcloud_auth.assert_called_with(address='10.0.0.10')
+
+    def test_get_overcloud_auth_cached_cacert_removed(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cacert = os.path.join(tmpdir, 'cacert')
+        with open(cacert, 'w') as f:
+            f.write('CERT')
+        self.patch_object(openstack_utils, 'OVERCLOUD_AUTH_CACHE',
+                          new=os.path.join(tmpdir, 'auth-{}.json'))
+        self.patch_object(openstack_utils.model, 'get_juju_model',
+                          return_value='mymodel')
+        self.patch_object(openstack_utils.model,
+                          'get_application_fingerprint',
+                          return_value='fp1')
+        self.patch_object(openstack_utils, '_get_overcloud_auth',
+                          return_value={'OS_CACERT': cacert})
+        openstack_utils.get_overcloud_auth()
+        openstack_utils.get_overcloud_auth()
+        self.assertEqual(self._get_overcloud_auth.call_count, 1)
+        os.remove(cacert)
+        openstack_utils.get_overcloud_auth()
+        self.assertEqual(self._get_overcloud_auth.call_count, 2)
+
     def test_get_overcloud_keystone_session(self):
-        self.patch_object(openstack_utils, "get_keystone_session")
+        _session = mock.MagicMock()
+        self.patch_object(openstack_utils, "get_keystone_session",
+                          return_value=_session)
         self.patch_object(openstack_utils, "get_keystone_scope")
         self.patch_object(openstack_utils, "get_overcloud_auth")
         _auth = "FAKE_AUTH"
@@ -275,9 +337,40 @@ class TestOpenStackUtils(ut_utils.BaseTestCase):
         self.get_keystone_scope.return_value = _scope
         self.get_overcloud_auth.return_value = _auth
 
-        openstack_utils.get_overcloud_keystone_session()
+        self.assertIs(openstack_utils.get_overcloud_keystone_session(),
+                      _session)
         self.get_keystone_session.assert_called_once_with(_auth, scope=_scope,
                                                           verify=None)
+        _session.get_token.assert_called_once_with()
+        # Failures other than the settings being rejected are left to the
+        # caller
+        _session.get_token.side_effect = (
+            openstack_utils.ks_exceptions.ConnectFailure('down'))
+        openstack_utils.get_overcloud_keystone_session()
+        self.get_overcloud_auth.assert_called_with()
+        self.assertEqual(self.get_overcloud_auth.call_count, 2)
+
+    def test_get_overcloud_keystone_session_rejected(self):
+        self.addCleanup(openstack_utils.clear_session_cache)
+        self.patch_object(openstack_utils, "get_keystone_scope",
+                          return_value="PROJECT")
+        self.patch_object(openstack_utils, "get_overcloud_auth")
+        self.get_overcloud_auth.side_effect = [
+            {'OS_PASSWORD': 'old'}, {'OS_PASSWORD': 'new'}]
+        self.patch_object(openstack_utils, "clear_overcloud_auth_cache")
+        stale = mock.MagicMock()
+        stale.get_token.side_effect = (
+            openstack_utils.ks_exceptions.Unauthorized())
+        fresh = mock.MagicMock()
+        self.patch_object(openstack_utils, "get_keystone_session")
+        self.get_keystone_session.side_effect = [stale, fresh]
+        openstack_utils.KEYSTONE_SESSIONS['old'] = stale
+        self.assertIs(openstack_utils.get_overcloud_keystone_session(), fresh)
+        self.clear_overcloud_auth_cache.assert_called_once_with()
+        self.get_keystone_session.assert_called_with(
+            {'OS_PASSWORD': 'new'}, scope="PROJECT", verify=None)
+        # The rejected session is no longer shared
+        self.assertEqual(openstack_utils.KEYSTONE_SESSIONS, {})
 
     def test_get_undercloud_keystone_session(self):
         self.patch_object(openstack_utils, "get_keystone_session")
@@ -798,6 +891,107 @@ class TestOpenStackUtils(ut_utils.BaseTestCase):
         release_comp = xenial_queens > xenial_mitaka
         self.assertTrue(release_comp)
 
+    def test_probe_os_versions(self):
+        self.patch_object(openstack_utils.model, 'get_first_unit_name')
+        self.get_first_unit_name.side_effect = lambda x, model_name: (
+            '{}/0'.format(x))
+        self.patch_object(openstack_utils.model, 'run_on_units')
+        self.run_on_units.return_value = {
+            'keystone/0': {
+                'Code': '0',
+                'Stdout': 'ii  keystone 2:13.0.1-0ubuntu1\n'
+                          'rc  nova-common 2:16.0.0-0ubuntu1\n'},
+            'nova-compute/0': {
+                'Code': '0',
+                'Stdout': 'ii  nova-common 2:17.0.5-0ubuntu1\n'}}
+        self.assertEqual(
+            openstack_utils.probe_os_versions(
+                ['keystone', 'nova-compute'], model_name='mymodel'),
+            {'keystone': 'queens', 'nova-compute': 'queens'})
+        self.run_on_units.assert_called_once_with(
+            ['keystone/0', 'nova-compute/0'],
+            "dpkg-query -W -f='${db:Status-Abbrev} ${Package} "
+            "${Version}\\n' keystone nova-common 2>/dev/null; true",
+            model_name='mymodel')
+        self.run_on_units.return_value['nova-compute/0']['Stdout'] = ''
+        with self.assertRaises(exceptions.OSVersionNotFound):
+            openstack_utils.probe_os_versions(
+                ['keystone', 'nova-compute'], model_name='mymodel')
+
+    def test_probe_os_versions_all_units(self):
+        self.patch_object(openstack_utils.model, 'get_units')
+
+        def _get_units(application, model_name):
+            _units = []
+            for unit_name in ('keystone/0', 'keystone/1'):
+                unit = mock.MagicMock()
+                unit.name = unit_name
+                _units.append(unit)
+            return _units
+        self.get_units.side_effect = _get_units
+        self.patch_object(openstack_utils.model, 'run_on_units')
+        self.run_on_units.return_value = {
+            'keystone/0': {
+                'Code': '0',
+                'Stdout': 'ii  keystone 2:13.0.1-0ubuntu1\n'},
+            'keystone/1': {
+                'Code': '0',
+                'Stdout': 'ii  keystone 2:13.0.1-0ubuntu1\n'}}
+        self.assertEqual(
+            openstack_utils.probe_os_versions(
+                ['keystone'], model_name='mymodel', all_units=True),
+            {'keystone': 'queens'})
+        self.run_on_units.assert_called_once_with(
+            ['keystone/0', 'keystone/1'], mock.ANY, model_name='mymodel')
+        # Units of an application disagreeing on the version is an error
+        self.run_on_units.return_value['keystone/1']['Stdout'] = (
+            'ii  keystone 2:14.0.0-0ubuntu1\n')
+        with self.assertRaises(exceptions.OSVersionNotFound):
+            openstack_utils.probe_os_versions(
+                ['keystone'], model_name='mymodel', all_units=True)
+
+    def test_get_current_os_versions(self):
+        self.addCleanup(openstack_utils.clear_os_versions_cache)
+        self.patch_object(openstack_utils.model, 'get_juju_model',
+                          return_value='mymodel')
+        self.patch_object(openstack_utils, 'probe_os_versions')
+        self.probe_os_versions.side_effect = (
+            lambda x, model_name, all_units: {app: 'queens' for app in x})
+        self.assertEqual(
+            openstack_utils.get_current_os_versions('keystone'),
+            {'keystone': 'queens'})
+        self.probe_os_versions.assert_called_once_with(
+            ['keystone'], model_name='mymodel', all_units=False)
+        # Only applications not seen before are probed
+        self.assertEqual(
+            openstack_utils.get_current_os_versions(
+                ['glance', 'keystone', 'mysql']),
+            {'keystone': 'queens', 'glance': 'queens'})
+        self.probe_os_versions.assert_called_with(
+            ['glance'], model_name='mymodel', all_units=False)
+        openstack_utils.get_current_os_versions(['glance', 'keystone'])
+        self.assertEqual(self.probe_os_versions.call_count, 2)
+        # all_units always probes
+        openstack_utils.get_current_os_versions(['keystone'], all_units=True)
+        self.probe_os_versions.assert_called_with(
+            ['keystone'], model_name='mymodel', all_units=True)
+        # Other models have their own cache
+        openstack_utils.get_current_os_versions(
+            ['keystone'], model_name='othermodel')
+        self.probe_os_versions.assert_called_with(
+            ['keystone'], model_name='othermodel', all_units=False)
+        openstack_utils.clear_os_versions_cache('mymodel')
+        self.assertEqual(list(openstack_utils.OS_VERSIONS), ['othermodel'])
+        openstack_utils.get_current_os_versions(['glance', 'keystone'])
+        self.probe_os_versions.assert_called_with(
+            ['keystone', 'glance'], model_name='mymodel', all_units=False)
+
+    def test_get_swift_codename(self):
+        self.assertEqual(openstack_utils.get_swift_codename('2.5.0'),
+                         'liberty')
+        self.assertEqual(openstack_utils.get_swift_codename('1.13.1'),
+                         'icehouse')
+
     def test_get_keystone_api_version(self):
         self.patch_object(openstack_utils, "get_current_os_versions")
         self.patch_object(openstack_utils, "get_application_config_option")
@@ -979,6 +1173,40 @@ class TestOpenStackUtils(ut_utils.BaseTestCase):
         openstack_utils.get_keystone_session(_openrc)
         self.session.Session.assert_called_once_with(auth=_auth, verify=None)
 
+    def test_get_keystone_session_cached(self):
+        self.patch_object(openstack_utils, "session")
+        self.patch_object(openstack_utils, "v2")
+        _openrc = {
+            "OS_AUTH_URL": "https://keystone:5000",
+            "OS_USERNAME": "myuser",
+            "OS_PASSWORD": "pass",
+            "OS_TENANT_NAME": "tenant",
+        }
+        _session = openstack_utils.get_keystone_session(_openrc)
+        self.assertIs(openstack_utils.get_keystone_session(dict(_openrc)),
+                      _session)
+        self.session.Session.assert_called_once_with(
+            auth=self.v2.Password.return_value, verify=None)
+        openstack_utils.get_keystone_session(_openrc, verify=False)
+        _openrc['OS_PASSWORD'] = 'newpass'
+        openstack_utils.get_keystone_session(_openrc)
+        self.assertEqual(self.session.Session.call_count, 3)
+        openstack_utils.clear_session_cache()
+        openstack_utils.get_keystone_session(_openrc)
+        self.assertEqual(self.session.Session.call_count, 4)
+
+    def test_cached_session_client(self):
+        _session1 = mock.MagicMock()
+        _session2 = mock.MagicMock()
+        self.patch_object(openstack_utils.novaclient_client, "Client")
+        self.Client.side_effect = lambda *args, **kwargs: mock.MagicMock()
+        client = openstack_utils.get_nova_session_client(_session1)
+        self.assertIs(openstack_utils.get_nova_session_client(_session1),
+                      client)
+        self.assertIsNot(openstack_utils.get_nova_session_client(_session2),
+                         client)
+        self.assertEqual(self.Client.call_count, 2)
+
     def test_get_keystone_session_tls(self):
         self.patch_object(openstack_utils, "session")
         self.patch_object(openstack_utils, "v2")
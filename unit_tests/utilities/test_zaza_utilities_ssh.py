@@ -0,0 +1,76 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+import unit_tests.utils as ut_utils
+import zaza.utilities.ssh as ssh
+
+
+class TestSSH(ut_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestSSH, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        self.patch_object(ssh, 'CONTROL_DIR', new=self.tmpdir)
+        self.patch_object(ssh, 'CONTROL_DIR_PID', new=os.getpid())
+
+    def test_get_control_dir(self):
+        self.assertEqual(ssh.get_control_dir(), self.tmpdir)
+        # A forked child gets its own directory
+        ssh.CONTROL_DIR_PID = -1
+        control_dir = ssh.get_control_dir()
+        self.addCleanup(shutil.rmtree, control_dir, ignore_errors=True)
+        self.assertNotEqual(control_dir, self.tmpdir)
+        self.assertTrue(os.path.isdir(control_dir))
+        self.assertEqual(ssh.CONTROL_DIR_PID, os.getpid())
+
+    def test_multiplex_options(self):
+        self.assertEqual(
+            ssh.multiplex_options(),
+            ['-o', 'ControlMaster=auto',
+             '-o', 'ControlPath={}/%C'.format(self.tmpdir),
+             '-o', 'ControlPersist=600',
+             '-o', 'ServerAliveInterval=15',
+             '-o', 'ServerAliveCountMax=3'])
+
+    def test_merge_options(self):
+        self.patch_object(ssh, 'multiplex_options', return_value=['-o', 'X'])
+        self.assertEqual(ssh.merge_options(''), ['-o', 'X'])
+        self.assertEqual(ssh.merge_options(None), ['-o', 'X'])
+        self.assertEqual(ssh.merge_options('-r -o Y'),
+                         ['-r', '-o', 'Y', '-o', 'X'])
+        self.assertEqual(ssh.merge_options(('-r',)), ['-r', '-o', 'X'])
+
+    def test_close_connections(self):
+        self.patch_object(ssh.subprocess, 'call')
+        open(os.path.join(self.tmpdir, 'abc123'), 'w').close()
+        ssh.close_connections()
+        self.call.assert_called_once_with(
+            ['ssh', '-o', 'ControlPath={}/abc123'.format(self.tmpdir),
+             '-O', 'exit', 'zaza'],
+            stdout=ssh.subprocess.DEVNULL,
+            stderr=ssh.subprocess.DEVNULL)
+        self.assertFalse(os.path.exists(self.tmpdir))
+        self.assertIsNone(ssh.CONTROL_DIR)
+
+    def test_close_connections_other_process(self):
+        self.patch_object(ssh.subprocess, 'call')
+        ssh.CONTROL_DIR_PID = -1
+        ssh.close_connections()
+        self.assertFalse(self.call.called)
+        self.assertTrue(os.path.exists(self.tmpdir))
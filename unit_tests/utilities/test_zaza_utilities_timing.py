@@ -0,0 +1,150 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import mock
+import os
+import tempfile
+
+import unit_tests.utils as ut_utils
+import zaza.utilities.timing as timing
+
+
+class TestTiming(ut_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestTiming, self).setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.span_file = os.path.join(self.tmpdir.name, 'spans.json')
+        environ = mock.patch.dict(os.environ)
+        environ.start()
+        self.addCleanup(environ.stop)
+        os.environ.pop(timing.SPAN_FILE_ENV, None)
+
+    def tearDown(self):
+        super(TestTiming, self).tearDown()
+        self.tmpdir.cleanup()
+
+    def test_set_span_file(self):
+        timing.set_span_file(self.span_file)
+        self.assertEqual(timing.get_span_file(), self.span_file)
+        timing.set_span_file(None)
+        self.assertIsNone(timing.get_span_file())
+
+    def test_span_disabled(self):
+        with timing.span('deploy', 'phase'):
+            pass
+        self.assertFalse(os.path.exists(self.span_file))
+
+    def test_span(self):
+        timing.set_span_file(self.span_file)
+        self.patch_object(timing.time, 'monotonic')
+        self.monotonic.side_effect = [10.0, 12.5, 20.0, 21.0]
+        with timing.span('deploy', 'phase', model_name='mname'):
+            pass
+        with self.assertRaises(ValueError):
+            with timing.span('configure', 'phase'):
+                raise ValueError()
+        spans = timing.read_spans(self.span_file)
+        self.assertEqual(len(spans), 2)
+        self.assertEqual(spans[0]['name'], 'deploy')
+        self.assertEqual(spans[0]['kind'], 'phase')
+        self.assertEqual(spans[0]['duration'], 2.5)
+        self.assertEqual(spans[0]['attributes'], {'model_name': 'mname'})
+        self.assertEqual(spans[0]['outcome'], 'ok')
+        self.assertEqual(spans[1]['outcome'], 'error')
+        self.assertEqual(spans[1]['error'], 'ValueError')
+
+    def test_read_spans_skips_partial_lines(self):
+        with open(self.span_file, 'w') as f:
+            f.write('{"name": "deploy"}\n{"name": "conf')
+        self.assertEqual(
+            timing.read_spans(self.span_file),
+            [{'name': 'deploy'}])
+
+    def test_span_attributes(self):
+        def _func(application_name, command, model_name=None, model=None):
+            pass
+        self.assertEqual(
+            timing.span_attributes(
+                _func, ['app', 'ls'], {'model': mock.Mock()}),
+            {'application_name': 'app'})
+        self.assertEqual(timing.span_attributes(_func, [], {}), {})
+        self.assertEqual(
+            timing.span_attributes(
+                _func, ['app', 'ls'], {'model_name': 'mname'}),
+            {'application_name': 'app', 'model_name': 'mname'})
+
+    def test_timed(self):
+        timing.set_span_file(self.span_file)
+
+        @timing.timed('model')
+        def get_units(application_name, model_name=None):
+            return ['app/0']
+
+        @timing.timed('model')
+        async def async_get_units(application_name, model_name=None):
+            return ['app/0']
+
+        self.assertEqual(get_units('app'), ['app/0'])
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(
+                loop.run_until_complete(
+                    async_get_units('app', model_name='mname')),
+                ['app/0'])
+        finally:
+            loop.close()
+        self.assertTrue(asyncio.iscoroutinefunction(async_get_units))
+        spans = timing.read_spans(self.span_file)
+        self.assertEqual(
+            [(s['name'], s['kind'], s['attributes']) for s in spans],
+            [('get_units', 'model', {'application_name': 'app'}),
+             ('async_get_units', 'model',
+              {'application_name': 'app', 'model_name': 'mname'})])
+
+    def test_span_parents(self):
+        timing.set_span_file(self.span_file)
+
+        async def _child(name):
+            with timing.span(name, 'command'):
+                await asyncio.sleep(0)
+
+        async def _parent():
+            with timing.span('parent', 'model'):
+                await asyncio.gather(_child('child1'), _child('child2'))
+
+        loop = asyncio.new_event_loop()
+        try:
+            with timing.span('phase', 'phase') as phase:
+                loop.run_until_complete(_parent())
+        finally:
+            loop.close()
+        self.assertIsNone(timing.current_span_id())
+        spans = {s['name']: s for s in timing.read_spans(self.span_file)}
+        self.assertEqual(spans['phase']['id'], phase.id)
+        self.assertIsNone(spans['phase']['parent'])
+        self.assertEqual(spans['parent']['parent'], phase.id)
+        self.assertEqual(spans['child1']['parent'], spans['parent']['id'])
+        self.assertEqual(spans['child2']['parent'], spans['parent']['id'])
+
+    def test_span_open_close(self):
+        timing.set_span_file(self.span_file)
+        span = timing.span('test_method', 'test_method').open()
+        self.assertEqual(timing.current_span_id(), span.id)
+        span.close('TestFailure')
+        self.assertIsNone(timing.current_span_id())
+        spans = timing.read_spans(self.span_file)
+        self.assertEqual(spans[0]['outcome'], 'error')
+        self.assertEqual(spans[0]['error'], 'TestFailure')
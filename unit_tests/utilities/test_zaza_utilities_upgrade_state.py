@@ -0,0 +1,70 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+import unit_tests.utils as ut_utils
+import zaza.utilities.upgrade_state as upgrade_state
+
+
+class TestSeriesUpgradeState(ut_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestSeriesUpgradeState, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        self.path = os.path.join(self.tmpdir, 'state.json')
+
+    def test_mark_done(self):
+        state = upgrade_state.SeriesUpgradeState(self.path)
+        self.assertEqual(state.steps_done('1'), [])
+        state.mark_done('1', upgrade_state.PREPARE)
+        state.mark_done('1', upgrade_state.PREPARE)
+        state.mark_done('1', upgrade_state.RELEASE_UPGRADE)
+        self.assertEqual(
+            state.steps_done('1'),
+            [upgrade_state.PREPARE, upgrade_state.RELEASE_UPGRADE])
+        self.assertTrue(state.is_done('1', upgrade_state.PREPARE))
+        self.assertFalse(state.is_done('1', upgrade_state.REBOOT))
+        self.assertFalse(state.is_done('2', upgrade_state.PREPARE))
+        self.assertFalse(state.is_complete('1'))
+        with self.assertRaises(ValueError):
+            state.mark_done('1', 'unknown')
+
+    def test_resume(self):
+        state = upgrade_state.SeriesUpgradeState(self.path)
+        for step in upgrade_state.STEPS:
+            state.mark_done('1', step)
+        state.mark_done('2', upgrade_state.PREPARE)
+        # A new run picks up the state file
+        state = upgrade_state.SeriesUpgradeState(self.path)
+        self.assertTrue(state.is_complete('1'))
+        self.assertEqual(state.steps_done('2'), [upgrade_state.PREPARE])
+        state.remove()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(state.steps_done('1'), [])
+
+    def test_in_memory(self):
+        state = upgrade_state.SeriesUpgradeState()
+        state.mark_done('1', upgrade_state.PREPARE)
+        self.assertTrue(state.is_done('1', upgrade_state.PREPARE))
+        state.remove()
+
+    def test_for_model(self):
+        state = upgrade_state.SeriesUpgradeState.for_model(
+            'zaza-123', 'bionic')
+        self.assertEqual(
+            state.path, '.zaza-series-upgrade-zaza-123-bionic.json')
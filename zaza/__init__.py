@@ -12,24 +12,135 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Functions to support converting async function to a sync equivalent."""
+"""Functions to support converting async function to a sync equivalent.
+
+Coroutines run by the sync functions are all run on one event loop which
+runs in a thread of its own for the lifetime of the process. Connections
+made by one sync call stay usable by the next, and sync functions can be
+called from any thread.
+"""
 import asyncio
+import atexit
+import os
+import threading
+
+RUN_LOOP = None
+RUN_THREAD = None
+# Process that started RUN_THREAD, a forked child has to start its own
+RUN_PID = None
+_RUN_LOCK = threading.Lock()
+
+
+class _ThreadedChildWatcher(asyncio.AbstractChildWatcher):
+    """Wait for each child process in a thread of its own.
+
+    The child watchers of Python before 3.8 rely on SIGCHLD, which can only
+    be handled by the event loop of the main thread, so subprocesses, such as
+    the ssh and scp run by libjuju, could not be started from the zaza event
+    loop. This is asyncio.ThreadedChildWatcher from Python 3.8.
+    """
+
+    def add_child_handler(self, pid, callback, *args):
+        """Call callback with the return code of pid when it exits."""
+        loop = asyncio.get_event_loop()
+        thread = threading.Thread(
+            target=self._do_waitpid,
+            args=(loop, pid, callback, args),
+            name='zaza-waitpid-{}'.format(pid),
+            daemon=True)
+        thread.start()
+
+    def remove_child_handler(self, pid):
+        """Children are waited for until they exit."""
+        return True
+
+    def attach_loop(self, loop):
+        """Work with any loop, nothing to attach to."""
+
+    def is_active(self):
+        """Return True, the watcher needs no loop."""
+        return True
+
+    def close(self):
+        """Nothing to close, the threads exit with their child."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def _do_waitpid(self, loop, pid, callback, args):
+        try:
+            _, status = os.waitpid(pid, 0)
+        except ChildProcessError:
+            # The child has already been reaped elsewhere
+            returncode = 255
+        else:
+            if os.WIFSIGNALED(status):
+                returncode = -os.WTERMSIG(status)
+            elif os.WIFEXITED(status):
+                returncode = os.WEXITSTATUS(status)
+            else:
+                returncode = status
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(callback, pid, returncode, *args)
+
+
+def _run_loop_forever(loop):
+    """Run loop in the current thread until it is stopped.
+
+    :param loop: Event loop to run
+    :type loop: asyncio.AbstractEventLoop
+    """
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_run_loop():
+    """Return the event loop sync functions run coroutines on.
+
+    The loop and its thread are started on first use.
+
+    :returns: Event loop
+    :rtype: asyncio.AbstractEventLoop
+    """
+    global RUN_LOOP, RUN_THREAD, RUN_PID
+    with _RUN_LOCK:
+        if RUN_LOOP is None or RUN_PID != os.getpid():
+            if not hasattr(asyncio, 'ThreadedChildWatcher'):
+                asyncio.set_child_watcher(_ThreadedChildWatcher())
+            RUN_LOOP = asyncio.new_event_loop()
+            RUN_THREAD = threading.Thread(
+                target=_run_loop_forever,
+                args=(RUN_LOOP,),
+                name='zaza-event-loop',
+                daemon=True)
+            RUN_THREAD.start()
+            RUN_PID = os.getpid()
+        return RUN_LOOP
 
 
 def run(*steps):
-    """Run the given steps in an asyncio loop.
+    """Run the given steps on the zaza event loop and wait for them.
 
-    :returns: The result of the asyncio.Task
+    :returns: The result of the last step
     :rtype: Any
+    :raises: RuntimeError if called from a coroutine on the zaza event loop
     """
     if not steps:
         return
-    loop = asyncio.get_event_loop()
-
+    loop = get_run_loop()
+    if threading.current_thread() is RUN_THREAD:
+        for step in steps:
+            step.close()
+        raise RuntimeError(
+            "Sync function called from the zaza event loop, await the "
+            "async function instead")
+    result = None
     for step in steps:
-        task = loop.create_task(step)
-        loop.run_until_complete(asyncio.wait([task], loop=loop))
-    return task.result()
+        result = asyncio.run_coroutine_threadsafe(step, loop).result()
+    return result
 
 
 def sync_wrapper(f):
@@ -43,3 +154,17 @@ def sync_wrapper(f):
             return await f(*args, **kwargs)
         return run(_run_it())
     return _wrapper
+
+
+@atexit.register
+def stop_run_loop():
+    """Stop the zaza event loop and its thread."""
+    global RUN_LOOP, RUN_THREAD
+    with _RUN_LOCK:
+        if RUN_LOOP is None or RUN_PID != os.getpid():
+            return
+        loop, thread = RUN_LOOP, RUN_THREAD
+        RUN_LOOP = RUN_THREAD = None
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
@@ -13,13 +13,13 @@
 # limitations under the License.
 
 """Run configuration phase."""
-import asyncio
 import argparse
 import logging
 import sys
 
 import zaza.model
 import zaza.charm_lifecycle.utils as utils
+import zaza.utilities.timing as timing
 
 
 def run_configure_list(functions):
@@ -35,6 +35,7 @@ def run_configure_list(functions):
         utils.get_class(func)()
 
 
+@timing.timed('phase')
 def configure(model_name, functions):
     """Run all post-deployment configuration steps.
 
@@ -42,7 +43,8 @@ def configure(model_name, functions):
     :type tests: ['zaza.charms_tests.svc.setup', ...]
     """
     zaza.model.set_juju_model(model_name)
-    run_configure_list(functions)
+    with zaza.model.use_model(model_name):
+        run_configure_list(functions)
 
 
 def parse_args(args):
@@ -79,4 +81,5 @@ def main():
     logging.basicConfig(level=level)
     funcs = args.configfuncs or utils.get_charm_config()['configure']
     configure(args.model_name, funcs)
-    asyncio.get_event_loop().close()
+    zaza.model.disconnect_models()
+    zaza.stop_run_loop()
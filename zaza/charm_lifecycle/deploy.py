@@ -20,9 +20,12 @@ import os
 import subprocess
 import sys
 import tempfile
+import yaml
 
 import zaza.model
 import zaza.charm_lifecycle.utils as utils
+import zaza.utilities.bundle as bundle_utils
+import zaza.utilities.timing as timing
 
 DEFAULT_OVERLAY_TEMPLATE_DIR = 'tests/bundles/overlays'
 VALID_ENVIRONMENT_KEY_PREFIXES = [
@@ -250,7 +253,130 @@ def deploy_bundle(bundle, model):
         subprocess.check_call(cmd)
 
 
-def deploy(bundle, model, wait=True):
+def get_rendered_bundle(bundle):
+    """Return the bundle with its rendered overlays applied.
+
+    :param bundle: Path to bundle file
+    :type bundle: str
+    :returns: Bundle as it would be deployed
+    :rtype: dict
+    """
+    with open(bundle, 'r') as f:
+        target = yaml.safe_load(f)
+    overlays = []
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        for overlay in render_overlays(bundle, tmpdirname):
+            with open(overlay, 'r') as f:
+                overlays.append(yaml.safe_load(f))
+    target = bundle_utils.merge_overlays(target, overlays)
+    # Local charms are relative to the bundle, not the deployed delta
+    bundle_dir = os.path.dirname(os.path.abspath(bundle))
+    for application in target['applications'].values():
+        charm = application.get('charm', '')
+        if charm.startswith('.'):
+            application['charm'] = os.path.normpath(
+                os.path.join(bundle_dir, charm))
+    return target
+
+
+def _deploy_applications(target, applications, model):
+    """Deploy the given applications from the target bundle.
+
+    Placement directives are dropped as the machines they refer to are not
+    those of the model being deployed to.
+
+    :param target: Bundle with overlays applied
+    :type target: dict
+    :param applications: Names of applications to deploy
+    :type applications: [str, str, ...]
+    :param model: Name of model to deploy in
+    :type model: str
+    """
+    delta_bundle = {
+        key: value for key, value in target.items()
+        if key not in ('applications', 'machines', 'relations')}
+    delta_bundle['applications'] = {}
+    for name in applications:
+        application = dict(target['applications'][name])
+        application.pop('to', None)
+        delta_bundle['applications'][name] = application
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        delta_file = os.path.join(tmpdirname, 'delta.yaml')
+        with open(delta_file, 'w') as f:
+            yaml.safe_dump(delta_bundle, f)
+        subprocess.check_call(['juju', 'deploy', '-m', model, delta_file])
+
+
+def deploy_bundle_incremental(bundle, model):
+    """Apply only the changes between the bundle and the model.
+
+    The bundle, with its overlays, is compared with the applications,
+    config, unit counts and relations in the model. Changes to the charms of
+    existing applications are not applied.
+
+    :param bundle: Path to bundle file
+    :type bundle: str
+    :param model: Name of model to deploy bundle in
+    :type model: str
+    :returns: Names of applications that were changed, None if the whole
+              bundle was deployed
+    :rtype: Union[[str, str, ...], None]
+    """
+    live = zaza.model.export_bundle(model_name=model)
+    if not bundle_utils.get_applications(live):
+        deploy_bundle(bundle, model)
+        return None
+    logging.info("Applying changes in bundle '{}' to '{}' model"
+                 .format(bundle, model))
+    target = get_rendered_bundle(bundle)
+    live_applications = bundle_utils.get_applications(live)
+    # Options at their charm default are not in the exported bundle
+    live_config = {
+        name: zaza.model.get_application_config(name, model_name=model)
+        for name, application in bundle_utils.get_applications(
+            target).items()
+        if name in live_applications and application.get('options')}
+    delta = bundle_utils.diff_bundle(
+        target, live,
+        live_options={
+            name: bundle_utils.get_effective_options(config)
+            for name, config in live_config.items()},
+        option_types={
+            name: bundle_utils.get_option_types(config)
+            for name, config in live_config.items()})
+    for relation in delta['remove_relations']:
+        logging.info("Removing relation {}".format(' '.join(relation)))
+        zaza.model.remove_relation(*relation, model_name=model)
+    for application in delta['remove_applications']:
+        logging.info("Removing application {}".format(application))
+        zaza.model.remove_application(application, model_name=model)
+    if delta['add_applications']:
+        logging.info("Deploying applications {}".format(
+            ', '.join(delta['add_applications'])))
+        _deploy_applications(target, delta['add_applications'], model)
+    for application, options in delta['config'].items():
+        logging.info("Setting {} config: {}".format(application, options))
+        zaza.model.set_application_config(
+            application, options, model_name=model)
+    for application, count in delta['add_units'].items():
+        logging.info("Adding {} unit(s) to {}".format(count, application))
+        zaza.model.add_unit(application, count=count, model_name=model)
+    for application, count in delta['remove_units'].items():
+        units = sorted(
+            [u.entity_id for u in zaza.model.get_units(
+                application, model_name=model)],
+            key=lambda u: int(u.split('/')[1]))
+        logging.info("Removing units {}".format(', '.join(units[-count:])))
+        zaza.model.destroy_unit(
+            application, *units[-count:], model_name=model)
+    for relation in delta['add_relations']:
+        logging.info("Adding relation {}".format(' '.join(relation)))
+        zaza.model.add_relation(*relation, model_name=model)
+    return bundle_utils.get_changed_applications(delta)
+
+
+@timing.timed('phase')
+def deploy(bundle, model, wait=True, incremental=False):
     """Run all steps to complete deployment.
 
     :param bundle: Path to bundle file
@@ -259,15 +385,31 @@ def deploy(bundle, model, wait=True):
     :type model: str
     :param wait: Whether to wait until deployment completes
     :type model: bool
+    :param incremental: Only apply the changes between the bundle and the
+                        model, and only wait for the changed applications
+    :type incremental: bool
     """
-    deploy_bundle(bundle, model)
+    applications = None
+    if incremental:
+        applications = deploy_bundle_incremental(bundle, model)
+        if applications == []:
+            logging.info("Model '{}' already matches bundle".format(model))
+            return
+    else:
+        deploy_bundle(bundle, model)
     if wait:
         test_config = utils.get_charm_config()
         logging.info("Waiting for environment to settle")
         zaza.model.set_juju_model(model)
-        zaza.model.wait_for_application_states(
-            model,
-            test_config.get('target_deploy_status', {}))
+        if applications:
+            zaza.model.wait_for_application_states(
+                model,
+                test_config.get('target_deploy_status', {}),
+                applications=applications)
+        else:
+            zaza.model.wait_for_application_states(
+                model,
+                test_config.get('target_deploy_status', {}))
 
 
 def parse_args(args):
@@ -288,9 +430,13 @@ def parse_args(args):
     parser.add_argument('--no-wait', dest='wait',
                         help='Do not wait for deployment to settle',
                         action='store_false')
+    parser.add_argument('--incremental', dest='incremental',
+                        help='Only apply the changes between the bundle and '
+                             'the model',
+                        action='store_true')
     parser.add_argument('--log', dest='loglevel',
                         help='Loglevel [DEBUG|INFO|WARN|ERROR|CRITICAL]')
-    parser.set_defaults(wait=True, loglevel='INFO')
+    parser.set_defaults(wait=True, incremental=False, loglevel='INFO')
     return parser.parse_args(args)
 
 
@@ -301,4 +447,5 @@ def main():
     if not isinstance(level, int):
         raise ValueError('Invalid log level: "{}"'.format(args.loglevel))
     logging.basicConfig(level=level)
-    deploy(args.bundle, args.model, wait=args.wait)
+    deploy(args.bundle, args.model, wait=args.wait,
+           incremental=args.incremental)
@@ -18,15 +18,27 @@ import logging
 import sys
 
 import zaza.controller
+import zaza.model
 
+import zaza.charm_lifecycle.reaper as reaper
+import zaza.utilities.timing as timing
 
-def destroy(model_name):
+
+@timing.timed('phase')
+def destroy(model_name, background=False):
     """Run all steps to cleaup after a test run.
 
     :param model: Name of model to remove
     :type bundle: str
+    :param background: Hand the model to the reaper to destroy in the
+                       background and return at once
+    :type background: bool
     """
-    zaza.controller.destroy_model(model_name)
+    zaza.model.disconnect_model(model_name)
+    if background:
+        reaper.reap(model_name)
+    else:
+        zaza.controller.destroy_model(model_name)
 
 
 def parse_args(args):
@@ -14,20 +14,241 @@
 
 """Run full test lifecycle."""
 import argparse
-import asyncio
 import logging
+import multiprocessing
 import os
 import sys
+import time
+import traceback
 
+import zaza.model
 import zaza.charm_lifecycle.configure as configure
 import zaza.charm_lifecycle.destroy as destroy
+import zaza.charm_lifecycle.model_pool as model_pool
+import zaza.charm_lifecycle.reaper as reaper
+import zaza.charm_lifecycle.report as report
 import zaza.charm_lifecycle.utils as utils
 import zaza.charm_lifecycle.prepare as prepare
 import zaza.charm_lifecycle.deploy as deploy
 import zaza.charm_lifecycle.test as test
+import zaza.utilities.timing as timing
 
+DEFAULT_LOG_DIR = 'func-test-logs'
 
-def func_test_runner(keep_model=False, smoke=False, dev=False, bundle=None):
+
+class BundleRunFailed(Exception):
+    """One or more bundles failed when running bundles in parallel."""
+
+    def __init__(self, bundles):
+        """Create a BundleRunFailed exception.
+
+        :param bundles: Names of bundles that failed
+        :type bundles: [str, str, ...]
+        """
+        self.bundles = bundles
+        msg = 'Bundle(s) failed: {}'.format(', '.join(bundles))
+        super(BundleRunFailed, self).__init__(msg)
+
+
+def run_bundle(bundle, test_config, keep_model=False, pool=None,
+               background_destroy=False, model_name=None):
+    """Deploy a bundle into a new model and run the charms tests against it.
+
+    :param bundle: Name of bundle to deploy
+    :type bundle: str
+    :param test_config: Charm test configuration from tests.yaml
+    :type test_config: dict
+    :param keep_model: Whether to keep the model at the end of the run
+    :type keep_model: boolean
+    :param pool: Pool to lease the model from and return it to
+    :type pool: zaza.charm_lifecycle.model_pool.ModelPool
+    :param background_destroy: Destroy the model in the background
+    :type background_destroy: boolean
+    :param model_name: Name of an existing model to apply the changes
+                       between it and the bundle to, the model is kept
+    :type model_name: str
+    :returns: Name of the model the bundle was deployed to
+    :rtype: str
+    """
+    with timing.span(bundle, 'bundle'):
+        bundle_file = os.path.join(utils.BUNDLE_DIR, '{}.yaml'.format(bundle))
+        if model_name:
+            keep_model = True
+            # Deploy
+            deploy.deploy(bundle_file, model_name, incremental=True)
+        else:
+            if pool:
+                model_name = pool.lease()
+            else:
+                model_name = utils.generate_model_name()
+                # Prepare
+                prepare.prepare(model_name)
+            # Deploy
+            deploy.deploy(bundle_file, model_name)
+        if 'configure' in test_config:
+            # Configure
+            configure.configure(model_name, test_config['configure'])
+        # Test
+        test.test(
+            model_name,
+            test_config['tests'],
+            parallel_safe_tests=test_config.get('parallel_safe_tests'))
+        # Destroy
+        if keep_model:
+            pass
+        elif pool:
+            pool.release(model_name)
+        elif background_destroy:
+            destroy.destroy(model_name, background=True)
+        else:
+            destroy.destroy(model_name)
+    return model_name
+
+
+def _run_bundle_process(bundle, test_config, keep_model, log_file, loglevel,
+                        background_destroy=False):
+    """Run a bundle in a child process logging to its own file.
+
+    :param bundle: Name of bundle to deploy
+    :type bundle: str
+    :param test_config: Charm test configuration from tests.yaml
+    :type test_config: dict
+    :param keep_model: Whether to keep the model at the end of the run
+    :type keep_model: boolean
+    :param log_file: File to write all output of the run to
+    :type log_file: str
+    :param loglevel: Log level to use in the child process
+    :type loglevel: int
+    :param background_destroy: Leave the model for the parent process to
+                               destroy in the background
+    :type background_destroy: boolean
+    :returns: Summary of the run with keys bundle, status, duration and
+              log_file, and the model to destroy under reap when
+              background_destroy is set
+    :rtype: dict
+    """
+    summary = {
+        'bundle': bundle,
+        'status': 'PASS',
+        'log_file': log_file}
+    start = time.time()
+    stdout, stderr = sys.stdout, sys.stderr
+    with open(log_file, 'w') as log:
+        # Point file descriptors 1 and 2 at the log too, so the output of
+        # juju and other subprocesses goes to it rather than the terminal
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved_fds = [os.dup(1), os.dup(2)]
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        sys.stdout = sys.stderr = log
+        logging.basicConfig(stream=log, level=loglevel)
+        try:
+            # The model is handed back to the parent rather than destroyed
+            # here, so this worker is free for the next bundle at once
+            model_name = run_bundle(
+                bundle, test_config,
+                keep_model=keep_model or background_destroy)
+            if background_destroy and not keep_model:
+                summary['reap'] = model_name
+        except Exception:
+            traceback.print_exc()
+            summary['status'] = 'FAIL'
+        finally:
+            zaza.model.disconnect_models()
+            log.flush()
+            for fd, saved_fd in zip((1, 2), saved_fds):
+                os.dup2(saved_fd, fd)
+                os.close(saved_fd)
+            sys.stdout, sys.stderr = stdout, stderr
+    summary['duration'] = time.time() - start
+    return summary
+
+
+def _reap_bundle_model(summary):
+    """Destroy the model a bundle run left behind in the background.
+
+    :param summary: Summary of a bundle run
+    :type summary: dict
+    """
+    if summary.get('reap'):
+        reaper.reap(summary['reap'])
+
+
+def write_summary(summaries, summary_file):
+    """Log a summary of parallel bundle runs and write it to a file.
+
+    :param summaries: Summary of each bundle run
+    :type summaries: [dict, dict, ...]
+    :param summary_file: File to write the summary to
+    :type summary_file: str
+    """
+    lines = ['{:<6} {:>8.0f}s {} ({})'.format(
+        s['status'], s['duration'], s['bundle'], s['log_file'])
+        for s in summaries]
+    for line in lines:
+        logging.info(line)
+    with open(summary_file, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def run_bundles_parallel(bundles, test_config, keep_model=False,
+                         parallel=2, log_dir=None, background_destroy=False):
+    """Run up to parallel bundles at the same time.
+
+    Each bundle is run in a separate process, and so in a separate model,
+    so that process wide state like the current model cannot clash. The
+    output of each run goes to <log_dir>/<index>-<bundle>.log and a summary
+    of all runs to <log_dir>/summary.log.
+
+    :param bundles: Names of bundles to deploy
+    :type bundles: [str, str, ...]
+    :param test_config: Charm test configuration from tests.yaml
+    :type test_config: dict
+    :param keep_model: Whether to keep the model of the last bundle
+    :type keep_model: boolean
+    :param parallel: Maximum number of bundles to run at once
+    :type parallel: int
+    :param log_dir: Directory to write logs to
+    :type log_dir: str
+    :param background_destroy: Destroy models in the background from this
+                               process as each run finishes
+    :type background_destroy: boolean
+    :returns: Summary of each bundle run
+    :rtype: [dict, dict, ...]
+    :raises: BundleRunFailed
+    """
+    log_dir = log_dir or DEFAULT_LOG_DIR
+    os.makedirs(log_dir, exist_ok=True)
+    loglevel = logging.getLogger().getEffectiveLevel()
+    context = multiprocessing.get_context('spawn')
+    # One fresh process per bundle so no state is shared between runs
+    with context.Pool(processes=parallel, maxtasksperchild=1) as pool:
+        results = []
+        for i, bundle in enumerate(bundles):
+            # The index keeps the logs of a bundle run twice, or of bundles
+            # whose names only differ by '/' and '_', apart
+            log_file = os.path.join(
+                log_dir, '{}-{}.log'.format(i, bundle.replace('/', '_')))
+            logging.info('Running {} (logging to {})'.format(
+                bundle, log_file))
+            results.append(pool.apply_async(
+                _run_bundle_process,
+                (bundle, test_config,
+                 keep_model and i == len(bundles) - 1,
+                 log_file, loglevel, background_destroy),
+                callback=_reap_bundle_model))
+        summaries = [result.get() for result in results]
+    write_summary(summaries, os.path.join(log_dir, 'summary.log'))
+    failed = [s['bundle'] for s in summaries if s['status'] != 'PASS']
+    if failed:
+        raise BundleRunFailed(failed)
+    return summaries
+
+
+def func_test_runner(keep_model=False, smoke=False, dev=False, bundle=None,
+                     parallel=1, log_dir=None, pool_size=0, max_teardowns=2,
+                     background_destroy=False, model_name=None):
     """Deploy the bundles and run the tests as defined by the charms tests.yaml.
 
     :param keep_model: Whether to destroy model at end of run
@@ -36,6 +257,24 @@ def func_test_runner(keep_model=False, smoke=False, dev=False, bundle=None):
     :param dev: Whether to just run dev test.
     :type smoke: boolean
     :type dev: boolean
+    :param parallel: Maximum number of bundles to run at once
+    :type parallel: int
+    :param log_dir: Directory to write per bundle logs to when running
+                    bundles in parallel
+    :type log_dir: str
+    :param pool_size: Number of models to create ahead of use, models are
+                      created and destroyed as part of each run if unset
+    :type pool_size: int
+    :param max_teardowns: Maximum number of models from the pool being
+                          destroyed at the same time
+    :type max_teardowns: int
+    :param background_destroy: Destroy models in the background and only
+                               wait for them at the end of the run
+    :type background_destroy: boolean
+    :param model_name: Name of an existing model to apply the changes
+                       between it and the bundle to, the model is kept
+    :type model_name: str
+    :raises: ValueError
     """
     test_config = utils.get_charm_config()
     if bundle:
@@ -48,28 +287,43 @@ def func_test_runner(keep_model=False, smoke=False, dev=False, bundle=None):
         else:
             bundle_key = 'gate_bundles'
         bundles = test_config[bundle_key]
+    if model_name:
+        if len(bundles) > 1:
+            raise ValueError('An existing model can only be used to run a '
+                             'single bundle')
+        run_bundle(bundles[0], test_config, model_name=model_name)
+        return
+    if pool_size and parallel > 1:
+        raise ValueError('A model pool can only be used when running '
+                         'bundles one after another')
+    if parallel > 1 and len(bundles) > 1:
+        try:
+            run_bundles_parallel(bundles, test_config, keep_model=keep_model,
+                                 parallel=parallel, log_dir=log_dir,
+                                 background_destroy=background_destroy)
+        finally:
+            reaper.wait()
+        return
+    pool = None
+    if pool_size:
+        pool = model_pool.ModelPool(
+            size=pool_size,
+            max_teardowns=max_teardowns,
+            limit=len(bundles))
     last_test = bundles[-1]
-    for t in bundles:
-        model_name = utils.generate_model_name()
-        # Prepare
-        prepare.prepare(model_name)
-        # Deploy
-        deploy.deploy(
-            os.path.join(utils.BUNDLE_DIR, '{}.yaml'.format(t)),
-            model_name)
-        if 'configure' in test_config:
-            # Configure
-            configure.configure(model_name, test_config['configure'])
-        # Test
-        test.test(model_name, test_config['tests'])
-        # Destroy
-        # Keep the model from the last run if keep_model is true, this is to
-        # maintian compat with osci and should change when the zaza collect
-        # functions take over from osci for artifact collection.
-        if keep_model and t == last_test:
-            pass
-        else:
-            destroy.destroy(model_name)
+    try:
+        for t in bundles:
+            # Keep the model from the last run if keep_model is true, this is
+            # to maintian compat with osci and should change when the zaza
+            # collect functions take over from osci for artifact collection.
+            run_bundle(t, test_config,
+                       keep_model=keep_model and t == last_test,
+                       pool=pool,
+                       background_destroy=background_destroy)
+    finally:
+        if pool:
+            pool.close()
+        reaper.wait()
 
 
 def parse_args(args):
@@ -93,11 +347,43 @@ def parse_args(args):
     parser.add_argument('-b', '--bundle', dest='bundle',
                         help='Override the bundle to be run',
                         required=False)
+    parser.add_argument('--parallel', dest='parallel', type=int,
+                        help='Number of bundles to run at the same time')
+    parser.add_argument('--log-dir', dest='log_dir',
+                        help='Directory to write per bundle logs to when '
+                             'running bundles in parallel')
+    parser.add_argument('--model-pool', dest='pool_size', type=int,
+                        help='Number of models to create ahead of use and '
+                             'destroy in the background when running '
+                             'bundles one after another')
+    parser.add_argument('--max-teardowns', dest='max_teardowns', type=int,
+                        help='Maximum number of pool models being destroyed '
+                             'at the same time')
+    parser.add_argument('--background-destroy', dest='background_destroy',
+                        help='Destroy models in the background and wait for '
+                             'them at the end of the run',
+                        action='store_true')
+    parser.add_argument('-m', '--model-name', dest='model_name',
+                        help='Existing model to run against, only the '
+                             'changes between the bundle and the model are '
+                             'deployed and the model is kept')
+    parser.add_argument('--span-file', dest='span_file',
+                        help='Record how long each phase and zaza helper '
+                             'takes in this file, see functest-report')
+    parser.add_argument('--trace', dest='trace',
+                        help='Write a Chrome trace of the run to this file, '
+                             'spans are recorded in TRACE.spans unless '
+                             '--span-file is given')
     parser.add_argument('--log', dest='loglevel',
                         help='Loglevel [DEBUG|INFO|WARN|ERROR|CRITICAL]')
     parser.set_defaults(keep_model=False,
                         smoke=False,
                         dev=False,
+                        parallel=1,
+                        log_dir=DEFAULT_LOG_DIR,
+                        pool_size=0,
+                        max_teardowns=2,
+                        background_destroy=False,
                         loglevel='INFO')
     return parser.parse_args(args)
 
@@ -123,9 +409,28 @@ def main():
         raise ValueError('Ambiguous arguments: --bundle and '
                          '--smoke cannot be used together')
 
-    func_test_runner(
-        keep_model=args.keep_model,
-        smoke=args.smoke,
-        dev=args.dev,
-        bundle=args.bundle)
-    asyncio.get_event_loop().close()
+    span_file = args.span_file
+    if args.trace and not span_file:
+        span_file = '{}.spans'.format(args.trace)
+        if os.path.exists(span_file):
+            os.remove(span_file)
+    if span_file:
+        timing.set_span_file(span_file)
+
+    try:
+        func_test_runner(
+            keep_model=args.keep_model,
+            smoke=args.smoke,
+            dev=args.dev,
+            bundle=args.bundle,
+            parallel=args.parallel,
+            log_dir=args.log_dir,
+            pool_size=args.pool_size,
+            max_teardowns=args.max_teardowns,
+            background_destroy=args.background_destroy,
+            model_name=args.model_name)
+    finally:
+        if args.trace and os.path.exists(span_file):
+            report.write_trace(span_file, args.trace)
+    zaza.model.disconnect_models()
+    zaza.stop_run_loop()
@@ -0,0 +1,108 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pool of pre-created models to lease to bundle runs."""
+import concurrent.futures
+import logging
+
+import zaza.model
+
+import zaza.charm_lifecycle.prepare as prepare
+import zaza.charm_lifecycle.reaper as reaper
+import zaza.charm_lifecycle.utils as utils
+
+
+def create_model():
+    """Add a new model with the model settings and constraints applied.
+
+    :returns: Name of the new model
+    :rtype: str
+    """
+    model_name = utils.generate_model_name()
+    prepare.prepare(model_name)
+    return model_name
+
+
+class ModelPool(object):
+    """Pool of models created ahead of use and torn down in the background.
+
+    Models are added with the settings and constraints from MODEL_SETTINGS
+    and MODEL_CONSTRAINTS while the previous bundle is running, so a run
+    only waits for a model when none is ready yet. Returned models are
+    handed to the reaper, which destroys at most max_teardowns models at
+    once.
+    """
+
+    def __init__(self, size=1, max_teardowns=2, limit=None):
+        """Create a ModelPool.
+
+        :param size: Number of models to keep ready
+        :type size: int
+        :param max_teardowns: Maximum number of models being destroyed at
+                              the same time
+        :type max_teardowns: int
+        :param limit: Total number of models the pool will create, unlimited
+                      if unset
+        :type limit: int
+        """
+        self.size = size
+        self.max_teardowns = max_teardowns
+        self.limit = limit
+        self.created = 0
+        self._ready = []
+        self._creator = concurrent.futures.ThreadPoolExecutor(
+            max_workers=size)
+
+    def fill(self):
+        """Start creating models until size models are ready or pending."""
+        while len(self._ready) < self.size:
+            if self.limit is not None and self.created >= self.limit:
+                break
+            self._ready.append(
+                self._creator.submit(create_model))
+            self.created += 1
+
+    def lease(self):
+        """Take a ready model from the pool, waiting for one if needed.
+
+        :returns: Name of model
+        :rtype: str
+        """
+        self.fill()
+        future = self._ready.pop(0)
+        # Start preparing the replacement while the lease is in use
+        self.fill()
+        model_name = future.result()
+        logging.info('Leased model {}'.format(model_name))
+        return model_name
+
+    def release(self, model_name):
+        """Return a model to the pool to be destroyed in the background.
+
+        :param model_name: Name of model
+        :type model_name: str
+        """
+        zaza.model.disconnect_model(model_name)
+        reaper.get_reaper(max_destroys=self.max_teardowns).reap(model_name)
+
+    def close(self):
+        """Destroy unused models and wait for all teardowns to finish."""
+        for future in self._ready:
+            try:
+                self.release(future.result())
+            except Exception as e:
+                logging.warning('Failed to create model: {}'.format(e))
+        self._ready = []
+        self._creator.shutdown()
+        reaper.wait()
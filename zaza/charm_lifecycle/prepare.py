@@ -23,6 +23,7 @@ import zaza.controller
 import zaza.model
 
 import zaza.charm_lifecycle.utils as utils
+import zaza.utilities.timing as timing
 
 MODEL_DEFAULTS = {
     # Model defaults from charm-test-infra
@@ -84,6 +85,7 @@ def get_model_constraints():
     return parse_option_list_string(os.environ.get('MODEL_CONSTRAINTS', ''))
 
 
+@timing.timed('phase')
 def prepare(model_name):
     """Run all steps to prepare the environment before a functional test run.
 
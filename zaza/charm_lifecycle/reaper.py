@@ -0,0 +1,283 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Destroy models in the background."""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+import zaza.controller
+
+# Directory holding a state file for each model waiting to be destroyed
+REAPER_STATE_DIR = '.zaza-reaper'
+# Seconds to wait for a model to go away before destroying it with force
+FORCE_AFTER = 900
+# Seconds between checks on the models being destroyed
+POLL_INTERVAL = 10
+
+REAPER = None
+
+
+def _pid_alive(pid):
+    """Whether a process with the given pid is running.
+
+    :param pid: Process id
+    :type pid: int
+    :returns: Whether the process is running
+    :rtype: bool
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Reaper(object):
+    """Destroy models in a background thread.
+
+    Each model handed to the reaper is tracked in a state file of its own
+    under state_dir until it has gone from the controller. Models still
+    around force_after seconds after being destroyed are destroyed again
+    with force. At most max_destroys models are destroyed at once, a model
+    counts until it has gone from the controller. State files left behind
+    by a reaper that is no longer running are picked up when a new reaper
+    is started.
+    """
+
+    def __init__(self, state_dir=None, force_after=None, poll_interval=None,
+                 max_destroys=None):
+        """Create a Reaper.
+
+        :param state_dir: Directory to keep state files in
+        :type state_dir: str
+        :param force_after: Seconds before a model is destroyed with force
+        :type force_after: float
+        :param poll_interval: Seconds between checks on the models
+        :type poll_interval: float
+        :param max_destroys: Maximum number of models being destroyed at the
+                             same time, unlimited if unset
+        :type max_destroys: int
+        """
+        self.state_dir = state_dir or REAPER_STATE_DIR
+        self.force_after = force_after or FORCE_AFTER
+        self.poll_interval = poll_interval or POLL_INTERVAL
+        self.max_destroys = max_destroys
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pending = {}
+        os.makedirs(self.state_dir, exist_ok=True)
+        self._adopt()
+
+    def _state_file(self, model_name):
+        return os.path.join(self.state_dir, '{}.json'.format(model_name))
+
+    def _save(self, state):
+        with open(self._state_file(state['model']), 'w') as f:
+            json.dump(state, f)
+
+    def _adopt(self):
+        """Pick up models left behind by reapers that are no longer running.
+
+        Every state file whose process has gone is picked up, whether or not
+        that reaper got to destroy the model, and the reaper thread is started
+        to destroy them.
+        """
+        for state_file in sorted(os.listdir(self.state_dir)):
+            try:
+                with open(os.path.join(self.state_dir, state_file)) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if state['pid'] == os.getpid() or _pid_alive(state['pid']):
+                continue
+            logging.info('Resuming destroy of model {}'.format(
+                state['model']))
+            state['pid'] = os.getpid()
+            self._save(state)
+            self._pending[state['model']] = state
+        if self._pending:
+            with self._lock:
+                self._start()
+
+    def pending(self):
+        """Return the names of models waiting to be destroyed.
+
+        :returns: Names of models
+        :rtype: [str, str, ...]
+        """
+        with self._lock:
+            return sorted(self._pending.keys())
+
+    def reap(self, model_name):
+        """Hand a model to the reaper to destroy and return at once.
+
+        :param model_name: Name of model to destroy
+        :type model_name: str
+        """
+        state = {
+            'model': model_name,
+            'pid': os.getpid(),
+            'requested': None,
+            'forced': False}
+        logging.info('Destroying model {} in the background'.format(
+            model_name))
+        with self._lock:
+            self._save(state)
+            self._pending[model_name] = state
+            self._start()
+
+    def _start(self):
+        """Start the reaper thread unless it is running.
+
+        Must be called with the lock held, the thread only decides to exit
+        while holding it so a model added here is never left behind.
+
+        :returns: Reaper thread
+        :rtype: threading.Thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._wake.set()
+            return self._thread
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _run(self):
+        """Destroy pending models until there are none left."""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+            self._wake.clear()
+            self.reap_once()
+            self._wake.wait(self.poll_interval)
+
+    def reap_once(self):
+        """Make one pass over the models waiting to be destroyed."""
+        try:
+            models = zaza.controller.list_models()
+        except Exception as e:
+            logging.warning('Unable to list models: {}'.format(e))
+            return
+        with self._lock:
+            states = list(self._pending.values())
+        destroying = len([
+            state for state in states
+            if state['requested'] is not None and state['model'] in models])
+        for state in states:
+            model_name = state['model']
+            try:
+                if state['requested'] is None:
+                    if (self.max_destroys and
+                            destroying >= self.max_destroys):
+                        continue
+                    zaza.controller.destroy_model(model_name)
+                    state['requested'] = time.time()
+                    destroying += 1
+                elif model_name not in models:
+                    logging.info('Model {} destroyed'.format(model_name))
+                    self._done(model_name)
+                    continue
+                elif (not state['forced'] and
+                      time.time() - state['requested'] > self.force_after):
+                    logging.warning('Destroying stuck model {} with '
+                                    'force'.format(model_name))
+                    zaza.controller.destroy_model(model_name, force=True)
+                    state['forced'] = True
+            except Exception as e:
+                logging.warning('Failed to destroy model {}: {}'.format(
+                    model_name, e))
+                continue
+            with self._lock:
+                self._save(state)
+
+    def _done(self, model_name):
+        with self._lock:
+            del self._pending[model_name]
+            try:
+                os.remove(self._state_file(model_name))
+            except FileNotFoundError:
+                pass
+
+    def wait(self, timeout=None):
+        """Wait for all pending models to be destroyed.
+
+        :param timeout: Seconds to wait, waits forever if unset
+        :type timeout: float
+        :returns: Names of models that are still waiting to be destroyed
+        :rtype: [str, str, ...]
+        """
+        if self.pending():
+            with self._lock:
+                thread = self._start()
+            logging.info('Waiting for models to be destroyed: {}'.format(
+                ', '.join(self.pending())))
+            thread.join(timeout)
+        remaining = self.pending()
+        if remaining:
+            logging.warning('Models not yet destroyed: {}'.format(
+                ', '.join(remaining)))
+        return remaining
+
+
+def get_reaper(max_destroys=None):
+    """Return the reaper of this process, creating it if needed.
+
+    :param max_destroys: Maximum number of models being destroyed at the same
+                         time, left as it is if unset
+    :type max_destroys: int
+    :returns: Reaper
+    :rtype: Reaper
+    """
+    global REAPER
+    if REAPER is None:
+        REAPER = Reaper()
+    if max_destroys is not None:
+        REAPER.max_destroys = max_destroys
+    return REAPER
+
+
+def reap(model_name):
+    """Destroy the model in the background.
+
+    :param model_name: Name of model to destroy
+    :type model_name: str
+    """
+    get_reaper().reap(model_name)
+
+
+def wait(timeout=None):
+    """Wait for models being destroyed in the background.
+
+    :param timeout: Seconds to wait, waits forever if unset
+    :type timeout: float
+    :returns: Names of models that are still waiting to be destroyed
+    :rtype: [str, str, ...]
+    """
+    if REAPER is None:
+        return []
+    return REAPER.wait(timeout=timeout)
+
+
+@atexit.register
+def _wait_at_exit():
+    wait()
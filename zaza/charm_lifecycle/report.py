@@ -0,0 +1,210 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Report where the time of a run recorded with --span-file went."""
+import argparse
+import collections
+import json
+import math
+import sys
+
+import zaza.utilities.timing as timing
+
+# Order in which kinds of span are reported, other kinds follow
+KIND_ORDER = ['bundle', 'phase', 'test', 'test_method', 'model', 'command']
+
+
+def percentile(values, pct):
+    """Return the pct percentile of values using the nearest rank.
+
+    :param values: Values to pick from
+    :type values: [float, float, ...]
+    :param pct: Percentile, between 0 and 100
+    :type pct: float
+    :returns: Percentile, None if there are no values
+    :rtype: Optional[float]
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(int(math.ceil(pct / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+def summarise(spans):
+    """Summarise the durations of spans by kind and name.
+
+    :param spans: Spans as written by zaza.utilities.timing
+    :type spans: [dict, dict, ...]
+    :returns: Summaries keyed on kind then name, each with count, errors,
+              total, p50, p95 and max
+    :rtype: Dict[str, Dict[str, dict]]
+    """
+    durations = collections.defaultdict(list)
+    errors = collections.Counter()
+    for span in spans:
+        key = (span['kind'], span['name'])
+        durations[key].append(span['duration'])
+        if span.get('outcome') == 'error':
+            errors[key] += 1
+    summary = collections.defaultdict(dict)
+    for (kind, name), values in durations.items():
+        summary[kind][name] = {
+            'count': len(values),
+            'errors': errors[(kind, name)],
+            'total': sum(values),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'max': max(values)}
+    return dict(summary)
+
+
+def format_report(summary):
+    """Format a summary as a table per kind, slowest totals first.
+
+    :param summary: Summary as returned by summarise
+    :type summary: Dict[str, Dict[str, dict]]
+    :returns: Report
+    :rtype: str
+    """
+    kinds = [k for k in KIND_ORDER if k in summary]
+    kinds.extend(sorted(k for k in summary if k not in KIND_ORDER))
+    lines = []
+    for kind in kinds:
+        rows = sorted(
+            summary[kind].items(),
+            key=lambda item: item[1]['total'],
+            reverse=True)
+        width = max([len(kind)] + [len(name) for name, _ in rows])
+        if lines:
+            lines.append('')
+        lines.append(
+            '{:<{w}} {:>7} {:>7} {:>10} {:>9} {:>9} {:>9}'.format(
+                kind, 'count', 'errors', 'total', 'p50', 'p95', 'max',
+                w=width))
+        for name, stats in rows:
+            lines.append(
+                '{:<{w}} {:>7} {:>7} {:>10.1f} {:>9.1f} {:>9.1f} '
+                '{:>9.1f}'.format(
+                    name, stats['count'], stats['errors'], stats['total'],
+                    stats['p50'], stats['p95'], stats['max'], w=width))
+    return '\n'.join(lines)
+
+
+def _track_for(span, tracks, track_of):
+    """Pick the track of a trace to show span on.
+
+    Spans go on the track of their parent while no sibling is running on
+    it, otherwise on a free track, so work running at the same time is
+    shown side by side.
+
+    :param span: Span to place
+    :type span: dict
+    :param tracks: Stack of running spans for each track, updated in place
+    :type tracks: [[dict, ...], ...]
+    :param track_of: Track of each span placed so far keyed on span id
+    :type track_of: Dict[str, int]
+    :returns: Track number
+    :rtype: int
+    """
+    for stack in tracks:
+        while stack and stack[-1]['end'] <= span['start']:
+            stack.pop()
+    track = track_of.get(span.get('parent'))
+    if track is None or not (tracks[track] and
+                             tracks[track][-1]['id'] == span['parent']):
+        track = next(
+            (i for i, stack in enumerate(tracks) if not stack), len(tracks))
+    if track == len(tracks):
+        tracks.append([])
+    tracks[track].append(span)
+    track_of[span.get('id')] = track
+    return track
+
+
+def trace_events(spans):
+    """Convert spans to Chrome trace events.
+
+    :param spans: Spans as written by zaza.utilities.timing
+    :type spans: [dict, dict, ...]
+    :returns: Trace, as loaded by chrome://tracing or Perfetto
+    :rtype: dict
+    """
+    events = []
+    by_pid = collections.defaultdict(list)
+    for span in spans:
+        by_pid[span['pid']].append(span)
+    for pid, pid_spans in sorted(by_pid.items()):
+        tracks = []
+        track_of = {}
+        for span in sorted(pid_spans,
+                           key=lambda s: (s['start'], -s['end'])):
+            args = dict(span.get('attributes', {}))
+            args['outcome'] = span.get('outcome')
+            if span.get('error'):
+                args['error'] = span['error']
+            events.append({
+                'name': span['name'],
+                'cat': span['kind'],
+                'ph': 'X',
+                'ts': span['start'] * 1000000,
+                'dur': span['duration'] * 1000000,
+                'pid': pid,
+                'tid': _track_for(span, tracks, track_of),
+                'args': args})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def write_trace(span_file, trace_file):
+    """Write the spans in span_file to trace_file as Chrome trace events.
+
+    :param span_file: Path to span file
+    :type span_file: str
+    :param trace_file: Path to write trace to
+    :type trace_file: str
+    """
+    with open(trace_file, 'w') as f:
+        json.dump(trace_events(timing.read_spans(span_file)), f)
+
+
+def parse_args(args):
+    """Parse command line arguments.
+
+    :param args: List of command line arguments
+    :type args: [str1, str2,...]
+    :returns: Parsed arguments
+    :rtype: Namespace
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('span_file',
+                        help='Span file written by functest-run-suite '
+                             '--span-file')
+    parser.add_argument('-k', '--kind', dest='kinds', nargs='+',
+                        help='Only report these kinds of span, e.g. phase '
+                             'test model')
+    parser.add_argument('--trace', dest='trace',
+                        help='Also write the spans to this file as Chrome '
+                             'trace events')
+    return parser.parse_args(args)
+
+
+def main():
+    """Print the time taken by each phase, test and zaza helper."""
+    args = parse_args(sys.argv[1:])
+    if args.trace:
+        write_trace(args.span_file, args.trace)
+    summary = summarise(timing.read_spans(args.span_file))
+    if args.kinds:
+        summary = {k: v for k, v in summary.items() if k in args.kinds}
+    print(format_report(summary))
@@ -13,35 +13,260 @@
 # limitations under the License.
 
 """Run test phase."""
-import asyncio
 import argparse
+import concurrent.futures
+import contextlib
+import io
 import logging
+import threading
 import unittest
 import sys
 
 import zaza.model
 import zaza.charm_lifecycle.utils as utils
+import zaza.utilities.timing as timing
 
+# Number of parallel safe test classes run at the same time
+PARALLEL_WORKERS = 4
 
-def run_test_list(tests):
-    """Run the tests as defined in the list of test classes in series.
+
+class TimedTestResult(unittest.TextTestResult):
+    """Test result recording a span for each test method."""
+
+    def startTest(self, test):
+        """Start the span of a test method.
+
+        :param test: Test about to be run
+        :type test: unittest.TestCase
+        """
+        self._problems = len(self.errors) + len(self.failures)
+        self._span = timing.span(test.id(), 'test_method').open()
+        super(TimedTestResult, self).startTest(test)
+
+    def stopTest(self, test):
+        """End the span of a test method.
+
+        :param test: Test that has been run
+        :type test: unittest.TestCase
+        """
+        super(TimedTestResult, self).stopTest(test)
+        failed = len(self.errors) + len(self.failures) > self._problems
+        self._span.close('TestFailure' if failed else None)
+
+
+def is_parallel_safe(testcase_name, testcase, parallel_safe_tests=None):
+    """Check whether a test class can run at the same time as others.
+
+    :param testcase_name: Name of the test class as given in tests.yaml
+    :type testcase_name: str
+    :param testcase: Test class
+    :type testcase: unittest.TestCase
+    :param parallel_safe_tests: Names of test classes marked parallel safe in
+                                tests.yaml
+    :type parallel_safe_tests: [str, str, ...]
+    :returns: Whether the test class is parallel safe
+    :rtype: bool
+    """
+    if testcase_name in (parallel_safe_tests or []):
+        return True
+    # Subclasses of a parallel safe class have to be marked themselves
+    own_attributes = getattr(testcase, '__dict__', {})
+    return own_attributes.get('parallel_safe', False) is True
+
+
+class _BufferedLogHandler(logging.Handler):
+    """Write log records of threads running test classes to their streams.
+
+    While installed, records from those threads are kept from the other
+    handlers of the root logger, so the logs of test classes run at the
+    same time are not interleaved.
+    """
+
+    def __init__(self):
+        """Create a _BufferedLogHandler."""
+        super(_BufferedLogHandler, self).__init__()
+        self._streams = {}
+        self._handlers = []
+
+    def _unbuffered(self, record):
+        return record.thread not in self._streams
+
+    def install(self):
+        """Add the handler to the root logger."""
+        root = logging.getLogger()
+        self._handlers = list(root.handlers)
+        formatter = next(
+            (h.formatter for h in self._handlers if h.formatter), None)
+        self.setFormatter(
+            formatter or logging.Formatter(logging.BASIC_FORMAT))
+        for handler in self._handlers:
+            handler.addFilter(self._unbuffered)
+        root.addHandler(self)
+
+    def uninstall(self):
+        """Remove the handler from the root logger."""
+        logging.getLogger().removeHandler(self)
+        for handler in self._handlers:
+            handler.removeFilter(self._unbuffered)
+        self._handlers = []
+
+    @contextlib.contextmanager
+    def capture(self, stream):
+        """Send the log records of the calling thread to stream.
+
+        :param stream: Stream to write log records to
+        :type stream: io.TextIOBase
+        """
+        self._streams[threading.get_ident()] = stream
+        try:
+            yield
+        finally:
+            del self._streams[threading.get_ident()]
+
+    def emit(self, record):
+        """Write a log record to the stream of the thread that logged it.
+
+        :param record: Log record
+        :type record: logging.LogRecord
+        """
+        stream = self._streams.get(record.thread)
+        if stream is None:
+            return
+        try:
+            stream.write(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+
+def run_test_class(testcase_name, testcase, stream=None):
+    """Run the tests of a test class.
+
+    :param testcase_name: Name of the test class as given in tests.yaml
+    :type testcase_name: str
+    :param testcase: Test class
+    :type testcase: unittest.TestCase
+    :param stream: Stream to write the output of the run to, stderr if unset
+    :type stream: Optional[io.TextIOBase]
+    :returns: Result of the run
+    :rtype: unittest.TestResult
+    """
+    logging.info('## Running Test {} ##'.format(testcase_name))
+    suite = unittest.TestLoader().loadTestsFromTestCase(testcase)
+    with timing.span(testcase_name, 'test'):
+        return unittest.TextTestRunner(
+            stream=stream,
+            verbosity=2,
+            resultclass=TimedTestResult).run(suite)
+
+
+def run_parallel_test_classes(testcases, workers=None):
+    """Run test classes at the same time.
+
+    The output and logs of each test class are buffered and written to
+    stderr in the order the classes were given once they have all run.
+
+    :param testcases: Names and classes of the tests to run
+    :type testcases: [(str, unittest.TestCase), ...]
+    :param workers: Number of test classes run at the same time
+    :type workers: int
+    :returns: Results of the runs in the order the classes were given
+    :rtype: [unittest.TestResult, ...]
+    :raises: AssertionError if test run fails
+    """
+    logging.info('## Running {} test classes in parallel ##'.format(
+        len(testcases)))
+    streams = [io.StringIO() for _ in testcases]
+    log_handler = _BufferedLogHandler()
+
+    def _run_buffered(testcase_name, testcase, stream):
+        with log_handler.capture(stream):
+            return run_test_class(testcase_name, testcase, stream)
+
+    log_handler.install()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers or PARALLEL_WORKERS) as executor:
+            futures = [
+                executor.submit(
+                    zaza.model.in_model_context(_run_buffered),
+                    name, testcase, stream)
+                for (name, testcase), stream in zip(testcases, streams)]
+            results = [f.result() for f in futures]
+    finally:
+        log_handler.uninstall()
+    for (name, _), stream in zip(testcases, streams):
+        sys.stderr.write('## Output of {} ##\n'.format(name))
+        sys.stderr.write(stream.getvalue())
+    failed = [name for (name, _), result in zip(testcases, results)
+              if not result.wasSuccessful()]
+    logging.info(
+        '## Ran {} tests in {} parallel test classes: {} failures, {} '
+        'errors, {} skipped ##'.format(
+            sum(r.testsRun for r in results),
+            len(testcases),
+            sum(len(r.failures) for r in results),
+            sum(len(r.errors) for r in results),
+            sum(len(r.skipped) for r in results)))
+    assert not failed, "Test run failed: {}".format(', '.join(failed))
+    return results
+
+
+def _run_batch(batch, workers):
+    """Run a batch of parallel safe test classes.
+
+    :param batch: Names and classes of the tests to run
+    :type batch: [(str, unittest.TestCase), ...]
+    :param workers: Number of test classes run at the same time
+    :type workers: int
+    :raises: AssertionError if test run fails
+    """
+    if len(batch) > 1:
+        run_parallel_test_classes(batch, workers=workers)
+    elif batch:
+        test_result = run_test_class(*batch[0])
+        assert test_result.wasSuccessful(), "Test run failed"
+
+
+def run_test_list(tests, parallel_safe_tests=None, workers=None):
+    """Run the tests as defined in the list of test classes.
+
+    Test classes are run in series, except for parallel safe classes next
+    to each other in the list, which are run at the same time. A class is
+    parallel safe if it is decorated with
+    zaza.charm_tests.test_utils.parallel_safe or listed in
+    parallel_safe_tests.
 
     :param tests: List of test class strings
     :type tests: ['zaza.charms_tests.svc.TestSVCClass1', ...]
+    :param parallel_safe_tests: Test class strings marked parallel safe in
+                                tests.yaml
+    :type parallel_safe_tests: ['zaza.charms_tests.svc.TestSVCClass1', ...]
+    :param workers: Number of parallel safe test classes run at the same time
+    :type workers: int
     :raises: AssertionError if test run fails
     """
+    batch = []
     for _testcase in tests:
-        logging.info('## Running Test {} ##'.format(_testcase))
         testcase = utils.get_class(_testcase)
-        suite = unittest.TestLoader().loadTestsFromTestCase(testcase)
-        test_result = unittest.TextTestRunner(verbosity=2).run(suite)
+        if is_parallel_safe(_testcase, testcase, parallel_safe_tests):
+            batch.append((_testcase, testcase))
+            continue
+        _run_batch(batch, workers)
+        batch = []
+        test_result = run_test_class(_testcase, testcase)
         assert test_result.wasSuccessful(), "Test run failed"
+    _run_batch(batch, workers)
 
 
-def test(model_name, tests):
+@timing.timed('phase')
+def test(model_name, tests, parallel_safe_tests=None, workers=None):
     """Run all steps to execute tests against the model."""
     zaza.model.set_juju_model(model_name)
-    run_test_list(tests)
+    with zaza.model.use_model(model_name):
+        run_test_list(
+            tests,
+            parallel_safe_tests=parallel_safe_tests,
+            workers=workers)
 
 
 def parse_args(args):
@@ -58,6 +283,10 @@ def parse_args(args):
                         required=False)
     parser.add_argument('-m', '--model-name', help='Name of model to remove',
                         required=True)
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Number of parallel safe test classes run at '
+                             'the same time, default {}'.format(
+                                 PARALLEL_WORKERS))
     parser.add_argument('--log', dest='loglevel',
                         help='Loglevel [DEBUG|INFO|WARN|ERROR|CRITICAL]')
     parser.set_defaults(loglevel='INFO')
@@ -75,6 +304,14 @@ def main():
     if not isinstance(level, int):
         raise ValueError('Invalid log level: "{}"'.format(args.loglevel))
     logging.basicConfig(level=level)
-    tests = args.tests or utils.get_charm_config()['tests']
-    test(args.model_name, tests)
-    asyncio.get_event_loop().close()
+    if args.tests:
+        tests = args.tests
+        parallel_safe_tests = None
+    else:
+        test_config = utils.get_charm_config()
+        tests = test_config['tests']
+        parallel_safe_tests = test_config.get('parallel_safe_tests')
+    test(args.model_name, tests, parallel_safe_tests=parallel_safe_tests,
+         workers=args.workers)
+    zaza.model.disconnect_models()
+    zaza.stop_run_loop()
@@ -119,19 +119,24 @@ class CharmOperationTest(BaseKeystoneTest):
                         'repository "{}"'.format(KEY_KEY_REPOSITORY, repo))
 
             # get on-disk key repository from all units
-            on_disk = {}
             units = zaza.model.get_units(self.application_name)
-            for unit in units:
-                on_disk[unit.entity_id] = {}
-                for repo in [CREDENTIAL_KEY_REPOSITORY, FERNET_KEY_REPOSITORY]:
-                    on_disk[unit.entity_id][repo] = {}
-                    result = zaza.model.run_on_unit(
-                        unit.entity_id, 'sudo ls -1 {}'.format(repo))
-                    for key_name in result.get('Stdout').split():
-                        result = zaza.model.run_on_unit(
-                            unit.entity_id,
-                            'sudo cat {}/{}'.format(repo, key_name))
-                        on_disk[unit.entity_id][repo][key_name] = result.get(
+            unit_names = [unit.entity_id for unit in units]
+            on_disk = {unit_name: {} for unit_name in unit_names}
+            for repo in [CREDENTIAL_KEY_REPOSITORY, FERNET_KEY_REPOSITORY]:
+                # list the repository on all units with a single juju run
+                key_names = {}
+                results = zaza.model.run_on_units(
+                    unit_names, 'sudo ls -1 {}'.format(repo))
+                for unit_name, result in results.items():
+                    on_disk[unit_name][repo] = {}
+                    for key_name in result.get('Stdout', '').split():
+                        key_names.setdefault(key_name, []).append(unit_name)
+                # then read each key from every unit that has it
+                for key_name, key_units in key_names.items():
+                    results = zaza.model.run_on_units(
+                        key_units, 'sudo cat {}/{}'.format(repo, key_name))
+                    for unit_name, result in results.items():
+                        on_disk[unit_name][repo][key_name] = result.get(
                             'Stdout')
             # sort keys so we can compare it to leader storage repositories
             on_disk = json.loads(
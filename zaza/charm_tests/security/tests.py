@@ -39,12 +39,11 @@ def _make_test_function(application, file_details, paths=None):
     :rtype: unittest.TestCase
     """
     def test(self):
-        for unit in model.get_units(application):
-            unit = unit.entity_id
-            if '*' in file_details['path']:
-                assert_path_glob(self, unit, file_details, paths)
-            else:
-                assert_single_file(self, unit, file_details)
+        units = [unit.entity_id for unit in model.get_units(application)]
+        if '*' in file_details['path']:
+            assert_path_glob(self, units, file_details, paths)
+        else:
+            assert_single_file(self, units, file_details)
     return test
 
 
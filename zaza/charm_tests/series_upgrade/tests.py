@@ -24,6 +24,7 @@ from zaza import model
 from zaza.utilities import (
     cli as cli_utils,
     generic as generic_utils,
+    upgrade_state,
 )
 from zaza.charm_tests.nova.tests import LTSGuestCreateTest
 
@@ -39,6 +40,9 @@ class SeriesUpgradeTest(unittest.TestCase):
         cls.to_series = None
         cls.workaround_script = None
         cls.files = []
+        # Number of non-leader units of an application upgraded at the same
+        # time
+        cls.batch_size = None
 
     def test_200_run_series_upgrade(self):
         """Run series upgrade."""
@@ -46,7 +50,10 @@ class SeriesUpgradeTest(unittest.TestCase):
         os.environ["JUJU_DEV_FEATURE_FLAGS"] = "upgrade-series"
 
         applications = model.get_status().applications
-        completed_machines = []
+        # Steps done on each machine are kept in the working directory so
+        # an interrupted upgrade carries on where it stopped when run again
+        state = upgrade_state.SeriesUpgradeState.for_model(
+            model.get_juju_model(), self.to_series)
         for application in applications:
             # Defaults
             origin = "openstack-origin"
@@ -82,7 +89,8 @@ class SeriesUpgradeTest(unittest.TestCase):
                     application,
                     from_series=self.from_series,
                     to_series=self.to_series,
-                    completed_machines=completed_machines)
+                    batch_size=self.batch_size,
+                    state=state)
                 continue
 
             # The rest are likley APIs use defaults
@@ -94,9 +102,11 @@ class SeriesUpgradeTest(unittest.TestCase):
                 from_series=self.from_series,
                 to_series=self.to_series,
                 origin=origin,
-                completed_machines=completed_machines,
                 workaround_script=self.workaround_script,
-                files=self.files)
+                files=self.files,
+                batch_size=self.batch_size,
+                state=state)
+        state.remove()
 
 
 class OpenStackSeriesUpgrade(SeriesUpgradeTest):
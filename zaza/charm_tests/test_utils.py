@@ -38,6 +38,22 @@ def skipIfNotHA(service_name):
     return _skipIfNotHA_inner_1
 
 
+def parallel_safe(cls):
+    """Mark a test class as safe to run at the same time as others.
+
+    Only mark classes that do not change the deployment, such as ones that
+    only read state or run read only actions. Subclasses are not parallel
+    safe unless they are marked too.
+
+    :param cls: Test class
+    :type cls: unittest.TestCase
+    :returns: The test class
+    :rtype: unittest.TestCase
+    """
+    cls.parallel_safe = True
+    return cls
+
+
 def audit_assertions(action,
                      expected_passes,
                      expected_failures=None,
@@ -109,6 +125,11 @@ class OpenStackBaseTest(unittest.TestCase):
         """
         if not application_name:
             application_name = self.application_name
+        # only the application and its subordinates are waited on
+        applications = [application_name] + (
+            model.get_subordinate_applications(
+                application_name,
+                model_name=self.model_name))
         # we need to compare config values to what is already applied before
         # attempting to set them.  otherwise the model will behave differently
         # than we would expect while waiting for completion of the change
@@ -147,9 +168,11 @@ class OpenStackBaseTest(unittest.TestCase):
                 'Waiting for units to reach target states')
             model.wait_for_application_states(
                 model_name=self.model_name,
-                states=self.test_config.get('target_deploy_status', {}))
-            # TODO: Optimize with a block on a specific application until idle.
-            model.block_until_all_units_idle()
+                states=self.test_config.get('target_deploy_status', {}),
+                applications=applications)
+            model.block_until_application_idle(
+                application_name,
+                model_name=self.model_name)
 
             yield
 
@@ -163,9 +186,11 @@ class OpenStackBaseTest(unittest.TestCase):
             'Waiting for units to reach target states')
         model.wait_for_application_states(
             model_name=self.model_name,
-            states=self.test_config.get('target_deploy_status', {}))
-        # TODO: Optimize with a block on a specific application until idle.
-        model.block_until_all_units_idle()
+            states=self.test_config.get('target_deploy_status', {}),
+            applications=applications)
+        model.block_until_application_idle(
+            application_name,
+            model_name=self.model_name)
 
     def restart_on_changed(self, config_file, default_config, alternate_config,
                            default_entry, alternate_entry, services):
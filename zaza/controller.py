@@ -41,16 +41,22 @@ async def async_add_model(model_name, config=None):
 add_model = sync_wrapper(async_add_model)
 
 
-async def async_destroy_model(model_name):
+async def async_destroy_model(model_name, force=False):
     """Remove a model from the current controller.
 
     :param model_name: Name of model to remove
     :type model_name: str
+    :param force: Ignore operational errors, e.g. machines that cannot be
+                  released, while removing the model
+    :type force: bool
     """
     controller = Controller()
     await controller.connect()
     logging.debug("Destroying model {}".format(model_name))
-    await controller.destroy_model(model_name)
+    if force:
+        await controller.destroy_model(model_name, force=True)
+    else:
+        await controller.destroy_model(model_name)
     await controller.disconnect()
 
 destroy_model = sync_wrapper(async_destroy_model)
@@ -20,21 +20,40 @@ mostly via libjuju. Async function also provice a non-async alternative via
 """
 
 import asyncio
+import atexit
 from async_generator import async_generator, yield_, asynccontextmanager
+import contextlib
+import functools
+import hashlib
+import json
 import logging
 import os
+import shlex
 import subprocess
-import tempfile
+import websockets
 import yaml
-from oslo_config import cfg
+from oslo_config import iniparser
 import concurrent
 
+from juju.client import client
 from juju.errors import JujuError
 from juju.model import Model
 
 from zaza import sync_wrapper
+import zaza.utilities.ssh as ssh
+import zaza.utilities.timing as timing
+
+try:
+    import contextvars
+except ImportError:
+    # Python 3.6, use_model changes the process wide model instead
+    contextvars = None
 
 CURRENT_MODEL = None
+if contextvars:
+    MODEL_CONTEXT = contextvars.ContextVar('zaza_model', default=None)
+else:
+    MODEL_CONTEXT = None
 
 
 class ModelTimeout(Exception):
@@ -54,16 +73,97 @@ def set_juju_model(model_name):
     CURRENT_MODEL = model_name
 
 
+def get_context_model():
+    """Return the model set by the use_model block the caller is in.
+
+    :returns: Model name, None outside a use_model block
+    :rtype: Optional[str]
+    """
+    if MODEL_CONTEXT is None:
+        return None
+    return MODEL_CONTEXT.get()
+
+
+@contextlib.contextmanager
+def use_model(model_name):
+    """Run the zaza helpers called in the block against model_name.
+
+    Helpers called without a model_name use model_name rather than the model
+    set with set_juju_model. The model is held in a context variable, so it
+    follows the code into asyncio tasks and sync wrappers, and blocks in
+    different threads or tasks can use different models at the same time.
+    Threads do not inherit the model, wrap the functions they run with
+    in_model_context. On Python 3.6, which lacks contextvars, the process
+    wide model is changed for the duration of the block instead.
+
+    Example of using use_model:
+        with use_model('zaza-1234'):
+            get_units('keystone')
+
+    :param model_name: Name of model
+    :type model_name: str
+    :returns: The model name
+    :rtype: Iterator[str]
+    """
+    global CURRENT_MODEL
+    if MODEL_CONTEXT is not None:
+        token = MODEL_CONTEXT.set(model_name)
+        try:
+            yield model_name
+        finally:
+            MODEL_CONTEXT.reset(token)
+    else:
+        previous = CURRENT_MODEL
+        CURRENT_MODEL = model_name
+        try:
+            yield model_name
+        finally:
+            CURRENT_MODEL = previous
+
+
+def in_model_context(func):
+    """Bind func to the model of the use_model block the caller is in.
+
+    Where contextvars is available the whole of the caller's context is
+    carried over, so spans recorded by func are also nested in the caller's.
+
+    :param func: Function to be run in another thread
+    :type func: Callable
+    :returns: Function running func against the caller's model
+    :rtype: Callable
+    """
+    if contextvars:
+        context = contextvars.copy_context()
+
+        @functools.wraps(func)
+        def _run_in_context(*args, **kwargs):
+            return context.copy().run(func, *args, **kwargs)
+        return _run_in_context
+    model_name = get_context_model()
+
+    @functools.wraps(func)
+    def _wrapper(*args, **kwargs):
+        if model_name is None:
+            return func(*args, **kwargs)
+        with use_model(model_name):
+            return func(*args, **kwargs)
+    return _wrapper
+
+
 async def async_get_juju_model():
     """Retrieve current model.
 
-    First check the environment for JUJU_MODEL. If this is not set, get the
-    current active model.
+    The model of the use_model block the caller is in comes first, then
+    the model set with set_juju_model. Then check the environment for
+    JUJU_MODEL. If this is not set, get the current active model.
 
     :returns: In focus model name
     :rtype: str
     """
     global CURRENT_MODEL
+    context_model = get_context_model()
+    if context_model:
+        return context_model
     if CURRENT_MODEL:
         return CURRENT_MODEL
     # LY: I think we should remove the KeyError handling. I don't think we
@@ -135,6 +235,127 @@ def get_unit_from_name(unit_name, model=None, model_name=None):
     return unit
 
 
+# Connected libjuju Model objects, keyed by model name. Each entry is a
+# (model, loop) tuple as a connection can only be used from the event loop
+# that created it.
+MODEL_CONNECTIONS = {}
+# Locks making sure one connection is made to each model when connections are
+# asked for at the same time, mapping the model name to the lock and the
+# event loop it belongs to.
+MODEL_CONNECTION_LOCKS = {}
+
+
+def _model_connection_is_usable(model, loop):
+    """Check whether a pooled model connection can be reused.
+
+    :param model: Pooled model connection
+    :type model: juju.model.Model
+    :param loop: Event loop the connection was created on
+    :type loop: asyncio.AbstractEventLoop
+    :returns: Whether the connection is open and usable from the current loop
+    :rtype: bool
+    """
+    if loop.is_closed() or loop is not asyncio.get_event_loop():
+        return False
+    return model.is_connected()
+
+
+def _get_model_connection_lock(model_name):
+    """Return the lock guarding connects to a model from the current loop.
+
+    :param model_name: Name of model
+    :type model_name: str
+    :returns: Lock
+    :rtype: asyncio.Lock
+    """
+    lock, loop = MODEL_CONNECTION_LOCKS.get(model_name, (None, None))
+    if lock is None or loop is not asyncio.get_event_loop():
+        lock = asyncio.Lock()
+        MODEL_CONNECTION_LOCKS[model_name] = (
+            lock, asyncio.get_event_loop())
+    return lock
+
+
+async def _async_disconnect_pooled(model, loop):
+    """Disconnect a pooled model connection on the loop it belongs to.
+
+    :param model: Pooled model connection
+    :type model: juju.model.Model
+    :param loop: Event loop the connection was created on
+    :type loop: asyncio.AbstractEventLoop
+    """
+    if loop.is_closed():
+        return
+    if loop is asyncio.get_event_loop():
+        await model.disconnect()
+    elif loop.is_running():
+        # e.g. the zaza event loop, running in its own thread
+        await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(model.disconnect(), loop))
+
+
+async def async_get_model_connection(model_name):
+    """Return a connected libjuju model from the connection pool.
+
+    A new connection is made if there is no pooled connection for the model
+    or if the pooled connection is no longer usable. Callers asking for the
+    same model at the same time wait for a single connection to be made.
+
+    :param model_name: Name of model to connect to
+    :type model_name: str
+    :returns: Connected model
+    :rtype: juju.model.Model
+    """
+    async with _get_model_connection_lock(model_name):
+        if model_name in MODEL_CONNECTIONS:
+            model, loop = MODEL_CONNECTIONS[model_name]
+            if _model_connection_is_usable(model, loop):
+                return model
+            logging.debug("Reconnecting to model {}".format(model_name))
+            del MODEL_CONNECTIONS[model_name]
+            await _async_disconnect_pooled(model, loop)
+        model = Model()
+        await model.connect_model(model_name)
+        MODEL_CONNECTIONS[model_name] = (model, asyncio.get_event_loop())
+        return model
+
+
+async def async_disconnect_model(model_name):
+    """Disconnect the pooled connection to a model and remove it from the pool.
+
+    :param model_name: Name of model to disconnect from
+    :type model_name: str
+    """
+    if model_name not in MODEL_CONNECTIONS:
+        return
+    model, loop = MODEL_CONNECTIONS.pop(model_name)
+    await _async_disconnect_pooled(model, loop)
+
+disconnect_model = sync_wrapper(async_disconnect_model)
+
+
+async def async_disconnect_models():
+    """Disconnect all pooled model connections and empty the pool."""
+    for model_name in list(MODEL_CONNECTIONS.keys()):
+        await async_disconnect_model(model_name)
+
+disconnect_models = sync_wrapper(async_disconnect_models)
+
+
+@atexit.register
+def _disconnect_models_at_exit():
+    """Disconnect any pooled model connections when the interpreter exits."""
+    for model_name in list(MODEL_CONNECTIONS.keys()):
+        model, loop = MODEL_CONNECTIONS.pop(model_name)
+        if loop.is_closed():
+            continue
+        if loop.is_running():
+            # The zaza event loop, running in its own thread
+            asyncio.run_coroutine_threadsafe(model.disconnect(), loop).result()
+        else:
+            loop.run_until_complete(model.disconnect())
+
+
 @asynccontextmanager
 @async_generator
 async def run_in_model(model_name):
@@ -144,23 +365,79 @@ async def run_in_model(model_name):
            async with run_in_model(model_name) as model:
                model.do_something()
 
+    The model connection is taken from a pool of connections which persist
+    between calls, so the cost of connecting to the model and syncing its
+    state is only paid once per model.
+
     :param model_name: Name of model to run function in
     :type model_name: str
     :returns: The juju Model object correcsponding to model_name
     :rtype: Iterator[:class:'juju.Model()']
     """
-    model = Model()
     if not model_name:
         model_name = await async_get_juju_model()
-    await model.connect_model(model_name)
+    model = await async_get_model_connection(model_name)
     await yield_(model)
-    await model.disconnect()
 
 
+# Maximum number of calls async_fan_out will have in flight at once.
+FAN_OUT_CONCURRENCY = 10
+
+
+@timing.timed('model')
+async def async_fan_out(func, targets, concurrency=None,
+                        return_exceptions=False):
+    """Call the coroutine function func for each target concurrently.
+
+    At most concurrency calls are in flight at any one time. For example to
+    copy a file to all units of an application::
+
+        units = model.applications['ceph-osd'].units
+        await async_fan_out(
+            lambda unit: unit.scp_to('/tmp/src', '/tmp/dest'),
+            {unit.entity_id: unit for unit in units})
+
+    :param func: Coroutine function which takes a single target
+    :type func: function
+    :param targets: Targets to call func with, keyed by name
+    :type targets: dict
+    :param concurrency: Maximum number of concurrent calls, defaults to
+                        FAN_OUT_CONCURRENCY
+    :type concurrency: int
+    :param return_exceptions: Return exceptions raised for a target as its
+                              result rather than raising FanOutError
+    :type return_exceptions: bool
+    :returns: Result for each target keyed by name
+    :rtype: dict
+    :raises: FanOutError
+    """
+    semaphore = asyncio.Semaphore(concurrency or FAN_OUT_CONCURRENCY)
+
+    async def _call(target):
+        async with semaphore:
+            return await func(target)
+
+    names = list(targets.keys())
+    results = await asyncio.gather(
+        *[_call(targets[name]) for name in names],
+        return_exceptions=True)
+    results = dict(zip(names, results))
+    if not return_exceptions:
+        errors = {name: result for name, result in results.items()
+                  if isinstance(result, Exception)}
+        if errors:
+            raise FanOutError(errors)
+    return results
+
+
+@timing.timed('model')
 async def async_scp_to_unit(unit_name, source, destination, model_name=None,
                             user='ubuntu', proxy=False, scp_opts=''):
     """Transfer files to unit_name in model_name.
 
+    The connection to the unit is kept open and shared with later calls,
+    see zaza.utilities.ssh.
+
     :param model_name: Name of model unit is in
     :type model_name: str
     :param unit_name: Name of unit to scp to
@@ -178,12 +455,14 @@ async def async_scp_to_unit(unit_name, source, destination, model_name=None,
     """
     async with run_in_model(model_name) as model:
         unit = get_unit_from_name(unit_name, model)
-        await unit.scp_to(source, destination, user=user, proxy=proxy,
-                          scp_opts=scp_opts)
+        with timing.span('scp', 'command', unit_name=unit_name):
+            await unit.scp_to(source, destination, user=user, proxy=proxy,
+                              scp_opts=ssh.merge_options(scp_opts))
 
 scp_to_unit = sync_wrapper(async_scp_to_unit)
 
 
+@timing.timed('model')
 async def async_scp_to_all_units(application_name, source, destination,
                                  model_name=None, user='ubuntu', proxy=False,
                                  scp_opts=''):
@@ -203,20 +482,30 @@ async def async_scp_to_all_units(application_name, source, destination,
     :type proxy: bool
     :param scp_opts: Additional options to the scp command
     :type scp_opts: str
+    :raises: FanOutError
     """
-    async with run_in_model(model_name) as model:
-        for unit in model.applications[application_name].units:
-            # FIXME: Should scp in parallel
+    async def _scp_to(unit):
+        with timing.span('scp', 'command', unit_name=unit.entity_id):
             await unit.scp_to(source, destination, user=user, proxy=proxy,
-                              scp_opts=scp_opts)
+                              scp_opts=ssh.merge_options(scp_opts))
+
+    async with run_in_model(model_name) as model:
+        units = model.applications[application_name].units
+        await async_fan_out(
+            _scp_to,
+            {unit.entity_id: unit for unit in units})
 
 scp_to_all_units = sync_wrapper(async_scp_to_all_units)
 
 
+@timing.timed('model')
 async def async_scp_from_unit(unit_name, source, destination, model_name=None,
                               user='ubuntu', proxy=False, scp_opts=''):
     """Transfer files from to unit_name in model_name.
 
+    The connection to the unit is kept open and shared with later calls,
+    see zaza.utilities.ssh.
+
     :param model_name: Name of model unit is in
     :type model_name: str
     :param unit_name: Name of unit to scp from
@@ -234,13 +523,15 @@ async def async_scp_from_unit(unit_name, source, destination, model_name=None,
     """
     async with run_in_model(model_name) as model:
         unit = get_unit_from_name(unit_name, model)
-        await unit.scp_from(source, destination, user=user, proxy=proxy,
-                            scp_opts=scp_opts)
+        with timing.span('scp', 'command', unit_name=unit_name):
+            await unit.scp_from(source, destination, user=user, proxy=proxy,
+                                scp_opts=ssh.merge_options(scp_opts))
 
 
 scp_from_unit = sync_wrapper(async_scp_from_unit)
 
 
+@timing.timed('model')
 async def async_run_on_unit(unit_name, command, model_name=None, timeout=None):
     """Juju run on unit.
 
@@ -257,7 +548,8 @@ async def async_run_on_unit(unit_name, command, model_name=None, timeout=None):
     """
     async with run_in_model(model_name) as model:
         unit = get_unit_from_name(unit_name, model)
-        action = await unit.run(command, timeout=timeout)
+        with timing.span(command, 'command', unit_name=unit_name):
+            action = await unit.run(command, timeout=timeout)
         if action.data.get('results'):
             return action.data.get('results')
         else:
@@ -266,6 +558,104 @@ async def async_run_on_unit(unit_name, command, model_name=None, timeout=None):
 run_on_unit = sync_wrapper(async_run_on_unit)
 
 
+async def _async_run_on_units(model, unit_names, command, timeout=None):
+    """Juju run on several units using a single call to the Juju API.
+
+    :param model: Model the units are in
+    :type model: juju.model.Model
+    :param unit_names: Names of units to run command on
+    :type unit_names: [str, str, ...]
+    :param command: Command to execute
+    :type command: str
+    :param timeout: How long in seconds to wait for command to complete
+    :type timeout: int
+    :returns: action.data['results'] for each unit keyed by unit name
+    :rtype: dict
+    :raises: JujuError
+    """
+    action_facade = client.ActionFacade.from_connection(model.connection())
+    if timeout:
+        # Convert seconds to nanoseconds
+        timeout = int(timeout * 1000000000)
+    with timing.span(command, 'command', unit_names=list(unit_names)):
+        res = await action_facade.Run(
+            applications=[],
+            commands=command,
+            machines=[],
+            timeout=timeout,
+            units=unit_names)
+        for unit_name, result in zip(unit_names, res.results):
+            if result.error:
+                raise JujuError('Run on {} failed: {}'.format(
+                    unit_name, result.error.message))
+        actions = await asyncio.gather(
+            *[model.wait_for_action(result.action.tag)
+              for result in res.results])
+    return {unit_name: action.data.get('results') or {}
+            for unit_name, action in zip(unit_names, actions)}
+
+
+@timing.timed('model')
+async def async_run_on_units(unit_names, command, model_name=None,
+                             timeout=None):
+    """Juju run on several units at once.
+
+    The command is run on all units with a single juju run rather than one
+    per unit::
+
+        results = run_on_units(['keystone/0', 'keystone/1'], 'hostname')
+        hostname = results['keystone/0']['Stdout']
+
+    :param unit_names: Names of units to run command on
+    :type unit_names: [str, str, ...]
+    :param command: Command to execute
+    :type command: str
+    :param model_name: Name of model units are in
+    :type model_name: str
+    :param timeout: How long in seconds to wait for command to complete
+    :type timeout: int
+    :returns: action.data['results'] {'Code': '', 'Stderr': '', 'Stdout': ''}
+              for each unit keyed by unit name
+    :rtype: dict
+    :raises: UnitNotFound, JujuError
+    """
+    async with run_in_model(model_name) as model:
+        unit_names = [get_unit_from_name(unit_name, model).entity_id
+                      for unit_name in unit_names]
+        return await _async_run_on_units(model, unit_names, command,
+                                         timeout=timeout)
+
+run_on_units = sync_wrapper(async_run_on_units)
+
+
+@timing.timed('model')
+async def async_run_on_application(application_name, command,
+                                   model_name=None, timeout=None):
+    """Juju run on all units of an application at once.
+
+    :param application_name: Application to run command on
+    :type application_name: str
+    :param command: Command to execute
+    :type command: str
+    :param model_name: Name of model application is in
+    :type model_name: str
+    :param timeout: How long in seconds to wait for command to complete
+    :type timeout: int
+    :returns: action.data['results'] {'Code': '', 'Stderr': '', 'Stdout': ''}
+              for each unit keyed by unit name
+    :rtype: dict
+    :raises: JujuError
+    """
+    async with run_in_model(model_name) as model:
+        unit_names = [unit.entity_id
+                      for unit in model.applications[application_name].units]
+        return await _async_run_on_units(model, unit_names, command,
+                                         timeout=timeout)
+
+run_on_application = sync_wrapper(async_run_on_application)
+
+
+@timing.timed('model')
 async def async_run_on_leader(application_name, command, model_name=None,
                               timeout=None):
     """Juju run on leader unit.
@@ -294,6 +684,7 @@ async def async_run_on_leader(application_name, command, model_name=None,
 run_on_leader = sync_wrapper(async_run_on_leader)
 
 
+@timing.timed('model')
 async def async_get_unit_time(unit_name, model_name=None, timeout=None):
     """Get the current time (in seconds since Epoch) on the given unit.
 
@@ -314,6 +705,7 @@ async def async_get_unit_time(unit_name, model_name=None, timeout=None):
 get_unit_time = sync_wrapper(async_get_unit_time)
 
 
+@timing.timed('model')
 async def async_get_unit_service_start_time(unit_name, service,
                                             model_name=None, timeout=None):
     """Return the time that the given service was started on a unit.
@@ -349,6 +741,7 @@ async def async_get_unit_service_start_time(unit_name, service,
 get_unit_service_start_time = sync_wrapper(async_get_unit_service_start_time)
 
 
+@timing.timed('model')
 async def async_get_application(application_name, model_name=None):
     """Return an application object.
 
@@ -365,6 +758,7 @@ async def async_get_application(application_name, model_name=None):
 get_application = sync_wrapper(async_get_application)
 
 
+@timing.timed('model')
 async def async_get_units(application_name, model_name=None):
     """Return all the units of a given application.
 
@@ -381,6 +775,7 @@ async def async_get_units(application_name, model_name=None):
 get_units = sync_wrapper(async_get_units)
 
 
+@timing.timed('model')
 async def async_get_machines(application_name, model_name=None):
     """Return all the machines of a given application.
 
@@ -413,6 +808,7 @@ def get_first_unit_name(application_name, model_name=None):
     return get_units(application_name, model_name=model_name)[0].name
 
 
+@timing.timed('model')
 async def async_get_lead_unit_name(application_name, model_name=None):
     """Return name of lowest numbered unit of given application.
 
@@ -446,6 +842,7 @@ def get_app_ips(application_name, model_name=None):
             for u in get_units(application_name, model_name=model_name)]
 
 
+@timing.timed('model')
 async def async_get_application_config(application_name, model_name=None):
     """Return application configuration.
 
@@ -462,6 +859,7 @@ async def async_get_application_config(application_name, model_name=None):
 get_application_config = sync_wrapper(async_get_application_config)
 
 
+@timing.timed('model')
 async def async_set_application_config(application_name, configuration,
                                        model_name=None):
     """Set application configuration.
@@ -473,6 +871,7 @@ async def async_set_application_config(application_name, configuration,
     :param configuration: Dictionary of configuration setting(s)
     :type configuration: dict
     """
+    invalidate_status_snapshot(model_name)
     async with run_in_model(model_name) as model:
         return await (model.applications[application_name]
                       .set_config(configuration))
@@ -480,6 +879,7 @@ async def async_set_application_config(application_name, configuration,
 set_application_config = sync_wrapper(async_set_application_config)
 
 
+@timing.timed('model')
 async def async_get_status(model_name=None):
     """Return full status.
 
@@ -494,6 +894,34 @@ async def async_get_status(model_name=None):
 get_status = sync_wrapper(async_get_status)
 
 
+def invalidate_status_snapshot(model_name=None):
+    """Drop cached status after zaza has changed the model.
+
+    :param model_name: Name of model that changed, if unset cached status for
+                       all models is dropped.
+    :type model_name: str
+    """
+    # Imported here as zaza.utilities.juju imports this module
+    from zaza.utilities import juju as juju_utils
+    juju_utils.invalidate_status_snapshot(model_name)
+
+
+def _invalidate_action_caches(action_name, model_name=None):
+    """Drop cached state an action is about to change.
+
+    :param action_name: Name of action to be run
+    :type action_name: str
+    :param model_name: Name of model the action is run in, if unset cached
+                       state for all models is dropped.
+    :type model_name: str
+    """
+    if action_name == 'openstack-upgrade':
+        # Imported here as zaza.utilities.openstack imports this module
+        from zaza.utilities import openstack as openstack_utils
+        openstack_utils.clear_os_versions_cache(model_name)
+
+
+@timing.timed('model')
 async def async_run_action(unit_name, action_name, model_name=None,
                            action_params={}):
     """Run action on given unit.
@@ -509,6 +937,8 @@ async def async_run_action(unit_name, action_name, model_name=None,
     :returns: Action object
     :rtype: juju.action.Action
     """
+    invalidate_status_snapshot(model_name)
+    _invalidate_action_caches(action_name, model_name)
     async with run_in_model(model_name) as model:
         unit = get_unit_from_name(unit_name, model)
         action_obj = await unit.run_action(action_name, **action_params)
@@ -518,6 +948,7 @@ async def async_run_action(unit_name, action_name, model_name=None,
 run_action = sync_wrapper(async_run_action)
 
 
+@timing.timed('model')
 async def async_run_action_on_leader(application_name, action_name,
                                      model_name=None, action_params=None):
     """Run action on lead unit of the given application.
@@ -533,6 +964,8 @@ async def async_run_action_on_leader(application_name, action_name,
     :returns: Action object
     :rtype: juju.action.Action
     """
+    invalidate_status_snapshot(model_name)
+    _invalidate_action_caches(action_name, model_name)
     async with run_in_model(model_name) as model:
         for unit in model.applications[application_name].units:
             is_leader = await unit.is_leader_from_status()
@@ -545,6 +978,7 @@ async def async_run_action_on_leader(application_name, action_name,
 run_action_on_leader = sync_wrapper(async_run_action_on_leader)
 
 
+@timing.timed('model')
 async def async_remove_application(application_name, model_name=None,
                                    forcefully_remove_machines=False):
     """Remove application from model.
@@ -557,6 +991,7 @@ async def async_remove_application(application_name, model_name=None,
                                       application is runing on.
     :type forcefully_remove_machines: bool
     """
+    invalidate_status_snapshot(model_name)
     async with run_in_model(model_name) as model:
         application = model.applications[application_name]
         if forcefully_remove_machines:
@@ -568,6 +1003,103 @@ async def async_remove_application(application_name, model_name=None,
 remove_application = sync_wrapper(async_remove_application)
 
 
+@timing.timed('model')
+async def async_export_bundle(model_name=None):
+    """Export the model as a bundle.
+
+    :param model_name: Name of model to query.
+    :type model_name: str
+    :returns: Bundle describing the model
+    :rtype: dict
+    """
+    async with run_in_model(model_name) as model:
+        return yaml.safe_load(await model.export_bundle())
+
+export_bundle = sync_wrapper(async_export_bundle)
+
+
+@timing.timed('model')
+async def async_add_unit(application_name, count=1, to=None,
+                         model_name=None):
+    """Add units to an application.
+
+    :param application_name: Name of application
+    :type application_name: str
+    :param count: Number of units to add
+    :type count: int
+    :param to: Placement directive, e.g. a machine number
+    :type to: str
+    :param model_name: Name of model to operate on
+    :type model_name: str
+    """
+    invalidate_status_snapshot(model_name)
+    async with run_in_model(model_name) as model:
+        await model.applications[application_name].add_unit(count=count,
+                                                            to=to)
+
+add_unit = sync_wrapper(async_add_unit)
+
+
+@timing.timed('model')
+async def async_destroy_unit(application_name, *unit_names, model_name=None):
+    """Remove units from an application.
+
+    :param application_name: Name of application
+    :type application_name: str
+    :param unit_names: Names of units to remove
+    :type unit_names: str
+    :param model_name: Name of model to operate on
+    :type model_name: str
+    """
+    invalidate_status_snapshot(model_name)
+    async with run_in_model(model_name) as model:
+        await model.applications[application_name].destroy_unit(*unit_names)
+
+destroy_unit = sync_wrapper(async_destroy_unit)
+
+
+@timing.timed('model')
+async def async_add_relation(relation1, relation2, model_name=None):
+    """Add a relation between two applications.
+
+    :param relation1: Endpoint of form '<application>[:<relation_name>]'
+    :type relation1: str
+    :param relation2: Endpoint of form '<application>[:<relation_name>]'
+    :type relation2: str
+    :param model_name: Name of model to operate on
+    :type model_name: str
+    """
+    invalidate_status_snapshot(model_name)
+    async with run_in_model(model_name) as model:
+        await model.add_relation(relation1, relation2)
+
+add_relation = sync_wrapper(async_add_relation)
+
+
+@timing.timed('model')
+async def async_remove_relation(relation1, relation2, model_name=None):
+    """Remove the relation between two applications.
+
+    :param relation1: Endpoint of form '<application>:<relation_name>'
+    :type relation1: str
+    :param relation2: Endpoint of form '<application>:<relation_name>'
+    :type relation2: str
+    :param model_name: Name of model to operate on
+    :type model_name: str
+    """
+    invalidate_status_snapshot(model_name)
+    application_name, local_relation = relation1.split(':')
+    async with run_in_model(model_name) as model:
+        await model.applications[application_name].destroy_relation(
+            local_relation, relation2)
+
+remove_relation = sync_wrapper(async_remove_relation)
+
+
+APPROVED_STATUSES = ['active']
+APPROVED_MESSAGE_PREFIXES = ['ready', 'Ready', 'Unit is ready']
+
+
 class UnitError(Exception):
     """Exception raised for units in error state."""
 
@@ -587,6 +1119,22 @@ class ServiceNotRunning(Exception):
         super(ServiceNotRunning, self).__init__(message)
 
 
+class FanOutError(Exception):
+    """Exception raised when a call made by async_fan_out fails."""
+
+    def __init__(self, errors):
+        """Set the failed targets and their errors in message and raise.
+
+        :param errors: Exceptions raised keyed by target name
+        :type errors: dict
+        """
+        self.errors = errors
+        message = "Failed on {}".format(
+            ', '.join('{}: {}'.format(name, error)
+                      for name, error in sorted(errors.items())))
+        super(FanOutError, self).__init__(message)
+
+
 class CommandRunFailed(Exception):
     """Command failed to run."""
 
@@ -684,6 +1232,7 @@ def check_unit_workload_status_message(model, unit, message=None,
         raise ValueError("Must be called with message or prefixes")
 
 
+@timing.timed('model')
 async def async_wait_for_agent_status(model_name=None, status='executing',
                                       timeout=60):
     """Wait for at least one unit to enter a specific agent status.
@@ -714,14 +1263,80 @@ async def async_wait_for_agent_status(model_name=None, status='executing',
     async with run_in_model(model_name) as model:
         logging.info('Waiting for at least one unit with agent status "{}"'
                      .format(status))
-        await model.block_until(
+        await async_block_until_model_state(
+            model,
             lambda: one_agent_status(model, status), timeout=timeout)
 
 wait_for_agent_status = sync_wrapper(async_wait_for_agent_status)
 
 
+def units_idle(model, applications=None):
+    """Whether the agents of all units are idle.
+
+    :param model: Model object to check
+    :type model: juju.Model
+    :param applications: Only check the units of these applications
+    :type applications: [str, str, ...]
+    :returns: Whether the units are idle
+    :rtype: bool
+    """
+    if applications is None:
+        return model.all_units_idle()
+    for application_name in applications:
+        application = model.applications.get(application_name)
+        if application is None:
+            return False
+        for unit in application.units:
+            if unit.agent_status != 'idle':
+                return False
+    return True
+
+
+def pending_units(model, states=None, applications=None):
+    """Return the units which have not reached their expected workload state.
+
+    Every unit is checked against the workload status and workload status
+    message expected for its application in a single pass. By default an
+    'active' workload status and a message starting with one of
+    APPROVED_MESSAGE_PREFIXES are expected, states can add to these, see
+    async_wait_for_application_states.
+
+    :param model: Model object to check
+    :type model: juju.Model
+    :param states: States to look for
+    :type states: dict
+    :param applications: Only check the units of these applications
+    :type applications: [str, str, ...]
+    :raises: UnitError
+    :returns: Names of units that are not in their expected state
+    :rtype: [str, str, ...]
+    """
+    errored_units = _units_in_error(model, applications)
+    if errored_units:
+        raise UnitError(errored_units)
+    states = states or {}
+    pending = []
+    for application, app_data in model.applications.items():
+        if applications is not None and application not in applications:
+            continue
+        check_info = states.get(application, {})
+        statuses = list(APPROVED_STATUSES)
+        if check_info.get('workload-status'):
+            statuses.append(check_info['workload-status'])
+        prefixes = list(APPROVED_MESSAGE_PREFIXES)
+        if check_info.get('workload-status-message') is not None:
+            prefixes.append(check_info['workload-status-message'])
+        prefixes = tuple(prefixes)
+        for unit in app_data.units:
+            if not (unit.workload_status in statuses and
+                    unit.workload_status_message.startswith(prefixes)):
+                pending.append(unit.entity_id)
+    return pending
+
+
+@timing.timed('model')
 async def async_wait_for_application_states(model_name=None, states=None,
-                                            timeout=2700):
+                                            timeout=2700, applications=None):
     """Wait for model to achieve the desired state.
 
     Check the workload status and workload status message for every unit of
@@ -745,69 +1360,79 @@ async def async_wait_for_application_states(model_name=None, states=None,
     :type states: dict
     :param timeout: Time to wait for status to be achieved
     :type timeout: int
+    :param applications: Only wait for the units of these applications
+    :type applications: [str, str, ...]
     """
-    approved_message_prefixes = ['ready', 'Ready', 'Unit is ready']
-    approved_statuses = ['active']
-
     if not states:
         states = {}
     async with run_in_model(model_name) as model:
-        check_model_for_hard_errors(model)
+        # Units in error outside of applications do not abort the wait
+        errored_units = _units_in_error(model, applications)
+        if errored_units:
+            raise UnitError(errored_units)
         logging.info("Waiting for a unit to appear")
-        await model.block_until(
-            lambda: len(model.units) > 0
-        )
+        await async_block_until_model_state(
+            model,
+            lambda: len(model.units) > 0)
         logging.info("Waiting for all units to be idle")
         try:
-            await model.block_until(
-                lambda: units_with_wl_status_state(
-                    model, 'error') or model.all_units_idle(),
+            await async_block_until_model_state(
+                model,
+                lambda: _units_in_error(
+                    model, applications) or units_idle(model, applications),
                 timeout=timeout)
         except concurrent.futures._base.TimeoutError:
             raise ModelTimeout("Zaza has timed out waiting on the model to "
                                "reach idle state.")
-        errored_units = units_with_wl_status_state(model, 'error')
+        errored_units = _units_in_error(model, applications)
         if errored_units:
             raise UnitError(errored_units)
+        pending = []
+
+        def _units_ready():
+            still_pending = pending_units(model, states, applications)
+            if still_pending != pending:
+                pending[:] = still_pending
+                if pending:
+                    logging.info("Waiting for workload status of {}".format(
+                        ', '.join(pending)))
+            return not still_pending
+
+        logging.info("Checking workload status of units")
         try:
-            for application, app_data in model.applications.items():
-                check_info = states.get(application, {})
-                for unit in app_data.units:
-                    app_wls = check_info.get('workload-status')
-                    if app_wls:
-                        all_approved_statuses = approved_statuses + [app_wls]
-                    else:
-                        all_approved_statuses = approved_statuses
-                    logging.info("Checking workload status of {}".format(
-                        unit.entity_id))
-                    await model.block_until(
-                        lambda: check_unit_workload_status(
-                            model,
-                            unit,
-                            all_approved_statuses),
-                        timeout=timeout)
-                    check_msg = check_info.get('workload-status-message')
-                    logging.info("Checking workload status message of {}"
-                                 .format(unit.entity_id))
-                    prefixes = approved_message_prefixes
-                    if check_msg is not None:
-                        prefixes = approved_message_prefixes + [check_msg]
-                    else:
-                        prefixes = approved_message_prefixes
-                    await model.block_until(
-                        lambda: check_unit_workload_status_message(
-                            model,
-                            unit,
-                            prefixes=prefixes),
-                        timeout=timeout)
+            await async_block_until_model_state(
+                model,
+                _units_ready,
+                timeout=timeout)
         except concurrent.futures._base.TimeoutError:
+            pending = pending_units(model, states, applications)
             raise ModelTimeout("Zaza has timed out waiting on the model to "
-                               "reach expected workload statuses.")
+                               "reach expected workload statuses. Pending "
+                               "units: {}".format(', '.join(pending)))
 
 wait_for_application_states = sync_wrapper(async_wait_for_application_states)
 
 
-async def async_block_until_all_units_idle(model_name=None, timeout=2700):
+def _units_in_error(model, applications=None):
+    """Return units in error, optionally only those of the given applications.
+
+    :param model: Model object to check
+    :type model: juju.Model
+    :param applications: Only check the units of these applications
+    :type applications: [str, str, ...]
+    :returns: Units in error
+    :rtype: [juju.Unit, juju.Unit, ...]
+    """
+    units = units_with_wl_status_state(model, 'error')
+    if applications is None:
+        return units
+    return [unit for unit in units
+            if unit.entity_id.split('/')[0] in applications]
+
+
+@timing.timed('model')
+async def async_block_until_all_units_idle(model_name=None, timeout=2700,
+                                           applications=None):
     """Block until all units in the given model are idle.
 
     An example accessing this function via its sync wrapper::
@@ -818,19 +1443,100 @@ async def async_block_until_all_units_idle(model_name=None, timeout=2700):
     :type model_name: str
     :param timeout: Time to wait for status to be achieved
     :type timeout: float
+    :param applications: Only wait for the units of these applications
+    :type applications: [str, str, ...]
     """
     async with run_in_model(model_name) as model:
-        await model.block_until(
-            lambda: units_with_wl_status_state(
-                model, 'error') or model.all_units_idle(),
+        await async_block_until_model_state(
+            model,
+            lambda: _units_in_error(
+                model, applications) or units_idle(model, applications),
             timeout=timeout)
-        errored_units = units_with_wl_status_state(model, 'error')
+        errored_units = _units_in_error(model, applications)
         if errored_units:
             raise UnitError(errored_units)
 
 block_until_all_units_idle = sync_wrapper(async_block_until_all_units_idle)
 
 
+def subordinate_applications(model, application_name):
+    """Return the applications with units subordinate to the application.
+
+    :param model: Model object to check
+    :type model: juju.Model
+    :param application_name: Name of principal application
+    :type application_name: str
+    :returns: Names of subordinate applications
+    :rtype: [str, str, ...]
+    """
+    principals = [unit.entity_id
+                  for unit in model.applications[application_name].units]
+    return sorted(
+        name for name, application in model.applications.items()
+        if any(unit.data.get('principal') in principals
+               for unit in application.units))
+
+
+@timing.timed('model')
+async def async_get_subordinate_applications(application_name,
+                                             model_name=None):
+    """Return the applications with units subordinate to the application.
+
+    :param application_name: Name of principal application
+    :type application_name: str
+    :param model_name: Name of model to query.
+    :type model_name: str
+    :returns: Names of subordinate applications
+    :rtype: [str, str, ...]
+    """
+    async with run_in_model(model_name) as model:
+        return subordinate_applications(model, application_name)
+
+get_subordinate_applications = sync_wrapper(
+    async_get_subordinate_applications)
+
+
+@timing.timed('model')
+async def async_block_until_application_idle(application_name,
+                                             model_name=None, timeout=2700,
+                                             include_subordinates=True):
+    """Block until the units of the application are idle.
+
+    Units of other applications in the model are not waited on, apart from
+    those subordinate to the application.
+
+    An example accessing this function via its sync wrapper::
+
+        block_until_application_idle('glance', model_name='modelname')
+
+    :param application_name: Name of application
+    :type application_name: str
+    :param model_name: Name of model to query.
+    :type model_name: str
+    :param timeout: Time to wait for status to be achieved
+    :type timeout: float
+    :param include_subordinates: Also wait for subordinate units
+    :type include_subordinates: bool
+    """
+    async with run_in_model(model_name) as model:
+        applications = [application_name]
+        if include_subordinates:
+            applications.extend(
+                subordinate_applications(model, application_name))
+        await async_block_until_model_state(
+            model,
+            lambda: _units_in_error(
+                model, applications) or units_idle(model, applications),
+            timeout=timeout)
+        errored_units = _units_in_error(model, applications)
+        if errored_units:
+            raise UnitError(errored_units)
+
+block_until_application_idle = sync_wrapper(
+    async_block_until_application_idle)
+
+
+@timing.timed('model')
 async def async_block_until_service_status(unit_name, services, target_status,
                                            model_name=None, timeout=2700):
     """Block until all services on the unit are in the desired state.
@@ -893,6 +1599,7 @@ def get_actions(application_name, model_name=None):
     return yaml.safe_load(subprocess.check_output(cmd))
 
 
+@timing.timed('model')
 async def async_get_current_model():
     """Return the current active model name.
 
@@ -911,23 +1618,40 @@ async def async_get_current_model():
 get_current_model = sync_wrapper(async_get_current_model)
 
 
+@timing.timed('model')
 async def async_block_until(*conditions, timeout=None, wait_period=0.5,
-                            loop=None):
+                            max_wait_period=5.0, backoff=2, loop=None):
     """Return only after all async conditions are true.
 
     Based on juju.utils.block_until which currently does not support
     async methods as conditions.
 
+    The conditions are typically checks which run commands on units, so
+    rather than re-evaluating them at a fixed interval the time waited between
+    evaluations starts at wait_period and is multiplied by backoff each time
+    no further conditions have passed, up to max_wait_period. It drops back to
+    wait_period whenever the number of passing conditions goes up.
+
+    Conditions which only depend on the state of the model should use
+    async_block_until_model_state instead.
+
     :param conditions: Functions to evaluate.
     :type conditions: functions
     :param timeout: Timeout in seconds
     :type timeout: float
-    :param wait_period: Time to wait between re-assessing conditions.
+    :param wait_period: Initial time to wait between re-assessing conditions.
     :type wait_period: float
+    :param max_wait_period: Maximum time to wait between re-assessing
+                            conditions.
+    :type max_wait_period: float
+    :param backoff: Factor to increase the wait period by.
+    :type backoff: float
     :param loop: The event loop to use
     :type loop: An event loop
     """
     async def _block():
+        period = wait_period
+        passed = 0
         while True:
             evaluated = []
             for c in conditions:
@@ -935,11 +1659,222 @@ async def async_block_until(*conditions, timeout=None, wait_period=0.5,
                 evaluated.append(result)
             if all(evaluated):
                 return
-            else:
-                await asyncio.sleep(wait_period, loop=loop)
+            if sum(1 for e in evaluated if e) > passed:
+                period = wait_period
+            passed = sum(1 for e in evaluated if e)
+            await asyncio.sleep(period, loop=loop)
+            period = min(period * backoff, max(max_wait_period, wait_period))
     await asyncio.wait_for(_block(), timeout, loop=loop)
 
 
+@timing.timed('model')
+async def async_block_until_model_state(model, *conditions, timeout=None,
+                                        entity_types=None,
+                                        max_wait_period=30):
+    """Return only after all conditions on the model state are true.
+
+    Unlike model.block_until, which polls every 0.5 seconds, the conditions
+    are re-evaluated when libjuju receives a change for one of the given
+    entity types. So they must only depend on the model's state and not
+    require any calls to the Juju API or units. As a safeguard the conditions
+    are also re-evaluated if nothing has changed for max_wait_period seconds.
+
+    :param model: Model to observe
+    :type model: juju.model.Model
+    :param conditions: Functions to evaluate.
+    :type conditions: functions
+    :param timeout: Timeout in seconds
+    :type timeout: float
+    :param entity_types: Entity types whose changes trigger re-evaluation,
+                         defaults to units and applications.
+    :type entity_types: [str, str, ...]
+    :param max_wait_period: Maximum time between re-assessing conditions.
+    :type max_wait_period: float
+    :raises: asyncio.TimeoutError
+    :raises: websockets.ConnectionClosed if the model is disconnected
+    """
+    if entity_types is None:
+        entity_types = ['unit', 'application']
+    changed = asyncio.Event()
+
+    async def _model_changed(delta, old_obj, new_obj, model):
+        changed.set()
+
+    def _disconnected():
+        return not (model.is_connected() and model.connection().is_open)
+
+    async def _block():
+        while True:
+            changed.clear()
+            # No more changes arrive once the connection has dropped, so
+            # give up as model.block_until does
+            if _disconnected():
+                raise websockets.ConnectionClosed(1006, 'no reason')
+            if all(c() for c in conditions):
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), max_wait_period)
+            except asyncio.TimeoutError:
+                pass
+
+    for entity_type in entity_types:
+        model.add_observer(_model_changed, entity_type=entity_type)
+    try:
+        await asyncio.wait_for(_block(), timeout)
+    finally:
+        # libjuju has no way to remove an observer, they are held in a
+        # WeakValueDictionary keyed on the observer with the callable as
+        # value.
+        for observer, callable_ in list(model._observers.items()):
+            if callable_ is _model_changed:
+                del model._observers[observer]
+
+
+async def _async_ssh_unit(unit, command, user='ubuntu'):
+    """Run a command on the machine of a unit over ssh.
+
+    Unlike juju run the command does not wait for the hook lock of the
+    machine and its output is not limited in size. The connection to the
+    machine is shared with later calls, see zaza.utilities.ssh.
+
+    :param unit: Unit to run command on
+    :type unit: juju.unit.Unit
+    :param command: Command to execute
+    :type command: str
+    :param user: Remote username
+    :type user: str
+    :returns: Output of the command
+    :rtype: bytes
+    :raises: CommandRunFailed
+    """
+    # The key and options are those used by libjuju's Machine.ssh
+    key = os.path.expanduser('~/.local/share/juju/ssh/juju_id_rsa')
+    cmd = [
+        'ssh', '-i', key, '-o', 'StrictHostKeyChecking=no', '-q',
+        *ssh.multiplex_options(),
+        '{}@{}'.format(user, unit.machine.dns_name), command]
+    with timing.span(command, 'command', unit_name=unit.entity_id):
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+        stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise CommandRunFailed(command, {
+            'Code': str(process.returncode),
+            'Stdout': stdout.decode('utf-8', errors='replace'),
+            'Stderr': stderr.decode('utf-8', errors='replace')})
+    return stdout
+
+
+async def _async_read_unit_file(unit, remote_file, cache=None):
+    """Read a file on a unit over ssh.
+
+    The file is read as the ubuntu user, as scp_from_unit does, so it must
+    be readable by that user.
+
+    When the file has been read from the unit into cache before, the unit is
+    asked for the sha256 of the file and the contents are only transferred
+    if it differs from the contents read last time.
+
+    :param unit: Unit to read file from
+    :type unit: juju.unit.Unit
+    :param remote_file: Remote path of file to read
+    :type remote_file: str
+    :param cache: sha256 and contents of files read before, keyed on unit
+                  name and path
+    :type cache: Optional[dict]
+    :returns: sha256 hex digest and contents of the file
+    :rtype: (str, bytes)
+    :raises: CommandRunFailed
+    """
+    if cache is None:
+        cache = {}
+    key = (unit.entity_id, remote_file)
+    cached = cache.get(key)
+    path = shlex.quote(remote_file)
+    if cached:
+        command = (
+            'sum=$(sha256sum {path}) || exit 1; sum=${{sum%% *}}; '
+            'echo "$sum"; [ "$sum" = {digest} ] || cat {path}'.format(
+                path=path, digest=cached[0]))
+    else:
+        command = 'cat {}'.format(path)
+    contents = await _async_ssh_unit(unit, command)
+    if cached:
+        digest, _, contents = contents.partition(b'\n')
+        if digest.decode().strip() == cached[0]:
+            return cached
+    cache[key] = (hashlib.sha256(contents).hexdigest(), contents)
+    return cache[key]
+
+
+@timing.timed('model')
+async def async_read_remote_file(unit_name, remote_file, model_name=None):
+    """Read a file on a unit.
+
+    The file is read over ssh as the ubuntu user and returned in memory,
+    nothing is written to local disk.
+
+    :param unit_name: Name of unit to read file from
+    :type unit_name: str
+    :param remote_file: Remote path of file to read
+    :type remote_file: str
+    :param model_name: Name of model unit is in
+    :type model_name: str
+    :returns: Contents of the file
+    :rtype: bytes
+    :raises: CommandRunFailed
+    """
+    async with run_in_model(model_name) as model:
+        unit = get_unit_from_name(unit_name, model)
+        _, contents = await _async_read_unit_file(unit, remote_file)
+        return contents
+
+read_remote_file = sync_wrapper(async_read_remote_file)
+
+
+class _OsloConfigParser(iniparser.BaseParser):
+    """Collect the values of an oslo.config style ini file."""
+
+    def __init__(self):
+        """Create a parser with no sections read yet."""
+        super(_OsloConfigParser, self).__init__()
+        self.sections = {}
+        self.section = None
+
+    def new_section(self, section):
+        """Start collecting the values of section."""
+        self.section = section
+        self.sections.setdefault(section, {})
+
+    def assignment(self, key, value):
+        """Add value to the values of key in the current section."""
+        if self.section is None:
+            raise self.parse_exc(
+                'Section must be started before assignment', self.lineno,
+                key)
+        # The lines of a multi-line value are joined, as oslo.config does
+        self.sections[self.section].setdefault(key, []).append(
+            '\n'.join(value))
+
+
+def parse_oslo_config(contents):
+    """Parse the contents of a file with the oslo.config parser.
+
+    :param contents: Contents of an oslo.config style ini file
+    :type contents: str
+    :returns: Values of each key in each section, e.g.
+              {'DEFAULT': {'debug': ['False']}}
+    :rtype: Dict[str, Dict[str, List[str]]]
+    :raises: oslo_config.iniparser.ParseError
+    """
+    parser = _OsloConfigParser()
+    parser.parse(contents.splitlines())
+    return parser.sections
+
+
+@timing.timed('model')
 async def async_block_until_file_ready(application_name, remote_file,
                                        check_function, model_name=None,
                                        timeout=2700):
@@ -949,6 +1884,10 @@ async def async_block_until_file_ready(application_name, remote_file,
     unlikely that a test would call this function directly, rather it is
     provided as scaffolding for tests with a more specialised purpose.
 
+    The file is only transferred from a unit when it has changed, and
+    check_function is only called again for a unit when the contents of the
+    file on it have changed.
+
     :param model_name: Name of model to query.
     :type model_name: str
     :param application_name: Name of application
@@ -961,29 +1900,36 @@ async def async_block_until_file_ready(application_name, remote_file,
     :param timeout: Time to wait for contents to appear in file
     :type timeout: float
     """
+    # sha256 of the contents last checked on each unit and the result
+    checked = {}
+    # sha256 and contents of the file last read from each unit
+    read = {}
+
+    async def _check_unit_file(unit):
+        try:
+            digest, contents = await _async_read_unit_file(
+                unit, remote_file, cache=read)
+        # A missing file and a failure to reach the unit are not told
+        # apart, both are assumed to mean the file is not ready yet.
+        except (JujuError, CommandRunFailed):
+            return False
+        if checked.get(unit.entity_id, (None, None))[0] != digest:
+            checked[unit.entity_id] = (digest, check_function(
+                contents.decode('utf-8', errors='replace')))
+        return checked[unit.entity_id][1]
+
     async def _check_file():
-        file_name = os.path.basename(remote_file)
         units = model.applications[application_name].units
-        for unit in units:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                try:
-                    await unit.scp_from(remote_file, tmpdir)
-                    with open(os.path.join(tmpdir, file_name), 'r') as lf:
-                        contents = lf.read()
-                    if not check_function(contents):
-                        return False
-                # libjuju throws a generic error for scp failure. So we cannot
-                # differentiate between a connectivity issue and a target file
-                # not existing error. For now just assume the latter.
-                except JujuError as e:
-                    return False
-        else:
-            return True
+        results = await async_fan_out(
+            _check_unit_file,
+            {unit.entity_id: unit for unit in units})
+        return all(results.values())
 
     async with run_in_model(model_name) as model:
         await async_block_until(_check_file, timeout=timeout)
 
 
+@timing.timed('model')
 async def async_block_until_file_has_contents(application_name, remote_file,
                                               expected_contents,
                                               model_name=None, timeout=2700):
@@ -1025,6 +1971,7 @@ block_until_file_has_contents = sync_wrapper(
     async_block_until_file_has_contents)
 
 
+@timing.timed('model')
 async def async_block_until_oslo_config_entries_match(application_name,
                                                       remote_file,
                                                       expected_contents,
@@ -1071,17 +2018,11 @@ async def async_block_until_oslo_config_entries_match(application_name,
 
     """
     def f(x):
-        # Writing out the file that was just read is suboptimal
-        with tempfile.NamedTemporaryFile(mode='w', delete=True) as fp:
-            fp.write(x)
-            fp.seek(0)
-            sections = {}
-            parser = cfg.ConfigParser(fp.name, sections)
-            parser.parse()
-            for section, entries in expected_contents.items():
-                for key, value in entries.items():
-                    if sections.get(section, {}).get(key) != value:
-                        return False
+        sections = parse_oslo_config(x)
+        for section, entries in expected_contents.items():
+            for key, value in entries.items():
+                if sections.get(section, {}).get(key) != value:
+                    return False
         return True
     return await async_block_until_file_ready(
         application_name,
@@ -1095,6 +2036,7 @@ block_until_oslo_config_entries_match = sync_wrapper(
     async_block_until_oslo_config_entries_match)
 
 
+@timing.timed('model')
 async def async_block_until_services_restarted(application_name, mtime,
                                                services, model_name=None,
                                                timeout=2700):
@@ -1141,6 +2083,7 @@ block_until_services_restarted = sync_wrapper(
     async_block_until_services_restarted)
 
 
+@timing.timed('model')
 async def async_block_until_unit_wl_status(unit_name, status, model_name=None,
                                            timeout=2700):
     """Block until the given unit has the desired workload status.
@@ -1179,6 +2122,7 @@ block_until_unit_wl_status = sync_wrapper(
     async_block_until_unit_wl_status)
 
 
+@timing.timed('model')
 async def async_get_relation_id(application_name, remote_application_name,
                                 model_name=None,
                                 remote_interface_name=None):
@@ -1208,6 +2152,40 @@ async def async_get_relation_id(application_name, remote_application_name,
 get_relation_id = sync_wrapper(async_get_relation_id)
 
 
+@timing.timed('model')
+async def async_get_application_fingerprint(application_name,
+                                            model_name=None):
+    """Return a hash of the charm, config, relations and units of an app.
+
+    The hash changes when any of them change, so it can be used to tell
+    whether something worked out from them is out of date. It is computed
+    from the model connection's copy of the model state, so once connected
+    no calls are made to the controller.
+
+    :param application_name: Name of application
+    :type application_name: str
+    :param model_name: Name of model to query.
+    :type model_name: str
+    :returns: Hex digest of the application's state
+    :rtype: str
+    """
+    async with run_in_model(model_name) as model:
+        application = model.applications[application_name]
+        state = {
+            'charm-url': application.safe_data.get('charm-url'),
+            'config': application.safe_data.get('config'),
+            'relations': sorted(rel.key for rel in application.relations),
+            'units': sorted(
+                [unit.entity_id,
+                 unit.safe_data.get('public-address'),
+                 unit.safe_data.get('private-address')]
+                for unit in application.units)}
+    return hashlib.sha256(
+        json.dumps(state, sort_keys=True, default=str).encode()).hexdigest()
+
+get_application_fingerprint = sync_wrapper(async_get_application_fingerprint)
+
+
 def set_model_constraints(constraints, model_name=None):
     """
     Set constraints on a model.
@@ -1230,6 +2208,7 @@ def set_model_constraints(constraints, model_name=None):
     subprocess.check_call(cmd)
 
 
+@timing.timed('model')
 async def async_upgrade_charm(application_name, channel=None,
                               force_series=False, force_units=False,
                               path=None, resources=None, revision=None,
@@ -1258,6 +2237,7 @@ async def async_upgrade_charm(application_name, channel=None,
     :param model_name: Name of model to operate on
     :type model_name: str
     """
+    invalidate_status_snapshot(model_name)
     async with run_in_model(model_name) as model:
         app = model.applications[application_name]
         await app.upgrade_charm(
@@ -1307,6 +2287,7 @@ def prepare_series_upgrade(machine_num, to_series="xenial"):
     cmd = ["juju", "upgrade-series", "-m", juju_model,
            machine_num, "prepare", to_series, "--yes"]
     subprocess.check_call(cmd)
+    invalidate_status_snapshot(juju_model)
 
 
 def complete_series_upgrade(machine_num):
@@ -1325,6 +2306,7 @@ def complete_series_upgrade(machine_num):
     cmd = ["juju", "upgrade-series", "-m", juju_model,
            machine_num, "complete"]
     subprocess.check_call(cmd)
+    invalidate_status_snapshot(juju_model)
 
 
 def set_series(application, to_series):
@@ -1343,6 +2325,7 @@ def set_series(application, to_series):
     cmd = ["juju", "set-series", "-m", juju_model,
            application, to_series]
     subprocess.check_call(cmd)
+    invalidate_status_snapshot(juju_model)
 
 
 def attach_resource(application, resource_name, resource_path):
@@ -1361,3 +2344,4 @@ def attach_resource(application, resource_name, resource_path):
     cmd = ["juju", "attach-resource", "-m", juju_model,
            application, "{}={}".format(resource_name, resource_path)]
     subprocess.check_call(cmd)
+    invalidate_status_snapshot(juju_model)
@@ -15,6 +15,7 @@
 
 
 import argparse
+import copy
 import yaml
 import sys
 
@@ -44,6 +45,257 @@ def remove_machine_specification(input_yaml):
     return input_yaml
 
 
+def get_applications(bundle):
+    """Return the applications of a bundle.
+
+    :param bundle: Juju bundle
+    :type bundle: dict
+    :returns: Applications keyed by name, older bundles call these services
+    :rtype: dict
+    """
+    return bundle.get('applications') or bundle.get('services') or {}
+
+
+def _relation_application(endpoint):
+    return endpoint.split(':')[0]
+
+
+def merge_overlays(bundle, overlays):
+    """Apply overlays to a bundle the way juju deploy --overlay does.
+
+    Application settings in an overlay replace those in the bundle, apart
+    from options which are merged. An application set to null in an overlay
+    is removed from the bundle along with its relations.
+
+    :param bundle: Juju bundle
+    :type bundle: dict
+    :param overlays: Overlays to apply in order
+    :type overlays: [dict, dict, ...]
+    :returns: Bundle with the overlays applied
+    :rtype: dict
+    """
+    merged = copy.deepcopy(bundle)
+    merged['applications'] = get_applications(merged)
+    merged.pop('services', None)
+    merged['relations'] = merged.get('relations') or []
+    for overlay in overlays:
+        for name, application in get_applications(overlay).items():
+            if application is None:
+                merged['applications'].pop(name, None)
+                continue
+            target = merged['applications'].setdefault(name, {})
+            for key, value in application.items():
+                if key == 'options' and target.get('options'):
+                    target['options'].update(value or {})
+                else:
+                    target[key] = copy.deepcopy(value)
+        for relation in overlay.get('relations') or []:
+            if relation not in merged['relations']:
+                merged['relations'].append(relation)
+    merged['relations'] = [
+        relation for relation in merged['relations']
+        if all(_relation_application(endpoint) in merged['applications']
+               for endpoint in relation)]
+    return merged
+
+
+def _endpoints_match(endpoint1, endpoint2):
+    """Whether two endpoints are the same, ignoring missing relation names.
+
+    :param endpoint1: Endpoint of form '<application>[:<relation_name>]'
+    :type endpoint1: str
+    :param endpoint2: Endpoint of form '<application>[:<relation_name>]'
+    :type endpoint2: str
+    :returns: Whether the endpoints match
+    :rtype: bool
+    """
+    application1, _, name1 = endpoint1.partition(':')
+    application2, _, name2 = endpoint2.partition(':')
+    return application1 == application2 and (
+        not name1 or not name2 or name1 == name2)
+
+
+def relations_match(relation1, relation2):
+    """Whether two relations join the same endpoints.
+
+    :param relation1: Pair of endpoints
+    :type relation1: [str, str]
+    :param relation2: Pair of endpoints
+    :type relation2: [str, str]
+    :returns: Whether the relations match
+    :rtype: bool
+    """
+    (a1, b1), (a2, b2) = relation1, relation2
+    return ((_endpoints_match(a1, a2) and _endpoints_match(b1, b2)) or
+            (_endpoints_match(a1, b2) and _endpoints_match(b1, a2)))
+
+
+def _config_value(value):
+    """Return an option value in a form that can be compared and set.
+
+    :param value: Option value from a bundle
+    :type value: Union[str, int, float, bool, None]
+    :returns: Value as a string
+    :rtype: Union[str, None]
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
+
+def _typed_config_value(value, option_type=None):
+    """Return an option value in a form that can be compared.
+
+    Values are converted to the type of the option so, e.g., 1 and 1.0 of a
+    float option or True and 'true' of a boolean option are equal. Values of
+    options of unknown type are compared as set.
+
+    :param value: Option value from a bundle or the model
+    :type value: Union[str, int, float, bool, None]
+    :param option_type: Type of the option, one of string, int, float or
+                        boolean, as given by the charm config
+    :type option_type: Optional[str]
+    :returns: Value to compare
+    :rtype: Union[str, int, float, bool, None]
+    """
+    if value is None:
+        return None
+    try:
+        if option_type == 'int':
+            return int(value)
+        if option_type == 'float':
+            return float(value)
+    except ValueError:
+        pass
+    if option_type == 'boolean':
+        if isinstance(value, bool):
+            return value
+        return str(value).lower() == 'true'
+    return _config_value(value)
+
+
+def get_option_types(config):
+    """Return the type of each option in an application's config.
+
+    :param config: Config as returned by zaza.model.get_application_config
+    :type config: dict
+    :returns: Option types, e.g. 'int', keyed by option name
+    :rtype: dict
+    """
+    return {
+        key: option['type']
+        for key, option in config.items() if option.get('type')}
+
+
+def get_effective_options(config):
+    """Return the value of each option in an application's config.
+
+    :param config: Config as returned by zaza.model.get_application_config,
+                   which includes options left at their charm default
+    :type config: dict
+    :returns: Option values keyed by option name
+    :rtype: dict
+    """
+    return {
+        key: option.get('value', option.get('default'))
+        for key, option in config.items()}
+
+
+def diff_bundle(target, live, live_options=None, option_types=None):
+    """Work out the changes needed to take a model to the target bundle.
+
+    Bundles exported from a model leave out options at their charm default,
+    so live_options should hold the effective values of the options of the
+    applications in the model for those to be compared. Option values are
+    compared as the type given in option_types, see get_option_types, and
+    as strings when it is not known.
+
+    :param target: Bundle to deploy, with overlays applied
+    :type target: dict
+    :param live: Bundle exported from the model
+    :type live: dict
+    :param live_options: Effective option values of applications in the
+                         model keyed by application name
+    :type live_options: dict
+    :param option_types: Types of the options of applications in the model
+                         keyed by application name
+    :type option_types: dict
+    :returns: Changes keyed by add_applications, remove_applications,
+              config, add_units, remove_units, add_relations and
+              remove_relations
+    :rtype: dict
+    """
+    target_applications = get_applications(target)
+    live_applications = get_applications(live)
+    delta = {
+        'add_applications': [],
+        'remove_applications': [],
+        'config': {},
+        'add_units': {},
+        'remove_units': {},
+        'add_relations': [],
+        'remove_relations': []}
+    for name, application in target_applications.items():
+        if name not in live_applications:
+            delta['add_applications'].append(name)
+            continue
+        live_application = live_applications[name] or {}
+        live_values = dict((live_options or {}).get(name) or {})
+        live_values.update(live_application.get('options') or {})
+        types = (option_types or {}).get(name) or {}
+        options = {
+            key: _config_value(value)
+            for key, value in (application.get('options') or {}).items()
+            if (_typed_config_value(value, types.get(key)) !=
+                _typed_config_value(live_values.get(key), types.get(key)))}
+        if options:
+            delta['config'][name] = options
+        # Subordinate applications do not have units of their own
+        if application.get('num_units') is not None:
+            count = (application['num_units'] -
+                     live_application.get('num_units', 0))
+            if count > 0:
+                delta['add_units'][name] = count
+            elif count < 0:
+                delta['remove_units'][name] = -count
+    delta['remove_applications'] = [
+        name for name in live_applications
+        if name not in target_applications]
+    live_relations = live.get('relations') or []
+    target_relations = target.get('relations') or []
+    delta['add_relations'] = [
+        relation for relation in target_relations
+        if not any(relations_match(relation, live_relation)
+                   for live_relation in live_relations)]
+    delta['remove_relations'] = [
+        relation for relation in live_relations
+        if not any(relations_match(relation, target_relation)
+                   for target_relation in target_relations) and
+        not any(_relation_application(endpoint) in
+                delta['remove_applications'] for endpoint in relation)]
+    return delta
+
+
+def get_changed_applications(delta):
+    """Return the applications touched by a set of changes.
+
+    :param delta: Changes as returned by diff_bundle
+    :type delta: dict
+    :returns: Names of applications, excluding removed applications
+    :rtype: [str, str, ...]
+    """
+    changed = set(delta['add_applications'])
+    for key in ('config', 'add_units', 'remove_units'):
+        changed.update(delta[key].keys())
+    for key in ('add_relations', 'remove_relations'):
+        for relation in delta[key]:
+            changed.update(_relation_application(endpoint)
+                           for endpoint in relation)
+    return sorted(changed - set(delta['remove_applications']))
+
+
 def parse_args(args):
     """Parse command line arguments.
 
@@ -172,3 +172,17 @@ class NovaGuestRestartFailed(Exception):
     """Nova guest restart failed."""
 
     pass
+
+
+class SeriesUpgradeFailed(Exception):
+    """Series upgrade of one or more units failed."""
+
+    def __init__(self, units):
+        """Create Series upgrade failed exception.
+
+        :param units: Names of the units whose series upgrade failed
+        :type units: [str, str, ...]
+        :returns: SeriesUpgradeFailed Exception
+        """
+        msg = ("Series upgrade failed on {}.".format(', '.join(units)))
+        super(SeriesUpgradeFailed, self).__init__(msg)
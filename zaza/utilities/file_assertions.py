@@ -17,13 +17,29 @@
 import zaza.model as model
 
 
+def _unit_names(unit):
+    """Return the given unit name or list of unit names as a list.
+
+    :param unit: Unit name or list of unit names
+    :type unit: Union[str, List[str]]
+    :returns: List of unit names
+    :rtype: List[str]
+    """
+    if isinstance(unit, str):
+        return [unit]
+    return list(unit)
+
+
 def assert_path_glob(test_case, unit, file_details, paths=None):
     """Verify all files in a given directory.
 
+    When given a list of units the files on all of them are listed with a
+    single juju run.
+
     :param test_case: Test case that we are asserting in
     :type test_case: unittest.TestCase
-    :param unit: Unit name to operate on
-    :type unit: str
+    :param unit: Unit name, or list of unit names, to operate on
+    :type unit: Union[str, List[str]]
     :param file_details: Dictionary with details of the file
     :type file_details: dict
     :param paths: list of paths that are explicitly tested
@@ -33,40 +49,46 @@ def assert_path_glob(test_case, unit, file_details, paths=None):
     """
     if not paths:
         paths = []
-    result = model.run_on_unit(
-        unit, 'bash -c "'
+    results = model.run_on_units(
+        _unit_names(unit), 'bash -c "'
         'shopt -s -q globstar; '
         'stat -c "%n %U %G %a" {}"'.format(file_details['path']))
-    files = result['Stdout']
-    for file in files.splitlines():
-        file, owner, group, mode = file.split()
-        if file not in paths and file not in ['.', '..']:
-            _verify_file(test_case,
-                         unit,
-                         file_details,
-                         owner,
-                         group,
-                         mode,
-                         path=file)
+    for unit_name, result in results.items():
+        files = result['Stdout']
+        for file in files.splitlines():
+            file, owner, group, mode = file.split()
+            if file not in paths and file not in ['.', '..']:
+                _verify_file(test_case,
+                             unit_name,
+                             file_details,
+                             owner,
+                             group,
+                             mode,
+                             path=file)
 
 
 def assert_single_file(test_case, unit, file_details):
     """Verify ownership of a single file.
 
+    When given a list of units the file on all of them is checked with a
+    single juju run.
+
     :param test_case: Test case that we are asserting in
     :type test_case: unittest.TestCase
-    :param unit: Unit name to operate on
-    :type unit: str
+    :param unit: Unit name, or list of unit names, to operate on
+    :type unit: Union[str, List[str]]
     :param file_details: Dictionary with details of the file
     :type file_details: dict
     :returns: Nothing
     :rtype: None
     """
-    result = model.run_on_unit(
-        unit, 'stat -c "%U %G %a" {}'.format(file_details['path']))
-    ownership = result['Stdout']
-    owner, group, mode = ownership.split()
-    _verify_file(test_case, unit, file_details, owner, group, mode)
+    results = model.run_on_units(
+        _unit_names(unit),
+        'stat -c "%U %G %a" {}'.format(file_details['path']))
+    for unit_name, result in results.items():
+        ownership = result['Stdout']
+        owner, group, mode = ownership.split()
+        _verify_file(test_case, unit_name, file_details, owner, group, mode)
 
 
 def _verify_file(test_case, unit, file_details,
@@ -14,16 +14,27 @@
 
 """Collection of functions that did not fit anywhere else."""
 
+import concurrent.futures
 import logging
 import os
+import re
 import subprocess
 import yaml
 
 from zaza import model
-from zaza.utilities import juju as juju_utils
 from zaza.utilities import exceptions as zaza_exceptions
+from zaza.utilities import ssh
+from zaza.utilities import upgrade_state
 from zaza.utilities.os_versions import UBUNTU_OPENSTACK_RELEASE
 
+# Number of non-leader units of an application series upgraded at the same
+# time
+SERIES_UPGRADE_BATCH_SIZE = 1
+# Charms which need a majority of their units up to keep quorum, fewer than
+# half of their units are series upgraded at the same time
+QUORUM_CHARMS = ('percona-cluster', 'rabbitmq-server', 'ceph-mon', 'mongodb',
+                 'vault')
+
 
 def dict_to_yaml(dict_data):
     """Return YAML from dictionary.
@@ -77,13 +88,15 @@ def get_pkg_version(application, pkg):
     :type pkg: string
     :returns: List of package version
     :rtype: list
+    :raises: model.CommandRunFailed
     """
     versions = []
-    units = model.get_units(application)
-    for unit in units:
-        cmd = 'dpkg -l | grep {}'.format(pkg)
-        out = juju_utils.remote_run(unit.entity_id, cmd)
-        versions.append(out.split('\n')[0].split()[2])
+    cmd = 'dpkg -l | grep {}'.format(pkg)
+    results = model.run_on_application(application, cmd)
+    for unit_name, result in sorted(results.items()):
+        if int(result.get('Code', 1)) != 0:
+            raise model.CommandRunFailed(cmd, result)
+        versions.append(result.get('Stdout').split('\n')[0].split()[2])
     if len(set(versions)) != 1:
         raise Exception('Unexpected output from pkg version check')
     return versions[0]
@@ -172,7 +185,8 @@ def get_yaml_config(config_file):
 
 def series_upgrade_non_leaders_first(application, from_series="trusty",
                                      to_series="xenial",
-                                     completed_machines=[]):
+                                     completed_machines=None,
+                                     batch_size=None, state=None):
     """Series upgrade non leaders first.
 
     Wrap all the functionality to handle series upgrade for charms
@@ -187,9 +201,18 @@ def series_upgrade_non_leaders_first(application, from_series="trusty",
     :param completed_machines: List of completed machines which do no longer
                                require series upgrade.
     :type completed_machines: list
+    :param batch_size: Number of non-leader units upgraded at the same time,
+                       defaults to SERIES_UPGRADE_BATCH_SIZE
+    :type batch_size: int
+    :param state: Steps of the series upgrade done on each machine, steps
+                  already done are skipped
+    :type state: Optional[upgrade_state.SeriesUpgradeState]
     :returns: None
     :rtype: None
+    :raises: zaza_exceptions.SeriesUpgradeFailed
     """
+    if completed_machines is None:
+        completed_machines = []
     status = model.get_status().applications[application]
     leader = None
     non_leaders = []
@@ -200,27 +223,18 @@ def series_upgrade_non_leaders_first(application, from_series="trusty",
             non_leaders.append(unit)
 
     # Series upgrade the non-leaders first
-    for unit in non_leaders:
-        machine = status["units"][unit]["machine"]
-        if machine not in completed_machines:
-            logging.info("Series upgrade non-leader unit: {}"
-                         .format(unit))
-            series_upgrade(unit, machine,
-                           from_series=from_series, to_series=to_series,
-                           origin=None)
-            completed_machines.append(machine)
-        else:
-            logging.info("Skipping unit: {}. Machine: {} already upgraded. "
-                         .format(unit, machine, application))
-            model.block_until_all_units_idle()
+    series_upgrade_non_leaders(non_leaders, status, completed_machines,
+                               batch_size=batch_size, state=state,
+                               from_series=from_series, to_series=to_series,
+                               origin=None)
 
     # Series upgrade the leader
     machine = status["units"][leader]["machine"]
     logging.info("Series upgrade leader: {}".format(leader))
-    if machine not in completed_machines:
+    if not _machine_upgraded(machine, completed_machines, state):
         series_upgrade(leader, machine,
                        from_series=from_series, to_series=to_series,
-                       origin=None)
+                       origin=None, state=state)
         completed_machines.append(machine)
     else:
         logging.info("Skipping unit: {}. Machine: {} already upgraded."
@@ -232,8 +246,9 @@ def series_upgrade_application(application, pause_non_leader_primary=True,
                                pause_non_leader_subordinate=True,
                                from_series="trusty", to_series="xenial",
                                origin='openstack-origin',
-                               completed_machines=[],
-                               files=None, workaround_script=None):
+                               completed_machines=None,
+                               files=None, workaround_script=None,
+                               batch_size=None, state=None):
     """Series upgrade application.
 
     Wrap all the functionality to handle series upgrade for a given
@@ -262,9 +277,18 @@ def series_upgrade_application(application, pause_non_leader_primary=True,
     :type files: list
     :param workaround_script: Workaround script to run during series upgrade
     :type workaround_script: str
+    :param batch_size: Number of non-leader units upgraded at the same time,
+                       defaults to SERIES_UPGRADE_BATCH_SIZE
+    :type batch_size: int
+    :param state: Steps of the series upgrade done on each machine, steps
+                  already done are skipped
+    :type state: Optional[upgrade_state.SeriesUpgradeState]
     :returns: None
     :rtype: None
+    :raises: zaza_exceptions.SeriesUpgradeFailed
     """
+    if completed_machines is None:
+        completed_machines = []
     status = model.get_status().applications[application]
 
     # For some applications (percona-cluster) the leader unit must upgrade
@@ -279,8 +303,12 @@ def series_upgrade_application(application, pause_non_leader_primary=True,
         else:
             non_leaders.append(unit)
 
-    # Pause the non-leaders
+    # Pause the non-leaders, those already upgraded by an earlier run are
+    # left running
     for unit in non_leaders:
+        if _machine_upgraded(status["units"][unit]["machine"],
+                             completed_machines, state):
+            continue
         if pause_non_leader_subordinate:
             if status["units"][unit].get("subordinates"):
                 for subordinate in status["units"][unit]["subordinates"]:
@@ -293,11 +321,11 @@ def series_upgrade_application(application, pause_non_leader_primary=True,
     machine = status["units"][leader]["machine"]
     # Series upgrade the leader
     logging.info("Series upgrade leader: {}".format(leader))
-    if machine not in completed_machines:
+    if not _machine_upgraded(machine, completed_machines, state):
         series_upgrade(leader, machine,
                        from_series=from_series, to_series=to_series,
                        origin=origin, workaround_script=workaround_script,
-                       files=files)
+                       files=files, state=state)
         completed_machines.append(machine)
     else:
         logging.info("Skipping unit: {}. Machine: {} already upgraded."
@@ -308,31 +336,179 @@ def series_upgrade_application(application, pause_non_leader_primary=True,
         model.block_until_all_units_idle()
 
     # Series upgrade the non-leaders
-    for unit in non_leaders:
-        machine = status["units"][unit]["machine"]
-        if machine not in completed_machines:
-            logging.info("Series upgrade non-leader unit: {}"
-                         .format(unit))
-            series_upgrade(unit, machine,
-                           from_series=from_series, to_series=to_series,
-                           origin=origin, workaround_script=workaround_script,
-                           files=files)
-            completed_machines.append(machine)
-        else:
-            logging.info("Skipping unit: {}. Machine: {} already upgraded. "
-                         "But setting origin on the application {}"
-                         .format(unit, machine, application))
+    series_upgrade_non_leaders(non_leaders, status, completed_machines,
+                               batch_size=batch_size, state=state,
+                               from_series=from_series, to_series=to_series,
+                               origin=origin,
+                               workaround_script=workaround_script,
+                               files=files)
+
+
+def _machine_upgraded(machine, completed_machines, state):
+    """Whether the series upgrade of a machine has been completed.
+
+    :param machine: Machine number
+    :type machine: str
+    :param completed_machines: List of completed machines
+    :type completed_machines: list
+    :param state: Steps of the series upgrade done on each machine
+    :type state: Optional[upgrade_state.SeriesUpgradeState]
+    :returns: Whether the machine has been upgraded
+    :rtype: bool
+    """
+    return (machine in completed_machines or
+            bool(state and state.is_complete(machine)))
+
+
+def get_charm_name(charm_url):
+    """Return the name of a charm from its URL.
+
+    e.g. percona-cluster for cs:~openstack-charmers/xenial/percona-cluster-290
+
+    :param charm_url: URL of the charm, as given in the status
+    :type charm_url: str
+    :returns: Name of the charm
+    :rtype: str
+    """
+    name = charm_url.split(':')[-1].split('/')[-1]
+    return re.sub(r'-\d+$', '', name)
+
+
+def get_series_upgrade_batch_size(status, batch_size=None):
+    """Return the number of units of an application to upgrade at once.
+
+    For the charms in QUORUM_CHARMS the batch size is capped so a majority
+    of the units of the application stays up.
+
+    :param status: Status of the application
+    :type status: dict
+    :param batch_size: Number of units requested to be upgraded at the same
+                       time, defaults to SERIES_UPGRADE_BATCH_SIZE
+    :type batch_size: int
+    :returns: Number of units to upgrade at the same time
+    :rtype: int
+    """
+    batch_size = batch_size or SERIES_UPGRADE_BATCH_SIZE
+    if get_charm_name(status.get("charm") or "") in QUORUM_CHARMS:
+        batch_size = min(batch_size,
+                         max(1, (len(status["units"]) - 1) // 2))
+    return batch_size
+
+
+def series_upgrade_non_leaders(non_leaders, status, completed_machines,
+                               batch_size=None, origin='openstack-origin',
+                               to_series="xenial", state=None, **kwargs):
+    """Series upgrade the non-leader units of an application in batches.
+
+    The units of a batch are upgraded at the same time and each batch is
+    started once the previous one has finished. While upgrading, each unit
+    only waits on the units of its application. Once all the units of a
+    batch are done, the origin and series of the application are set and
+    the model is waited on, once for the whole batch.
+
+    The machine of each unit upgraded is added to completed_machines,
+    including those of the units of a failed batch which did finish, so
+    calling this again with the same list carries on from the units which
+    were not upgraded.
+
+    :param non_leaders: Names of the non-leader units
+    :type non_leaders: [str, str, ...]
+    :param status: Status of the application
+    :type status: dict
+    :param completed_machines: List of completed machines which do no longer
+                               require series upgrade.
+    :type completed_machines: list
+    :param batch_size: Number of units upgraded at the same time, defaults to
+                       SERIES_UPGRADE_BATCH_SIZE and is capped for charms
+                       which keep quorum, see get_series_upgrade_batch_size
+    :type batch_size: int
+    :param origin: The configuration setting variable name for changing origin
+                   source. (openstack-origin or source)
+    :type origin: str
+    :param to_series: The series to which to upgrade
+    :type to_series: str
+    :param state: Steps of the series upgrade done on each machine, steps
+                  already done are skipped
+    :type state: Optional[upgrade_state.SeriesUpgradeState]
+    :param kwargs: Passed on to series_upgrade
+    :type kwargs: dict
+    :returns: None
+    :rtype: None
+    :raises: zaza_exceptions.SeriesUpgradeFailed
+    """
+    def _set_origin(application):
+        # Allow for charms which have neither source nor openstack-origin
+        if origin:
             logging.info("Set origin on {}".format(application))
             set_origin(application, origin)
-            model.block_until_all_units_idle()
+        model.block_until_all_units_idle()
+
+    pending = []
+    for unit in non_leaders:
+        machine = status["units"][unit]["machine"]
+        if not _machine_upgraded(machine, completed_machines, state):
+            pending.append((unit, machine))
+            continue
+        logging.info("Skipping unit: {}. Machine: {} already upgraded. "
+                     .format(unit, machine))
+    if len(pending) < len(non_leaders):
+        _set_origin(non_leaders[0].split('/')[0])
+
+    batch_size = get_series_upgrade_batch_size(status, batch_size)
+    for i in range(0, len(pending), batch_size):
+        batch = pending[i:i + batch_size]
+        logging.info("Series upgrade non-leader units: {}"
+                     .format(', '.join(unit for unit, _ in batch)))
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(batch)) as executor:
+            futures = [
+                executor.submit(
+                    model.in_model_context(series_upgrade),
+                    unit, machine, origin=origin, to_series=to_series,
+                    state=state, batch=True, **kwargs)
+                for unit, machine in batch]
+        failed = []
+        first_exc = None
+        upgraded = []
+        for (unit, machine), future in zip(batch, futures):
+            if future.exception():
+                logging.error("Series upgrade of {} failed: {}"
+                              .format(unit, future.exception()))
+                failed.append(unit)
+                first_exc = first_exc or future.exception()
+            else:
+                upgraded.append((unit, machine))
+        if upgraded:
+            application = upgraded[0][0].split('/')[0]
+            _set_origin(application)
+            # This step may be performed by juju in the future
+            logging.info("Set series on {} to {}"
+                         .format(application, to_series))
+            model.set_series(application, to_series)
+            for _, machine in upgraded:
+                if state:
+                    state.mark_done(machine, upgrade_state.SET_SERIES)
+                completed_machines.append(machine)
+        if failed:
+            raise zaza_exceptions.SeriesUpgradeFailed(failed) from first_exc
 
 
 def series_upgrade(unit_name, machine_num,
                    from_series="trusty", to_series="xenial",
                    origin='openstack-origin',
-                   files=None, workaround_script=None):
+                   files=None, workaround_script=None, state=None,
+                   batch=False):
     """Perform series upgrade on a unit.
 
+    Each step done is recorded in state, and steps already recorded there
+    are skipped, so the series upgrade of a unit which was interrupted can be
+    picked up where it stopped.
+
+    When the unit is upgraded in a batch, alongside other units of its
+    application, only the units of the application are waited on, and
+    setting the origin and series of the application and the final wait on
+    the model are left to the caller, see series_upgrade_non_leaders.
+
     :param unit_name: Unit Name
     :type unit_name: str
     :param machine_num: Machine number
@@ -348,44 +524,82 @@ def series_upgrade(unit_name, machine_num,
     :type files: list
     :param workaround_script: Workaround script to run during series upgrade
     :type workaround_script: str
+    :param state: Steps of the series upgrade done on each machine
+    :type state: Optional[upgrade_state.SeriesUpgradeState]
+    :param batch: Whether the unit is upgraded in a batch
+    :type batch: bool
     :returns: None
     :rtype: None
     """
+    def _pending(step):
+        if state and state.is_done(machine_num, step):
+            logging.info("Skipping {} on {}, already done"
+                         .format(step, machine_num))
+            return False
+        return True
+
+    def _done(step):
+        if state:
+            state.mark_done(machine_num, step)
+
+    def _block_until_idle():
+        if batch:
+            logging.info("Waiting for idleness of {}".format(application))
+            model.block_until_application_idle(application)
+        else:
+            logging.info("Waiting for model idleness")
+            model.block_until_all_units_idle()
+
     logging.info("Series upgrade {}".format(unit_name))
     application = unit_name.split('/')[0]
-    set_dpkg_non_interactive_on_unit(unit_name)
-    logging.info("Prepare series upgrade on {}".format(machine_num))
-    model.prepare_series_upgrade(machine_num, to_series=to_series)
-    logging.info("Waiting for workload status 'blocked' on {}"
-                 .format(unit_name))
-    model.block_until_unit_wl_status(unit_name, "blocked")
-    logging.info("Waiting for model idleness")
-    model.block_until_all_units_idle()
-    wrap_do_release_upgrade(unit_name, from_series=from_series,
-                            to_series=to_series, files=files,
-                            workaround_script=workaround_script)
-    logging.info("Reboot {}".format(unit_name))
-    reboot(unit_name)
-    logging.info("Waiting for workload status 'blocked' on {}"
-                 .format(unit_name))
-    model.block_until_unit_wl_status(unit_name, "blocked")
-    logging.info("Waiting for model idleness")
-    model.block_until_all_units_idle()
-    logging.info("Set origin on {}".format(application))
-    # Allow for charms which have neither source nor openstack-origin
-    if origin:
-        set_origin(application, origin)
-    model.block_until_all_units_idle()
-    logging.info("Complete series upgrade on {}".format(machine_num))
-    model.complete_series_upgrade(machine_num)
-    model.block_until_all_units_idle()
+    # Each step is recorded as soon as its command has run, the waits for
+    # the unit to settle after it are done before the next step so they are
+    # not skipped when a run is resumed
+    if _pending(upgrade_state.PREPARE):
+        set_dpkg_non_interactive_on_unit(unit_name)
+        logging.info("Prepare series upgrade on {}".format(machine_num))
+        model.prepare_series_upgrade(machine_num, to_series=to_series)
+        _done(upgrade_state.PREPARE)
+    if _pending(upgrade_state.RELEASE_UPGRADE):
+        logging.info("Waiting for workload status 'blocked' on {}"
+                     .format(unit_name))
+        model.block_until_unit_wl_status(unit_name, "blocked")
+        _block_until_idle()
+        wrap_do_release_upgrade(unit_name, from_series=from_series,
+                                to_series=to_series, files=files,
+                                workaround_script=workaround_script)
+        _done(upgrade_state.RELEASE_UPGRADE)
+    if _pending(upgrade_state.REBOOT):
+        logging.info("Reboot {}".format(unit_name))
+        reboot(unit_name)
+        _done(upgrade_state.REBOOT)
+    if _pending(upgrade_state.SET_ORIGIN):
+        logging.info("Waiting for workload status 'blocked' on {}"
+                     .format(unit_name))
+        model.block_until_unit_wl_status(unit_name, "blocked")
+        _block_until_idle()
+        # Allow for charms which have neither source nor openstack-origin
+        if not batch:
+            if origin:
+                logging.info("Set origin on {}".format(application))
+                set_origin(application, origin)
+            model.block_until_all_units_idle()
+        _done(upgrade_state.SET_ORIGIN)
+    if _pending(upgrade_state.COMPLETE):
+        logging.info("Complete series upgrade on {}".format(machine_num))
+        model.complete_series_upgrade(machine_num)
+        _done(upgrade_state.COMPLETE)
+    _block_until_idle()
     logging.info("Waiting for workload status 'active' on {}"
                  .format(unit_name))
     model.block_until_unit_wl_status(unit_name, "active")
+    if batch:
+        return
     model.block_until_all_units_idle()
     # This step may be performed by juju in the future
     logging.info("Set series on {} to {}".format(application, to_series))
     model.set_series(application, to_series)
+    _done(upgrade_state.SET_SERIES)
 
 
 def set_origin(application, origin='openstack-origin', pocket='distro'):
@@ -402,8 +616,13 @@ def set_origin(application, origin='openstack-origin', pocket='distro'):
     :returns: None
     :rtype: None
     """
+    # Imported here as zaza.utilities.openstack imports this module through
+    # zaza.utilities.juju
+    from zaza.utilities import openstack as openstack_utils
     logging.info("Set origin on {} to {}".format(application, origin))
     model.set_application_config(application, {origin: pocket})
+    # The packages of the application are upgraded to the new origin
+    openstack_utils.clear_os_versions_cache(model.get_juju_model())
 
 
 def wrap_do_release_upgrade(unit_name, from_series="trusty",
@@ -446,20 +665,25 @@ def wrap_do_release_upgrade(unit_name, from_series="trusty",
     do_release_upgrade(unit_name)
 
 
-def run_via_ssh(unit_name, cmd):
+def run_via_ssh(unit_name, cmd, model_name=None):
     """Run command on unit via ssh.
 
-    For executing commands on units when the juju agent is down.
+    For executing commands on units when the juju agent is down. The
+    connection to the unit is kept open and shared with later calls, see
+    zaza.utilities.ssh.
 
     :param unit_name: Unit Name
     :param cmd: Command to execute on remote unit
     :type cmd: str
+    :param model_name: Name of model unit is in
+    :type model_name: str
     :returns: None
     :rtype: None
     """
     if "sudo" not in cmd:
         cmd = "sudo {}".format(cmd)
-    cmd = ['juju', 'ssh', unit_name, cmd]
+    cmd = (['juju', 'ssh', '-m', model_name or model.get_juju_model(),
+            unit_name] + ssh.multiplex_options() + [cmd])
     logging.info("Running {} on {}".format(cmd, unit_name))
     try:
         subprocess.check_call(cmd)
@@ -468,18 +692,39 @@ def run_via_ssh(unit_name, cmd):
         logging.warn(e)
 
 
-def do_release_upgrade(unit_name):
+def close_ssh_connection(unit_name, model_name=None):
+    """Close the shared ssh connection to a unit.
+
+    See zaza.utilities.ssh, nothing is done if there is no connection open.
+
+    :param unit_name: Unit Name
+    :type unit_name: str
+    :param model_name: Name of model unit is in
+    :type model_name: str
+    :returns: None
+    :rtype: None
+    """
+    cmd = (['juju', 'ssh', '-m', model_name or model.get_juju_model(),
+            unit_name] + ssh.multiplex_options() + ['-O', 'exit'])
+    subprocess.call(cmd, stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL)
+
+
+def do_release_upgrade(unit_name, model_name=None):
     """Run do-release-upgrade noninteractive.
 
     :param unit_name: Unit Name
     :type unit_name: str
+    :param model_name: Name of model unit is in
+    :type model_name: str
     :returns: None
     :rtype: None
     """
     logging.info('Upgrading ' + unit_name)
     # NOTE: It is necessary to run this via juju ssh rather than juju run due
     # to timeout restrictions and error handling.
-    cmd = ['juju', 'ssh', unit_name, 'sudo', 'DEBIAN_FRONTEND=noninteractive',
+    cmd = ['juju', 'ssh', '-m', model_name or model.get_juju_model(),
+           unit_name, 'sudo', 'DEBIAN_FRONTEND=noninteractive',
            'do-release-upgrade', '-f', 'DistUpgradeViewNonInteractive']
     try:
         subprocess.check_call(cmd)
@@ -488,17 +733,22 @@ def do_release_upgrade(unit_name):
         logging.warn(e)
 
 
-def reboot(unit_name):
+def reboot(unit_name, model_name=None):
     """Reboot unit.
 
     :param unit_name: Unit Name
     :type unit_name: str
+    :param model_name: Name of model unit is in
+    :type model_name: str
     :returns: None
     :rtype: None
     """
+    # The shared connection to the unit does not survive the reboot
+    close_ssh_connection(unit_name, model_name=model_name)
     # NOTE: When used with series upgrade the agent will be down.
     # Even juju run will not work
-    cmd = ['juju', 'ssh', unit_name, 'sudo', 'reboot', '&&', 'exit']
+    cmd = ['juju', 'ssh', '-m', model_name or model.get_juju_model(),
+           unit_name, 'sudo', 'reboot', '&&', 'exit']
     try:
         subprocess.check_call(cmd)
     except subprocess.CalledProcessError as e:
@@ -522,24 +772,35 @@ def set_dpkg_non_interactive_on_unit(
     model.run_on_unit(unit_name, cmd)
 
 
-def get_process_id_list(unit_name, process_name,
-                        expect_success=True):
-    """Get a list of process ID(s).
-
-    Get a list of process ID(s) from a single sentry juju unit
-    for a single process name.
+def _get_process_id_list_cmd(process_name, expect_success=True):
+    """Return the command used to get the process ID(s) of a process.
 
-    :param unit_name: Amulet sentry instance (juju unit)
     :param process_name: Process name
+    :type process_name: str
     :param expect_success: If False, expect the PID to be missing,
-        raise if it is present.
-    :returns: List of process IDs
-    :raises: zaza_exceptions.ProcessIdsFailed
+        fail if it is present.
+    :type expect_success: bool
+    :returns: Command to run on unit
+    :rtype: str
     """
     cmd = 'pidof -x "{}"'.format(process_name)
     if not expect_success:
         cmd += " || exit 0 && exit 1"
-    results = model.run_on_unit(unit_name=unit_name, command=cmd)
+    return cmd
+
+
+def _get_process_id_list_from_result(unit_name, cmd, results):
+    """Return the process ID(s) from the result of running cmd on a unit.
+
+    :param unit_name: Name of unit command was run on
+    :type unit_name: str
+    :param cmd: Command that was run
+    :type cmd: str
+    :param results: Result of running the command
+    :type results: dict
+    :returns: List of process IDs
+    :raises: zaza_exceptions.ProcessIdsFailed
+    """
     code = results.get("Code", 1)
     try:
         code = int(code)
@@ -554,12 +815,35 @@ def get_process_id_list(unit_name, process_name,
     return str(output).split()
 
 
+def get_process_id_list(unit_name, process_name,
+                        expect_success=True):
+    """Get a list of process ID(s).
+
+    Get a list of process ID(s) from a single sentry juju unit
+    for a single process name.
+
+    :param unit_name: Amulet sentry instance (juju unit)
+    :param process_name: Process name
+    :param expect_success: If False, expect the PID to be missing,
+        raise if it is present.
+    :returns: List of process IDs
+    :raises: zaza_exceptions.ProcessIdsFailed
+    """
+    cmd = _get_process_id_list_cmd(process_name,
+                                   expect_success=expect_success)
+    results = model.run_on_unit(unit_name=unit_name, command=cmd)
+    return _get_process_id_list_from_result(unit_name, cmd, results)
+
+
 def get_unit_process_ids(unit_processes, expect_success=True):
     """Get unit process ID(s).
 
     Construct a dict containing unit sentries, process names, and
     process IDs.
 
+    Each process is looked up on all the units it is expected on with a
+    single juju run.
+
     :param unit_processes: A dictionary of unit names
         to list of process names.
     :param expect_success: if False expect the processes to not be
@@ -568,13 +852,26 @@ def get_unit_process_ids(unit_processes, expect_success=True):
         of process names to PIDs.
     :raises: zaza_exceptions.ProcessIdsFailed
     """
+    processes = []
+    for process_list in unit_processes.values():
+        for process in process_list:
+            if process not in processes:
+                processes.append(process)
+    pids = {}
+    for process in processes:
+        unit_names = [unit_name
+                      for unit_name, process_list in unit_processes.items()
+                      if process in process_list]
+        cmd = _get_process_id_list_cmd(process, expect_success=expect_success)
+        results = model.run_on_units(unit_names, cmd)
+        for unit_name in unit_names:
+            pids[(unit_name, process)] = _get_process_id_list_from_result(
+                unit_name, cmd, results[unit_name])
     pid_dict = {}
     for unit_name, process_list in unit_processes.items():
         pid_dict[unit_name] = {}
         for process in process_list:
-            pids = get_process_id_list(
-                unit_name, process, expect_success=expect_success)
-            pid_dict[unit_name].update({process: pids})
+            pid_dict[unit_name].update({process: pids[(unit_name, process)]})
     return pid_dict
 
 
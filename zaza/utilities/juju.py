@@ -16,6 +16,7 @@
 """Module for interacting with juju."""
 import os
 from pathlib import Path
+import time
 import yaml
 
 from zaza import (
@@ -24,27 +25,93 @@ from zaza import (
 )
 from zaza.utilities import generic as generic_utils
 
+# Seconds a status snapshot is served from memory before being refreshed
+STATUS_SNAPSHOT_TTL = 10
+# Status snapshots keyed by model name
+STATUS_SNAPSHOTS = {}
+
+
+class StatusSnapshot(object):
+    """Full juju status fetched once and indexed for lookups."""
+
+    def __init__(self, status):
+        """Index the given full status by application, unit and machine.
+
+        :param status: Full juju status output
+        :type status: juju.client._definitions.FullStatus
+        """
+        self.status = status
+        self.created = time.time()
+        self.applications = dict(status.applications)
+        self.machines = dict(status.machines)
+        self.units = {}
+        for app_status in self.applications.values():
+            self.units.update(app_status.get("units") or {})
+
+    def expired(self, ttl):
+        """Whether the snapshot is older than the given ttl.
+
+        :param ttl: Maximum age in seconds
+        :type ttl: float
+        :returns: Whether the snapshot should be refreshed
+        :rtype: bool
+        """
+        return time.time() - self.created > ttl
+
+
+def get_status_snapshot(model_name=None, ttl=None):
+    """Return a status snapshot for the model, refreshing it once expired.
+
+    :param model_name: Name of model to query.
+    :type model_name: str
+    :param ttl: Maximum age of the snapshot in seconds, defaults to
+                STATUS_SNAPSHOT_TTL
+    :type ttl: float
+    :returns: Status snapshot
+    :rtype: StatusSnapshot
+    """
+    if ttl is None:
+        ttl = STATUS_SNAPSHOT_TTL
+    if not model_name:
+        model_name = model.get_juju_model()
+    snapshot = STATUS_SNAPSHOTS.get(model_name)
+    if snapshot is None or snapshot.expired(ttl):
+        snapshot = StatusSnapshot(model.get_status(model_name=model_name))
+        STATUS_SNAPSHOTS[model_name] = snapshot
+    return snapshot
+
+
+def invalidate_status_snapshot(model_name=None):
+    """Drop the status snapshot so the next lookup fetches a fresh status.
+
+    :param model_name: Name of model to drop the snapshot for, if unset the
+                       snapshots for all models are dropped.
+    :type model_name: str
+    """
+    if model_name:
+        STATUS_SNAPSHOTS.pop(model_name, None)
+    else:
+        STATUS_SNAPSHOTS.clear()
 
-def get_application_status(application=None, unit=None):
+
+def get_application_status(application=None, unit=None, model_name=None):
     """Return the juju status for an application.
 
     :param application: Application name
     :type application: string
     :param unit: Specific unit
     :type unit: string
+    :param model_name: Name of model to query.
+    :type model_name: str
     :returns: Juju status output for an application
     :rtype: dict
     """
-    status = get_full_juju_status()
-
-    if unit and not application:
-        application = unit.split("/")[0]
-
-    if application:
-        status = status.applications.get(application)
+    snapshot = get_status_snapshot(model_name=model_name)
     if unit:
-        status = status.get("units").get(unit)
-    return status
+        return snapshot.units.get(unit)
+    if application:
+        return snapshot.applications.get(application)
+    return snapshot.status
 
 
 def get_cloud_configs(cloud=None):
@@ -76,20 +143,24 @@ def get_full_juju_status():
     return status
 
 
-def get_machines_for_application(application):
+def get_machines_for_application(application, model_name=None):
     """Return machines for a given application.
 
     :param application: Application name
     :type application: string
+    :param model_name: Name of model to query.
+    :type model_name: str
     :returns: List of machines for an application
     :rtype: list
     """
-    status = get_application_status(application)
+    status = get_application_status(application, model_name=model_name)
 
     # libjuju juju status no longer has units for subordinate charms
     # Use the application it is subordinate-to to find machines
     if status.get("units") is None and status.get("subordinate-to"):
-        return get_machines_for_application(status.get("subordinate-to")[0])
+        return get_machines_for_application(
+            status.get("subordinate-to")[0],
+            model_name=model_name)
 
     machines = []
     for unit in status.get("units").keys():
@@ -115,48 +186,56 @@ def get_unit_name_from_host_name(host_name, application):
     return unit_names[0]
 
 
-def get_machine_status(machine, key=None):
+def get_machine_status(machine, key=None, model_name=None):
     """Return the juju status for a machine.
 
     :param machine: Machine number
     :type machine: string
     :param key: Key option requested
     :type key: string
+    :param model_name: Name of model to query.
+    :type model_name: str
     :returns: Juju status output for a machine
     :rtype: dict
     """
-    status = get_full_juju_status()
-    status = status.machines.get(machine)
+    status = get_status_snapshot(model_name=model_name).machines.get(machine)
     if key:
         status = status.get(key)
     return status
 
 
-def get_machine_series(machine):
+def get_machine_series(machine, model_name=None):
     """Return the juju series for a machine.
 
     :param machine: Machine number
     :type machine: string
+    :param model_name: Name of model to query.
+    :type model_name: str
     :returns: Juju series
     :rtype: string
     """
     return get_machine_status(
         machine=machine,
-        key='series'
+        key='series',
+        model_name=model_name
     )
 
 
-def get_machine_uuids_for_application(application):
+def get_machine_uuids_for_application(application, model_name=None):
     """Return machine uuids for a given application.
 
     :param application: Application name
     :type application: string
+    :param model_name: Name of model to query.
+    :type model_name: str
     :returns: List of machine uuuids for an application
     :rtype: list
     """
     uuids = []
-    for machine in get_machines_for_application(application):
-        uuids.append(get_machine_status(machine, key="instance-id"))
+    for machine in get_machines_for_application(application,
+                                                model_name=model_name):
+        uuids.append(get_machine_status(machine, key="instance-id",
+                                        model_name=model_name))
     return uuids
 
 
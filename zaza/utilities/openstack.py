@@ -18,9 +18,10 @@ This module contains a number of functions for interacting with Openstack.
 """
 from .os_versions import (
     OPENSTACK_CODENAMES,
-    SWIFT_CODENAMES,
     PACKAGE_CODENAMES,
     OPENSTACK_RELEASES_PAIRS,
+    OPENSTACK_RELEASES_PAIRS_INDEX,
+    SWIFT_VERSION_CODENAMES,
 )
 
 from openstack import connection
@@ -30,6 +31,7 @@ from glanceclient import Client as GlanceClient
 
 from keystoneclient.v2_0 import client as keystoneclient_v2
 from keystoneclient.v3 import client as keystoneclient_v3
+from keystoneauth1 import exceptions as ks_exceptions
 from keystoneauth1 import session
 from keystoneauth1.identity import (
     v3,
@@ -43,23 +45,24 @@ from octaviaclient.api.v2 import octavia as octaviaclient
 from swiftclient import client as swiftclient
 
 import datetime
+import functools
 import io
+import json
 import juju_wait
 import logging
 import os
 import paramiko
 import re
-import six
 import subprocess
 import sys
 import tempfile
 import tenacity
+import threading
 import urllib
 
 from zaza import model
 from zaza.utilities import (
     exceptions,
-    generic as generic_utils,
     juju as juju_utils,
 )
 
@@ -136,9 +139,52 @@ KEYSTONE_CACERT = "keystone_juju_ca_cert.crt"
 KEYSTONE_REMOTE_CACERT = (
     "/usr/local/share/ca-certificates/{}".format(KEYSTONE_CACERT))
 KEYSTONE_LOCAL_CACERT = ("/tmp/{}".format(KEYSTONE_CACERT))
+# OpenStack codename of applications, keyed on model name
+OS_VERSIONS = {}
+# Overcloud auth settings of a model, kept until the keystone application
+# changes or keystone rejects them
+OVERCLOUD_AUTH_CACHE = "/tmp/zaza-overcloud-auth-{}.json"
+
+# Keystone sessions keyed on the credentials they authenticate with, and the
+# clients created from them, shared by all the tests run by a process
+KEYSTONE_SESSIONS = {}
+SESSION_CLIENTS = {}
+_SESSION_LOCK = threading.Lock()
 
 
 # Openstack Client helpers
+def clear_session_cache():
+    """Forget the keystone sessions and clients created so far."""
+    with _SESSION_LOCK:
+        KEYSTONE_SESSIONS.clear()
+        SESSION_CLIENTS.clear()
+
+
+def cached_session_client(func):
+    """Share the clients created by func for the same keystone session.
+
+    :param func: Function creating a client from a keystone session
+    :type func: Callable
+    :returns: Function returning the client created by an earlier call with
+              the same session and arguments if there was one
+    :rtype: Callable
+    """
+    @functools.wraps(func)
+    def _wrapper(session, *args, **kwargs):
+        key = (func.__name__, id(session), args,
+               tuple(sorted(kwargs.items())))
+        with _SESSION_LOCK:
+            cached = SESSION_CLIENTS.get(key)
+        # The session is kept with its clients so its id is not reused
+        if cached and cached[0] is session:
+            return cached[1]
+        client = func(session, *args, **kwargs)
+        with _SESSION_LOCK:
+            SESSION_CLIENTS[key] = (session, client)
+        return client
+    return _wrapper
+
+
 def get_ks_creds(cloud_creds, scope='PROJECT'):
     """Return the credentials for authenticating against keystone.
 
@@ -178,6 +224,7 @@ def get_ks_creds(cloud_creds, scope='PROJECT'):
     return auth
 
 
+@cached_session_client
 def get_glance_session_client(session):
     """Return glanceclient authenticated by keystone session.
 
@@ -189,6 +236,7 @@ def get_glance_session_client(session):
     return GlanceClient('2', session=session)
 
 
+@cached_session_client
 def get_nova_session_client(session):
     """Return novaclient authenticated by keystone session.
 
@@ -200,6 +248,7 @@ def get_nova_session_client(session):
     return novaclient_client.Client(2, session=session)
 
 
+@cached_session_client
 def get_neutron_session_client(session):
     """Return neutronclient authenticated by keystone session.
 
@@ -211,6 +260,7 @@ def get_neutron_session_client(session):
     return neutronclient.Client(session=session)
 
 
+@cached_session_client
 def get_swift_session_client(session,
                              region_name='RegionOne'):
     """Return swiftclient authenticated by keystone session.
@@ -226,6 +276,7 @@ def get_swift_session_client(session,
                                   os_options={'region_name': region_name})
 
 
+@cached_session_client
 def get_octavia_session_client(session, service_type='load-balancer',
                                interface='internal'):
     """Return octavia client authenticated by keystone session.
@@ -251,6 +302,7 @@ def get_octavia_session_client(session, service_type='load-balancer',
                                     endpoint=endpoint.url)
 
 
+@cached_session_client
 def get_cinder_session_client(session, version=2):
     """Return cinderclient authenticated by keystone session.
 
@@ -264,6 +316,7 @@ def get_cinder_session_client(session, version=2):
     return cinderclient.Client(session=session, version=version)
 
 
+@cached_session_client
 def get_masakari_session_client(session, interface='internal',
                                 region_name='RegionOne'):
     """Return masakari client authenticated by keystone session.
@@ -302,6 +355,11 @@ def get_keystone_scope():
 def get_keystone_session(openrc_creds, scope='PROJECT', verify=None):
     """Return keystone session.
 
+    Sessions are shared by all callers passing the same credentials, scope
+    and verify, so authentication and the HTTP connection pool are only set
+    up once. The token of a session is renewed by keystoneauth1 when it is
+    about to expire.
+
     :param openrc_creds: Openstack RC credentials
     :type openrc_creds: dict
     :param verify: Control TLS certificate verification behaviour
@@ -314,14 +372,36 @@ def get_keystone_session(openrc_creds, scope='PROJECT', verify=None):
     :returns: Keystone session object
     :rtype: keystoneauth1.session.Session object
     """
-    keystone_creds = get_ks_creds(openrc_creds, scope=scope)
-    if not verify and openrc_creds.get('OS_CACERT'):
-        verify = openrc_creds['OS_CACERT']
-    if openrc_creds.get('API_VERSION', 2) == 2:
-        auth = v2.Password(**keystone_creds)
-    else:
-        auth = v3.Password(**keystone_creds)
-    return session.Session(auth=auth, verify=verify)
+    key = json.dumps([openrc_creds, scope, verify], sort_keys=True,
+                     default=str)
+    with _SESSION_LOCK:
+        if key in KEYSTONE_SESSIONS:
+            return KEYSTONE_SESSIONS[key]
+        keystone_creds = get_ks_creds(openrc_creds, scope=scope)
+        if not verify and openrc_creds.get('OS_CACERT'):
+            verify = openrc_creds['OS_CACERT']
+        if openrc_creds.get('API_VERSION', 2) == 2:
+            auth = v2.Password(**keystone_creds)
+        else:
+            auth = v3.Password(**keystone_creds)
+        keystone_session = session.Session(auth=auth, verify=verify)
+        KEYSTONE_SESSIONS[key] = keystone_session
+    return keystone_session
+
+
+def _forget_session(keystone_session):
+    """Stop sharing a keystone session and the clients created from it.
+
+    :param keystone_session: Keystone session object
+    :type keystone_session: keystoneauth1.session.Session
+    """
+    with _SESSION_LOCK:
+        for key, value in list(KEYSTONE_SESSIONS.items()):
+            if value is keystone_session:
+                del KEYSTONE_SESSIONS[key]
+        for key in list(SESSION_CLIENTS):
+            if key[1] == id(keystone_session):
+                del SESSION_CLIENTS[key]
 
 
 def get_overcloud_keystone_session(verify=None):
@@ -332,9 +412,27 @@ def get_overcloud_keystone_session(verify=None):
     :returns keystone_session: keystoneauth1.session.Session object
     :rtype: keystoneauth1.session.Session
     """
-    return get_keystone_session(get_overcloud_auth(),
-                                scope=get_keystone_scope(),
-                                verify=verify)
+    scope = get_keystone_scope()
+    keystone_session = get_keystone_session(get_overcloud_auth(),
+                                            scope=scope,
+                                            verify=verify)
+    try:
+        keystone_session.get_token()
+    except (ks_exceptions.Unauthorized, ks_exceptions.SSLError) as e:
+        # The admin password or CA certificate changed since the settings
+        # were cached
+        logging.info('Keystone rejected the cached overcloud auth settings, '
+                     'working them out again: {}'.format(e))
+        _forget_session(keystone_session)
+        clear_overcloud_auth_cache()
+        keystone_session = get_keystone_session(get_overcloud_auth(),
+                                                scope=scope,
+                                                verify=verify)
+    except ks_exceptions.ClientException:
+        # Any other failure, keystone not being up yet for example, is left
+        # to the caller using the session
+        pass
+    return keystone_session
 
 
 def get_undercloud_keystone_session(verify=None):
@@ -349,6 +447,7 @@ def get_undercloud_keystone_session(verify=None):
                                 verify=verify)
 
 
+@cached_session_client
 def get_keystone_session_client(session, client_api_version=3):
     """Return keystoneclient authenticated by keystone session.
 
@@ -377,13 +476,8 @@ def get_keystone_client(openrc_creds, verify=None):
     """
     session = get_keystone_session(openrc_creds, verify=verify)
     client = get_keystone_session_client(session)
-    keystone_creds = get_ks_creds(openrc_creds)
-    if openrc_creds.get('API_VERSION', 2) == 2:
-        auth = v2.Password(**keystone_creds)
-    else:
-        auth = v3.Password(**keystone_creds)
-    # This populates the client.service_catalog
-    client.auth_ref = auth.get_access(session)
+    # This populates the client.service_catalog, reusing the session's token
+    client.auth_ref = session.auth.get_access(session)
     return client
 
 
@@ -1156,8 +1250,7 @@ def get_swift_codename(version):
     :returns: Codename for swift
     :rtype: string
     """
-    codenames = [k for k, v in six.iteritems(SWIFT_CODENAMES) if version in v]
-    return codenames[0]
+    return SWIFT_VERSION_CODENAMES[version]
 
 
 def get_os_code_info(package, pkg_version):
@@ -1198,24 +1291,116 @@ def get_os_code_info(package, pkg_version):
             return OPENSTACK_CODENAMES[vers]
 
 
-def get_current_os_versions(deployed_applications):
+def clear_os_versions_cache(model_name=None):
+    """Forget the OpenStack codenames found for the applications of a model.
+
+    Called wherever zaza upgrades the packages of applications, see
+    zaza.utilities.generic.set_origin and zaza.model.async_run_action.
+
+    :param model_name: Name of model, all models if unset
+    :type model_name: Optional[str]
+    """
+    if model_name:
+        OS_VERSIONS.pop(model_name, None)
+    else:
+        OS_VERSIONS.clear()
+
+
+def probe_os_versions(applications, model_name=None, all_units=False):
+    """Determine OpenStack codename of applications with a single juju run.
+
+    The versions of the packages of all the applications are queried on the
+    first unit of each application at the same time. With all_units they
+    are queried on every unit, which costs a run on each unit rather than on
+    each application, and the units of an application must agree.
+
+    :param applications: Names of applications listed in UPGRADE_SERVICES
+    :type applications: [str, str, ...]
+    :param model_name: Name of model to query
+    :type model_name: str
+    :param all_units: Whether to check the version on all units
+    :type all_units: bool
+    :returns: Codename of each application
+    :rtype: dict
+    :raises: model.CommandRunFailed
+    :raises: exceptions.OSVersionNotFound
+    """
+    packages = {service['name']: service['type']['pkg']
+                for service in UPGRADE_SERVICES}
+    if all_units:
+        unit_names = {
+            application: sorted(
+                unit.name for unit in model.get_units(
+                    application, model_name=model_name))
+            for application in applications}
+    else:
+        unit_names = {
+            application: [model.get_first_unit_name(
+                application, model_name=model_name)]
+            for application in applications}
+    cmd = ("dpkg-query -W -f='${{db:Status-Abbrev}} ${{Package}} "
+           "${{Version}}\\n' {} 2>/dev/null; true".format(
+               ' '.join(sorted(set(packages[a] for a in applications)))))
+    results = model.run_on_units(
+        [unit_name for application in applications
+         for unit_name in unit_names[application]],
+        cmd, model_name=model_name)
+    versions = {}
+    for application in applications:
+        package = packages[application]
+        pkg_versions = set()
+        for unit_name in unit_names[application]:
+            result = results[unit_name]
+            if int(result.get('Code', 1)) != 0:
+                raise model.CommandRunFailed(cmd, result)
+            installed = {}
+            for line in result.get('Stdout', '').splitlines():
+                fields = line.split()
+                if len(fields) == 3 and fields[0] == 'ii':
+                    installed[fields[1]] = fields[2]
+            if package not in installed:
+                raise exceptions.OSVersionNotFound(
+                    '{} is not installed on {}'.format(package, unit_name))
+            pkg_versions.add(installed[package])
+        if len(pkg_versions) != 1:
+            raise exceptions.OSVersionNotFound(
+                'Units of {} have different versions of {}: {}'.format(
+                    application, package, ', '.join(sorted(pkg_versions))))
+        versions[application] = get_os_code_info(package, pkg_versions.pop())
+    return versions
+
+
+def get_current_os_versions(deployed_applications, model_name=None,
+                            all_units=False):
     """Determine OpenStack codename of deployed applications.
 
+    The codenames are cached for the model, applications not in the cache
+    are probed together with a single juju run. The cache is dropped when
+    zaza upgrades packages, see clear_os_versions_cache.
+
     :param deployed_applications: List of deployed applications
     :type deployed_applications: list
+    :param model_name: Name of model to query
+    :type model_name: str
+    :param all_units: Whether to probe all units of the applications and
+                      check they agree, the cache is refreshed rather than
+                      used
+    :type all_units: bool
     :returns: List of aplication to codenames dictionaries
     :rtype: list
+    :raises: model.CommandRunFailed
+    :raises: exceptions.OSVersionNotFound
     """
-    versions = {}
-    for application in UPGRADE_SERVICES:
-        if application['name'] not in deployed_applications:
-            continue
-
-        version = generic_utils.get_pkg_version(application['name'],
-                                                application['type']['pkg'])
-        versions[application['name']] = (
-            get_os_code_info(application['type']['pkg'], version))
-    return versions
+    model_name = model_name or model.get_juju_model()
+    applications = [service['name'] for service in UPGRADE_SERVICES
+                    if service['name'] in deployed_applications]
+    cache = OS_VERSIONS.setdefault(model_name, {})
+    missing = [application for application in applications
+               if all_units or application not in cache]
+    if missing:
+        cache.update(probe_os_versions(missing, model_name=model_name,
+                                       all_units=all_units))
+    return {application: cache[application] for application in applications}
 
 
 def get_application_config_keys(application):
@@ -1268,8 +1453,8 @@ def get_os_release(release_pair=None):
     if release_pair is None:
         release_pair = get_current_os_release_pair()
     try:
-        index = OPENSTACK_RELEASES_PAIRS.index(release_pair)
-    except ValueError:
+        index = OPENSTACK_RELEASES_PAIRS_INDEX[release_pair]
+    except KeyError:
         msg = 'Release pair: {} not found in {}'.format(
             release_pair,
             OPENSTACK_RELEASES_PAIRS
@@ -1391,9 +1576,111 @@ def get_keystone_api_version():
     return int(api_version)
 
 
-def get_overcloud_auth(address=None):
+def get_overcloud_auth(address=None, cached=True):
     """Get overcloud OpenStack authentication from the environment.
 
+    Unless an address is given the settings are cached in a file per model,
+    along with the fingerprint of the keystone application, and reused until
+    it changes. The admin password and CA certificate can change without the
+    application changing, get_overcloud_keystone_session works the settings
+    out again when keystone rejects them.
+
+    :param address: Address of keystone to use instead of its VIP or first
+                    unit
+    :type address: Optional[str]
+    :param cached: Whether to use the cached settings
+    :type cached: bool
+    :returns: Dictionary of authentication settings
+    :rtype: dict
+    """
+    if address or not cached:
+        return _get_overcloud_auth(address=address)
+    model_name = model.get_juju_model()
+    fingerprint = model.get_application_fingerprint(
+        'keystone', model_name=model_name)
+    cache_file = OVERCLOUD_AUTH_CACHE.format(model_name)
+    auth_settings = _read_overcloud_auth_cache(
+        cache_file, model_name, fingerprint)
+    if auth_settings is None:
+        auth_settings = _get_overcloud_auth()
+        _write_overcloud_auth_cache(
+            cache_file, model_name, fingerprint, auth_settings)
+    return auth_settings
+
+
+def clear_overcloud_auth_cache(model_name=None):
+    """Remove the cached overcloud authentication settings of a model.
+
+    :param model_name: Name of model, the current model if unset
+    :type model_name: Optional[str]
+    """
+    cache_file = OVERCLOUD_AUTH_CACHE.format(
+        model_name or model.get_juju_model())
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+
+def _read_overcloud_auth_cache(cache_file, model_name, fingerprint):
+    """Read cached overcloud authentication settings.
+
+    :param cache_file: Path to cache file
+    :type cache_file: str
+    :param model_name: Name of model the settings are for
+    :type model_name: str
+    :param fingerprint: Current fingerprint of the keystone application
+    :type fingerprint: str
+    :returns: Dictionary of authentication settings, None if there are none
+              or they are out of date
+    :rtype: Optional[dict]
+    """
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (cache.get('model_name') != model_name or
+            cache.get('fingerprint') != fingerprint):
+        return None
+    auth_settings = cache.get('auth_settings') or {}
+    if not auth_settings:
+        return None
+    if (auth_settings.get('OS_CACERT') and
+            not os.path.exists(auth_settings['OS_CACERT'])):
+        return None
+    return auth_settings
+
+
+def _write_overcloud_auth_cache(cache_file, model_name, fingerprint,
+                                auth_settings):
+    """Cache overcloud authentication settings.
+
+    The cache file holds the admin password so it is only readable by the
+    user running the tests.
+
+    :param cache_file: Path to cache file
+    :type cache_file: str
+    :param model_name: Name of model the settings are for
+    :type model_name: str
+    :param fingerprint: Fingerprint of the keystone application
+    :type fingerprint: str
+    :param auth_settings: Dictionary of authentication settings
+    :type auth_settings: dict
+    """
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+    with os.fdopen(fd, 'w') as f:
+        json.dump({
+            'model_name': model_name,
+            'fingerprint': fingerprint,
+            'auth_settings': auth_settings}, f)
+    os.replace(tmp_file, cache_file)
+
+
+def _get_overcloud_auth(address=None):
+    """Work out overcloud OpenStack authentication from the model.
+
+    :param address: Address of keystone to use instead of its VIP or first
+                    unit
+    :type address: Optional[str]
     :returns: Dictionary of authentication settings
     :rtype: dict
     """
@@ -192,3 +192,14 @@ PACKAGE_CODENAMES = {
         ('15', 'stein'),
     ]),
 }
+
+# Codename of each swift version, versions shipped in more than one release
+# map to the oldest
+SWIFT_VERSION_CODENAMES = {
+    version: codename
+    for codename, versions in reversed(list(SWIFT_CODENAMES.items()))
+    for version in versions}
+
+# Position of each release pair in OPENSTACK_RELEASES_PAIRS
+OPENSTACK_RELEASES_PAIRS_INDEX = {
+    pair: index for index, pair in enumerate(OPENSTACK_RELEASES_PAIRS)}
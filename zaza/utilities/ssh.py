@@ -0,0 +1,109 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Share one SSH connection to each machine between ssh and scp calls.
+
+The first ssh or scp to a machine becomes an OpenSSH ControlMaster which
+stays up in the background, later calls to the same machine run over it
+and skip the SSH handshake. Connections are closed when the process that
+opened them exits, or after CONTROL_PERSIST seconds without use.
+"""
+import atexit
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+# Seconds an unused connection is kept open for
+CONTROL_PERSIST = 600
+# Seconds between keepalives and number of keepalives missed before a
+# connection is given up on
+SERVER_ALIVE_INTERVAL = 15
+SERVER_ALIVE_COUNT_MAX = 3
+
+CONTROL_DIR = None
+CONTROL_DIR_PID = None
+_LOCK = threading.Lock()
+
+
+def get_control_dir():
+    """Return the directory holding the control sockets of this process.
+
+    :returns: Path to directory
+    :rtype: str
+    """
+    global CONTROL_DIR, CONTROL_DIR_PID
+    with _LOCK:
+        # A forked child opens its own connections
+        if CONTROL_DIR is None or CONTROL_DIR_PID != os.getpid():
+            CONTROL_DIR = tempfile.mkdtemp(prefix='zaza-ssh-')
+            CONTROL_DIR_PID = os.getpid()
+        return CONTROL_DIR
+
+
+def multiplex_options():
+    """Return the OpenSSH options to share a connection per machine.
+
+    The options work with ssh, scp and juju ssh.
+
+    :returns: Options
+    :rtype: [str, str, ...]
+    """
+    return [
+        '-o', 'ControlMaster=auto',
+        # %C is a hash of the local host, remote host, port and user, so it
+        # stays short enough for a unix socket path
+        '-o', 'ControlPath={}'.format(
+            os.path.join(get_control_dir(), '%C')),
+        '-o', 'ControlPersist={}'.format(CONTROL_PERSIST),
+        # Drop a connection whose machine stopped answering, e.g. after a
+        # reboot, rather than leaving later calls hanging on it
+        '-o', 'ServerAliveInterval={}'.format(SERVER_ALIVE_INTERVAL),
+        '-o', 'ServerAliveCountMax={}'.format(SERVER_ALIVE_COUNT_MAX)]
+
+
+def merge_options(options):
+    """Add the multiplexing options to options passed by a caller.
+
+    Options given by the caller come first so they take precedence.
+
+    :param options: Options to ssh or scp
+    :type options: Optional[Union[str, List[str]]]
+    :returns: Options
+    :rtype: [str, str, ...]
+    """
+    if not options:
+        options = []
+    elif isinstance(options, str):
+        options = options.split()
+    return list(options) + multiplex_options()
+
+
+@atexit.register
+def close_connections():
+    """Close the connections opened by this process."""
+    global CONTROL_DIR
+    with _LOCK:
+        if CONTROL_DIR is None or CONTROL_DIR_PID != os.getpid():
+            return
+        for socket in os.listdir(CONTROL_DIR):
+            subprocess.call(
+                ['ssh', '-o', 'ControlPath={}'.format(
+                    os.path.join(CONTROL_DIR, socket)),
+                 '-O', 'exit', 'zaza'],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL)
+        shutil.rmtree(CONTROL_DIR, ignore_errors=True)
+        CONTROL_DIR = None
@@ -0,0 +1,328 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record how long lifecycle phases and zaza helpers take.
+
+Spans are only recorded when a span file is set, either with
+set_span_file or the ZAZA_SPAN_FILE environment variable. Each span is
+appended to the file as a line of JSON. Spans record the span they were
+started in as their parent, so they can be shown nested in a trace.
+"""
+import asyncio
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+
+try:
+    import contextvars
+except ImportError:
+    # Python 3.6, spans started in asyncio tasks get the parent of the
+    # thread running the event loop instead of the task
+    contextvars = None
+
+SPAN_FILE_ENV = 'ZAZA_SPAN_FILE'
+# Arguments recorded with a span when they are passed to a timed function
+SPAN_ARGUMENTS = [
+    'model_name',
+    'application_name',
+    'application',
+    'unit_name',
+    'unit_names',
+    'machine_num',
+    'bundle',
+    'model']
+
+_WRITE_LOCK = threading.Lock()
+_SPAN_IDS = itertools.count(1)
+if contextvars:
+    _CURRENT_SPAN = contextvars.ContextVar('zaza_current_span', default=None)
+else:
+    _CURRENT_SPAN = None
+_LOCAL = threading.local()
+
+
+def current_span_id():
+    """Return the id of the span currently running.
+
+    :returns: Span id, None if no span is running
+    :rtype: Optional[str]
+    """
+    if _CURRENT_SPAN is not None:
+        return _CURRENT_SPAN.get()
+    return getattr(_LOCAL, 'span_id', None)
+
+
+def _set_current_span_id(span_id):
+    """Make span_id the span currently running.
+
+    :param span_id: Span id
+    :type span_id: str
+    :returns: Token to pass to _reset_current_span_id
+    :rtype: Any
+    """
+    if _CURRENT_SPAN is not None:
+        return _CURRENT_SPAN.set(span_id)
+    previous = current_span_id()
+    _LOCAL.span_id = span_id
+    return previous
+
+
+def _reset_current_span_id(token):
+    """Restore the span running before _set_current_span_id was called.
+
+    :param token: Token returned by _set_current_span_id
+    :type token: Any
+    """
+    if _CURRENT_SPAN is not None:
+        _CURRENT_SPAN.reset(token)
+    else:
+        _LOCAL.span_id = token
+
+
+def set_span_file(span_file):
+    """Set the file spans are written to.
+
+    The file is passed on to child processes through the environment.
+
+    :param span_file: Path to span file, unset to stop recording spans
+    :type span_file: Optional[str]
+    """
+    if span_file:
+        os.environ[SPAN_FILE_ENV] = os.path.abspath(span_file)
+    else:
+        os.environ.pop(SPAN_FILE_ENV, None)
+
+
+def get_span_file():
+    """Return the file spans are written to.
+
+    :returns: Path to span file, None if spans are not being recorded
+    :rtype: Optional[str]
+    """
+    return os.environ.get(SPAN_FILE_ENV) or None
+
+
+def write_span(span):
+    """Append a span to the span file.
+
+    :param span: Span to write
+    :type span: dict
+    """
+    span_file = get_span_file()
+    if not span_file:
+        return
+    with _WRITE_LOCK:
+        with open(span_file, 'a') as f:
+            f.write(json.dumps(span, sort_keys=True) + '\n')
+
+
+def read_spans(span_file):
+    """Read the spans from a span file.
+
+    Lines that are not valid JSON, such as a line cut short by a process
+    being killed, are skipped.
+
+    :param span_file: Path to span file
+    :type span_file: str
+    :returns: Spans
+    :rtype: [dict, dict, ...]
+    """
+    spans = []
+    with open(span_file) as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    return spans
+
+
+def _attribute(value):
+    """Return value in a form that can be recorded with a span.
+
+    :param value: Argument value
+    :type value: Any
+    :returns: Value to record, None if the value is not recorded
+    :rtype: Optional[Union[str, int, list]]
+    """
+    if isinstance(value, (str, int)) and not isinstance(value, bool):
+        return value
+    if isinstance(value, (list, tuple)) and all(
+            isinstance(v, str) for v in value):
+        return list(value)
+    return None
+
+
+def span_attributes(func, args, kwargs):
+    """Pick the arguments of a call to func to record with its span.
+
+    :param func: Function being called
+    :type func: Callable
+    :param args: Positional arguments
+    :type args: list
+    :param kwargs: Keyword arguments
+    :type kwargs: dict
+    :returns: Argument names and values
+    :rtype: dict
+    """
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+    except TypeError:
+        return {}
+    attributes = {}
+    for name in SPAN_ARGUMENTS:
+        value = _attribute(bound.arguments.get(name))
+        if value is not None:
+            attributes[name] = value
+    return attributes
+
+
+class Span(object):
+    """Context manager recording how long its body takes.
+
+    Start and end are monotonic times in seconds. The outcome is 'ok' or
+    'error', errors also record the exception type. A span can also be
+    started with open and ended with close when its body is not a block of
+    code.
+    """
+
+    def __init__(self, name, kind, **attributes):
+        """Create a Span.
+
+        :param name: Name of the span, e.g. the function being timed
+        :type name: str
+        :param kind: Kind of span, e.g. 'phase' or 'model'
+        :type kind: str
+        :param attributes: Values to record with the span
+        :type attributes: dict
+        """
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.id = '{}-{}'.format(os.getpid(), next(_SPAN_IDS))
+        self.parent = None
+        self.start = None
+        self._token = None
+
+    def open(self):
+        """Start the span.
+
+        :returns: The span
+        :rtype: Span
+        """
+        self.parent = current_span_id()
+        self._token = _set_current_span_id(self.id)
+        self.start = time.monotonic()
+        return self
+
+    def close(self, error=None):
+        """End the span and write it to the span file.
+
+        :param error: Name of the error the span ended with, if any
+        :type error: Optional[str]
+        """
+        end = time.monotonic()
+        _reset_current_span_id(self._token)
+        span = {
+            'id': self.id,
+            'parent': self.parent,
+            'name': self.name,
+            'kind': self.kind,
+            'start': self.start,
+            'end': end,
+            'duration': end - self.start,
+            'pid': os.getpid(),
+            'attributes': self.attributes,
+            'outcome': 'ok' if error is None else 'error'}
+        if error is not None:
+            span['error'] = error
+        write_span(span)
+
+    def __enter__(self):
+        """Start the span."""
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """End the span and write it to the span file."""
+        self.close(None if exc_type is None else exc_type.__name__)
+        return False
+
+
+def span(name, kind, **attributes):
+    """Return a context manager recording a span if spans are enabled.
+
+    :param name: Name of the span
+    :type name: str
+    :param kind: Kind of span, e.g. 'phase' or 'model'
+    :type kind: str
+    :param attributes: Values to record with the span
+    :type attributes: dict
+    :returns: Context manager
+    :rtype: Union[Span, _NoSpan]
+    """
+    if get_span_file():
+        return Span(name, kind, **attributes)
+    return _NoSpan()
+
+
+class _NoSpan(object):
+    """Context manager standing in for a Span when spans are disabled."""
+
+    def open(self):
+        return self
+
+    def close(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+def timed(kind):
+    """Record a span for each call of the decorated function.
+
+    Both plain functions and coroutine functions can be decorated.
+
+    :param kind: Kind of span, e.g. 'phase' or 'model'
+    :type kind: str
+    :returns: Decorator
+    :rtype: Callable
+    """
+    def _decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def _async_wrapper(*args, **kwargs):
+                if not get_span_file():
+                    return await func(*args, **kwargs)
+                with Span(func.__name__, kind,
+                          **span_attributes(func, args, kwargs)):
+                    return await func(*args, **kwargs)
+            return _async_wrapper
+
+        @functools.wraps(func)
+        def _wrapper(*args, **kwargs):
+            if not get_span_file():
+                return func(*args, **kwargs)
+            with Span(func.__name__, kind,
+                      **span_attributes(func, args, kwargs)):
+                return func(*args, **kwargs)
+        return _wrapper
+    return _decorator
@@ -0,0 +1,135 @@
+# Copyright 2018 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record the progress of a series upgrade so it can be resumed."""
+import json
+import logging
+import os
+import tempfile
+import threading
+
+# State file in the working directory, formatted with the model name and the
+# series being upgraded to
+SERIES_UPGRADE_STATE_FILE = '.zaza-series-upgrade-{}-{}.json'
+
+# Steps of the series upgrade of a machine, in the order they are run
+PREPARE = 'prepare'
+RELEASE_UPGRADE = 'release-upgrade'
+REBOOT = 'reboot'
+SET_ORIGIN = 'set-origin'
+COMPLETE = 'complete'
+SET_SERIES = 'set-series'
+STEPS = (PREPARE, RELEASE_UPGRADE, REBOOT, SET_ORIGIN, COMPLETE, SET_SERIES)
+
+
+class SeriesUpgradeState(object):
+    """Steps of a series upgrade done on each machine.
+
+    The state is written to a JSON file each time a step is done, so a
+    series upgrade which was interrupted can be run again and carry on from
+    the step it stopped at. Without a path the state is only kept in memory.
+    """
+
+    def __init__(self, path=None):
+        """Create a SeriesUpgradeState, loading the state file if it exists.
+
+        :param path: Path to state file
+        :type path: Optional[str]
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._machines = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._machines = json.load(f)['machines']
+            logging.info('Resuming series upgrade from {}'.format(path))
+
+    @classmethod
+    def for_model(cls, model_name, to_series):
+        """Create a SeriesUpgradeState kept in the working directory.
+
+        :param model_name: Name of model being upgraded
+        :type model_name: str
+        :param to_series: The series to which to upgrade
+        :type to_series: str
+        :returns: State of the series upgrade
+        :rtype: SeriesUpgradeState
+        """
+        return cls(SERIES_UPGRADE_STATE_FILE.format(model_name, to_series))
+
+    def steps_done(self, machine):
+        """Return the steps done on a machine.
+
+        :param machine: Machine number
+        :type machine: str
+        :returns: Steps done, in the order they were done
+        :rtype: [str, str, ...]
+        """
+        with self._lock:
+            return list(self._machines.get(machine, []))
+
+    def is_done(self, machine, step):
+        """Whether a step has been done on a machine.
+
+        :param machine: Machine number
+        :type machine: str
+        :param step: Step of the series upgrade, one of STEPS
+        :type step: str
+        :returns: Whether the step has been done
+        :rtype: bool
+        """
+        return step in self.steps_done(machine)
+
+    def is_complete(self, machine):
+        """Whether all the steps have been done on a machine.
+
+        :param machine: Machine number
+        :type machine: str
+        :returns: Whether the series upgrade of the machine is complete
+        :rtype: bool
+        """
+        return self.is_done(machine, STEPS[-1])
+
+    def mark_done(self, machine, step):
+        """Record that a step has been done on a machine.
+
+        :param machine: Machine number
+        :type machine: str
+        :param step: Step of the series upgrade, one of STEPS
+        :type step: str
+        :raises: ValueError if step is not one of STEPS
+        """
+        if step not in STEPS:
+            raise ValueError('Unknown series upgrade step {}'.format(step))
+        with self._lock:
+            steps = self._machines.setdefault(machine, [])
+            if step not in steps:
+                steps.append(step)
+            self._save()
+
+    def remove(self):
+        """Forget the state and remove the state file."""
+        with self._lock:
+            self._machines = {}
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _save(self):
+        if not self.path:
+            return
+        fd, tmp_file = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'machines': self._machines}, f)
+        os.replace(tmp_file, self.path)